@@ -0,0 +1,237 @@
+""" Benchmark de latence de chaque étape du pipeline. Usage : python -m benchmarks.pipeline_benchmark [options]
+
+Les tests de test/ sont fonctionnels et ont besoin des vraies ressources (.npy) et des poids des modèles. Ce script
+mesure la vitesse de chaque étape sur des données synthétiques, pour plusieurs tailles de collection et nombres de
+threads :
+
+    - Une arborescence de ressources synthétique est écrite dans un dossier temporaire (embeddings de dimension 960
+    pour MobileNetV3 et 512 pour CLIP, catégories, words.txt, table des URL), puis les modules de recherche sont
+    chargés dessus (variable d'environnement PIXMATCHER_RESSOURCES_DIR).
+    - Étapes mesurées : preprocess_image, FeatureExtractor.extract_features et extract_features_batch sur des JPEG
+    synthétiques, chaque fonction *_find_* (et les recherches par lots), ti_get_image_path et ti_find_top5_categories.
+    Les étapes qui ont besoin d'un modèle indisponible (poids non téléchargeables, module clip absent) sont ignorées,
+    avec leur raison dans le fichier de résultats.
+    - Les résultats (temps médian et 95e centile, en millisecondes) sont écrits dans un fichier JSON. Avec --baseline,
+    ils sont comparés à ceux d'une exécution précédente : le script se termine en erreur si une étape est plus lente
+    que la référence au-delà de la tolérance. """
+
+import argparse, contextlib, importlib, io, json, os, platform, sys, tempfile, time, faiss, numpy as np, torch
+from pathlib import Path
+from benchmarks.preprocessing_benchmark import make_synthetic_jpeg
+from src.image_preprocessing import preprocess_image
+
+# Tailles de collection (nombre d'images) mesurées par défaut
+COLLECTION_SIZES = [10000, 100000]
+
+# Dimensions des embeddings MobileNetV3 et CLIP
+MOBILENET_DIM, CLIP_DIM = 960, 512
+
+# Nombre de classes des collections synthétiques (comme Tiny ImageNet)
+NUM_CLASSES = 200
+
+# Taille (largeur, hauteur) des images synthétiques et nombre d'images par lot
+IMAGE_SIZE = (1600, 1200)
+BATCH_SIZE = 32
+
+# Nombre de voisins demandés aux fonctions de recherche
+K = 10
+
+# Tolérance par défaut de la comparaison : une étape 20 % plus lente que la référence est une régression
+TOLERANCE = 0.2
+
+
+def synthetic_embeddings(rng: np.random.Generator, size: int, dim: int, normalize: bool = False) -> np.ndarray:
+    """ Génère des embeddings aléatoires positifs (comme des sorties de ReLU), normalisés si demandé (CLIP). """
+
+    embeddings = np.abs(rng.standard_normal((size, dim), dtype=np.float32))
+    if normalize:
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def write_synthetic_ressources(root: Path, size: int, seed: int = 0):
+    """ Écrit une arborescence de ressources synthétique, au format attendu par similarity_search et
+    clip_similarity_search.
+    :param root: Dossier de destination (utilisé comme PIXMATCHER_RESSOURCES_DIR).
+    :param size: Nombre d'images de chaque collection. """
+
+    rng = np.random.default_rng(seed)
+    wnids = np.array([f"n{i:08d}" for i in range(NUM_CLASSES)])
+    categories = wnids[np.arange(size) % NUM_CLASSES]
+
+    tiny_imagenet = root / "tiny-imagenet"
+    (tiny_imagenet / "tiny-imagenet-200").mkdir(parents=True, exist_ok=True)
+    np.save(tiny_imagenet / "Tiny_ImageNet_MobilNetV3_Embeddings.npy", synthetic_embeddings(rng, size, MOBILENET_DIM))
+    np.save(tiny_imagenet / "Tiny_ImageNet_MobilNetV3_Categories.npy", categories)
+    np.save(tiny_imagenet / "Tiny_ImageNet_CLIP_Embeddings.npy", synthetic_embeddings(rng, size, CLIP_DIM, True))
+    np.save(tiny_imagenet / "Tiny_ImageNet_CLIP_Categories.npy", categories)
+    with open(tiny_imagenet / "tiny-imagenet-200" / "words.txt", "w") as f:
+        f.writelines(f"{wnid}\tclasse {i}\n" for i, wnid in enumerate(wnids))
+
+    open_images = root / "open-images"
+    open_images.mkdir(parents=True, exist_ok=True)
+    np.save(open_images / "mobilenet_embeddings.npy", synthetic_embeddings(rng, size, MOBILENET_DIM))
+    np.save(open_images / "clip_embeddings.npy", synthetic_embeddings(rng, size, CLIP_DIM, True))
+    with open(open_images / "image_urls.json", "w") as f:
+        json.dump({str(i): f"{i:016x}.jpg" for i in range(size)}, f)
+
+
+def load_module(name: str):
+    """ Charge (ou recharge, pour une nouvelle collection) un module de recherche sur PIXMATCHER_RESSOURCES_DIR. """
+
+    if name in sys.modules:
+        return importlib.reload(sys.modules[name])
+    return importlib.import_module(name)
+
+
+def time_stage(function, repeat: int) -> dict:
+    """ Mesure repeat appels à function, après un appel de chauffe.
+    :return: Temps médian et 95e centile, en millisecondes. """
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):  # ti_find_top_similar_images affiche les dimensions
+        function()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": float(np.median(timings)), "p95_ms": float(np.percentile(timings, 95))}
+
+
+def set_threads(threads: int):
+    """ Fixe le nombre de threads de calcul de PyTorch et de FAISS. """
+
+    torch.set_num_threads(threads)
+    faiss.omp_set_num_threads(threads)
+
+
+def model_stages(image_paths: list[str]) -> tuple[dict, dict]:
+    """ Prépare les étapes indépendantes de la taille de la collection (prétraitement et extraction).
+    :return: Tuple (étapes nom -> fonction, étapes ignorées nom -> raison). """
+
+    stages = {"preprocess_image": lambda: preprocess_image(image_paths[0])}
+    try:
+        from src.feature_extractor import FeatureExtractor
+        extractor = FeatureExtractor(device="cpu")
+    except Exception as e:  # Poids non téléchargeables, par exemple
+        reason = f"FeatureExtractor indisponible : {e}"
+        return stages, {"extract_features": reason, "extract_features_batch": reason}
+    stages["extract_features"] = lambda: extractor.extract_features(image_paths[0])
+    stages["extract_features_batch"] = lambda: extractor.extract_features_batch(image_paths, batch_size=BATCH_SIZE)
+    return stages, {}
+
+
+def search_stages(size: int, rng: np.random.Generator) -> tuple[dict, dict]:
+    """ Charge les modules de recherche sur la collection synthétique courante et prépare leurs étapes.
+    :return: Tuple (étapes nom -> fonction, étapes ignorées nom -> raison). """
+
+    search = load_module("src.similarity_search")
+    query = np.abs(rng.standard_normal(MOBILENET_DIM, dtype=np.float32))
+    queries = np.abs(rng.standard_normal((BATCH_SIZE, MOBILENET_DIM), dtype=np.float32))
+    row = int(rng.integers(size))
+    stages = {
+        "oi_find_top_similar_images": lambda: search.oi_find_top_similar_images(query, K),
+        "oi_find_top_similar_images_batch": lambda: search.oi_find_top_similar_images_batch(queries, K),
+        "ti_find_top_similar_images": lambda: search.ti_find_top_similar_images(query, K),
+        "ti_find_top_similar_images_batch": lambda: search.ti_find_top_similar_images_batch(queries, K),
+        "ti_find_top5_categories": lambda: search.ti_find_top5_categories(query),
+        "ti_get_image_path": lambda: search.ti_get_image_path(row),
+    }
+
+    clip_stages = ("oi_find_similar_images", "ti_find_similar_images")
+    try:
+        clip_search = load_module("src.clip_similarity_search")
+    except Exception as e:  # Module clip absent ou poids non téléchargeables
+        return stages, {name: f"CLIP indisponible : {e}" for name in clip_stages}
+    stages["oi_find_similar_images"] = lambda: clip_search.oi_find_similar_images("a photo of a cat", K)
+    stages["ti_find_similar_images"] = lambda: clip_search.ti_find_similar_images("a photo of a cat", K)
+    return stages, {}
+
+
+def run(sizes: list[int], threads: list[int], repeat: int) -> dict:
+    """ Mesure toutes les étapes pour chaque taille de collection et chaque nombre de threads.
+    :return: Résultats (métadonnées, mesures, étapes ignorées), au format du fichier JSON. """
+
+    results, skipped = [], {}
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_paths = []
+        for i in range(BATCH_SIZE):
+            image_paths.append(os.path.join(tmp_dir, f"synthetic_{i}.jpg"))
+            make_synthetic_jpeg(image_paths[-1], IMAGE_SIZE, seed=i)
+
+        stages, stage_skipped = model_stages(image_paths)
+        skipped.update(stage_skipped)
+        for thread_count in threads:
+            set_threads(thread_count)
+            for name, function in stages.items():
+                results.append({"stage": name, "size": None, "threads": thread_count, **time_stage(function, repeat)})
+                print(f"{name:>34} | {'-':>8} | {thread_count:>2} threads | {results[-1]['median_ms']:10.2f} ms")
+
+        for size in sizes:
+            root = Path(tmp_dir) / f"ressources_{size}"
+            write_synthetic_ressources(root, size)
+            os.environ["PIXMATCHER_RESSOURCES_DIR"] = str(root)
+            stages, stage_skipped = search_stages(size, rng)
+            skipped.update(stage_skipped)
+            for thread_count in threads:
+                set_threads(thread_count)
+                for name, function in stages.items():
+                    results.append({"stage": name, "size": size, "threads": thread_count,
+                                    **time_stage(function, repeat)})
+                    print(f"{name:>34} | {size:>8} | {thread_count:>2} threads | {results[-1]['median_ms']:10.2f} ms")
+
+    meta = {"python": platform.python_version(), "numpy": np.__version__, "torch": torch.__version__,
+            "faiss": faiss.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "repeat": repeat}
+    return {"meta": meta, "results": results, "skipped": skipped}
+
+
+def compare(report: dict, baseline: dict, tolerance: float = TOLERANCE) -> list[dict]:
+    """ Compare les temps médians d'une exécution à ceux d'une exécution de référence.
+    :param report: Résultats de l'exécution courante (voir run).
+    :param baseline: Résultats de référence, au même format.
+    :param tolerance: Ralentissement relatif toléré.
+    :return: Étapes plus lentes que la référence au-delà de la tolérance (mesure, référence, rapport). """
+
+    reference = {(r["stage"], r["size"], r["threads"]): r["median_ms"] for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        key = (result["stage"], result["size"], result["threads"])
+        if key not in reference:
+            continue
+        ratio = result["median_ms"] / max(reference[key], 1e-9)
+        status = "RÉGRESSION" if ratio > 1 + tolerance else "ok"
+        print(f"{key[0]:>34} | {key[1] or '-':>8} | {key[2]:>2} threads | {reference[key]:10.2f} -> "
+              f"{result['median_ms']:10.2f} ms | x{ratio:.2f} {status}")
+        if ratio > 1 + tolerance:
+            regressions.append({**result, "baseline_ms": reference[key], "ratio": ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de latence des étapes du pipeline (données synthétiques).")
+    parser.add_argument("--sizes", type=int, nargs="+", default=COLLECTION_SIZES, help="Tailles de collection")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count()], help="Nombres de threads")
+    parser.add_argument("--repeat", type=int, default=5, help="Nombre de mesures par configuration")
+    parser.add_argument("--output", default="pipeline_benchmark.json", help="Fichier JSON des résultats")
+    parser.add_argument("--baseline", default=None, help="Résultats de référence (JSON) à comparer")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Ralentissement relatif toléré")
+    args = parser.parse_args()
+
+    report = run(args.sizes, sorted(set(args.threads)), args.repeat)
+    for name, reason in report["skipped"].items():
+        print(f"Étape ignorée {name} : {reason}")
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} régression(s) au-delà de {args.tolerance:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+""" Benchmark du prétraitement d'image sur de grandes images JPEG. Usage : python -m benchmarks.preprocessing_benchmark
+
+Ce script génère des JPEG synthétiques de plusieurs mégapixels puis mesure le temps de décodage + redimensionnement :
+
+    - du pipeline historique (décodage complet, réduction LANCZOS à max_dim puis seconde réduction LANCZOS à 224x224),
+    - de preprocess_image en mode "quality" et en mode "speed" (décodage réduit via Image.draft, une seule passe). """
+
+import argparse, tempfile, time, os, numpy as np
+from PIL import Image
+from src.image_preprocessing import preprocess_image, PREPROCESSING_MODES
+
+# Tailles (largeur, hauteur) des images synthétiques : 2, 12 et 24 mégapixels
+IMAGE_SIZES = [(1600, 1200), (4000, 3000), (6000, 4000)]
+
+
+def legacy_preprocess(image_path: str, target_size: tuple[int, int] = (224, 224), max_dim: int = 1024) -> Image.Image:
+    """ Reproduit le pipeline de prétraitement précédent (décodage complet et double redimensionnement LANCZOS).
+    :param image_path: Chemin vers l'image.
+    :param target_size: Taille finale (largeur, hauteur).
+    :param max_dim: Taille maximale de la plus grande dimension avant redimensionnement final.
+    :return: L'image prétraitée. """
+
+    image = Image.open(image_path).convert('RGB')
+    width, height = image.size
+    if max(width, height) > max_dim:
+        scaling_factor = max_dim / max(width, height)
+        image = image.resize((int(width * scaling_factor), int(height * scaling_factor)), Image.LANCZOS)
+    return image.resize(target_size, Image.LANCZOS)
+
+
+def make_synthetic_jpeg(path: str, size: tuple[int, int], seed: int = 0):
+    """ Écrit un JPEG synthétique (dégradé bruité) de la taille demandée.
+    :param path: Chemin de sortie.
+    :param size: Taille (largeur, hauteur) de l'image. """
+
+    rng = np.random.default_rng(seed)
+    width, height = size
+    gradient = np.linspace(0, 255, width, dtype=np.float32)[None, :, None]
+    noise = rng.normal(0, 20, (height, width, 3)).astype(np.float32)
+    pixels = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).save(path, quality=90)
+
+
+def time_call(function, repeat: int) -> float:
+    """ Retourne le temps médian (en millisecondes) de repeat appels à function. """
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark décodage + redimensionnement de grandes images JPEG.")
+    parser.add_argument("--repeat", type=int, default=5, help="Nombre de mesures par configuration")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        print(f"{'Image':>12} | {'legacy (ms)':>12} | " + " | ".join(f"{m + ' (ms)':>12}" for m in PREPROCESSING_MODES))
+        for size in IMAGE_SIZES:
+            image_path = os.path.join(tmp_dir, f"synthetic_{size[0]}x{size[1]}.jpg")
+            make_synthetic_jpeg(image_path, size)
+
+            results = [time_call(lambda: legacy_preprocess(image_path), args.repeat)]
+            for mode in PREPROCESSING_MODES:
+                results.append(time_call(lambda: preprocess_image(image_path, to_tensor=False, mode=mode), args.repeat))
+            label = f"{size[0]}x{size[1]}"
+            print(f"{label:>12} | " + " | ".join(f"{r:12.1f}" for r in results))
+
+
+if __name__ == "__main__":
+    main()
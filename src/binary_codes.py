@@ -0,0 +1,275 @@
+""" Module de recherche par codes binaires. Usage : python -m src.binary_codes [options]
+
+Sur de très grandes collections, même un parcours de vecteurs quantifiés reste trop lent sur CPU. Ce module associe à
+chaque image un code binaire de quelques dizaines d'octets (32 pour 256 bits, contre 3,8 Ko pour un vecteur MobileNetV3
+et 2 Ko pour un vecteur CLIP) :
+
+    - Les vecteurs sont centrés puis projetés sur autant de directions que de bits, et chaque bit est le signe d'une
+    projection. Les directions sont soit aléatoires (méthode "sign", hachage par projections aléatoires), soit apprises
+    par ITQ (méthode "itq" : ACP, puis rotation qui minimise l'erreur de quantification, Gong et Lazebnik 2011).
+    - Les codes sont compactés (8 bits par octet) et recherchés par un index binaire FAISS (IndexBinaryFlat) : la
+    distance de Hamming se calcule par popcount, et toute la collection tient dans une mémoire réduite.
+    - Les candidats ainsi présélectionnés (RERANK fois plus que demandé) sont re-classés par la distance exacte,
+    calculée sur les vecteurs complets des seuls candidats : ceux-ci peuvent rester projetés en mémoire sur disque.
+
+Les codes sont appris au moment de l'indexation (src.index build et src.ingest, option --code-bits) ou après coup avec
+ce module, et enregistrés à côté de la collection avec leur projection. Les modules de recherche les utilisent dès que
+ce fichier existe ; après une mise à jour de la collection, seules les lignes modifiées et ajoutées sont encodées. """
+
+import argparse, logging, os, faiss, numpy as np
+from pathlib import Path
+
+# Nombre de bits par défaut des codes, et méthodes d'apprentissage des projections
+CODE_BITS = 256
+METHODS = ("itq", "sign")
+
+# Nombre d'itérations de l'apprentissage de la rotation ITQ
+ITQ_ITERATIONS = 50
+
+# Nombre maximal de vecteurs utilisés pour l'apprentissage des projections
+TRAIN_SIZE = 100000
+
+# Candidats re-classés par requête : RERANK fois le nombre de résultats demandés, et au moins MIN_CANDIDATES
+RERANK = 10
+MIN_CANDIDATES = 100
+
+# Nombre de lignes encodées à la fois (la collection peut être projetée en mémoire)
+ENCODE_CHUNK_ROWS = 8192
+
+# Distances exactes du re-classement
+METRICS = ("l2", "cosine")
+
+
+def train_projection(embeddings: np.ndarray, bits: int = CODE_BITS, method: str = "itq", deleted: np.ndarray = None,
+                     train_size: int = TRAIN_SIZE, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """ Apprend le centrage et les directions de projection des codes binaires.
+    :param embeddings: Embeddings de la collection (n, d), éventuellement projetés en mémoire.
+    :param bits: Nombre de bits des codes (multiple de 8, au plus d pour ITQ).
+    :param method: "itq" (directions apprises) ou "sign" (directions aléatoires).
+    :param deleted: Lignes supprimées, exclues de l'apprentissage (optionnel).
+    :param train_size: Nombre maximal de lignes d'apprentissage.
+    :param seed: Graine du tirage de l'échantillon et des directions aléatoires.
+    :return: Tuple (moyenne (d,), projection (d, bits)).
+    :raises ValueError: Si la méthode ou le nombre de bits est invalide. """
+
+    dim = embeddings.shape[1]
+    if method not in METHODS:
+        raise ValueError(f"Méthode inconnue : {method} (attendu : {', '.join(METHODS)})")
+    if bits <= 0 or bits % 8 or (method == "itq" and bits > dim):
+        raise ValueError(f"Nombre de bits invalide : {bits} (multiple de 8, au plus {dim} pour ITQ)")
+
+    rng = np.random.default_rng(seed)
+    rows = np.arange(len(embeddings)) if deleted is None else np.flatnonzero(~deleted[:len(embeddings)])
+    if len(rows) > train_size:
+        rows = np.sort(rng.choice(rows, train_size, replace=False))
+    sample = np.asarray(embeddings[rows], dtype=np.float32)
+    mean = sample.mean(axis=0)
+    sample -= mean
+
+    gaussian = rng.standard_normal((dim, bits)).astype(np.float32)
+    if method == "sign":  # Directions aléatoires, orthonormées lorsque c'est possible
+        return mean, np.linalg.qr(gaussian)[0] if bits <= dim else gaussian
+
+    # ITQ : ACP sur les bits composantes principales, puis rotation alternée avec la binarisation
+    _, eigenvectors = np.linalg.eigh(sample.T @ sample)
+    pca = eigenvectors[:, ::-1][:, :bits].astype(np.float32)
+    projected = sample @ pca
+    rotation = np.linalg.qr(gaussian[:bits])[0]
+    for _ in range(ITQ_ITERATIONS):
+        binary = np.where(projected @ rotation >= 0, 1.0, -1.0).astype(np.float32)
+        u, _, vt = np.linalg.svd(projected.T @ binary)  # Problème de Procrustes orthogonal
+        rotation = u @ vt
+    return mean, pca @ rotation
+
+
+def encode(vectors: np.ndarray, mean: np.ndarray, projection: np.ndarray) -> np.ndarray:
+    """ Encode des vecteurs en codes binaires compactés.
+    :return: Matrice uint8 (n, bits / 8). """
+
+    projected = (np.asarray(vectors, dtype=np.float32) - mean) @ projection
+    return np.packbits(projected >= 0, axis=1)
+
+
+def encode_collection(embeddings: np.ndarray, mean: np.ndarray, projection: np.ndarray) -> np.ndarray:
+    """ Encode toute une collection, par blocs (un seul bloc de vecteurs en mémoire à la fois). """
+
+    codes = np.empty((len(embeddings), projection.shape[1] // 8), dtype=np.uint8)
+    for start in range(0, len(embeddings), ENCODE_CHUNK_ROWS):
+        codes[start:start + ENCODE_CHUNK_ROWS] = encode(embeddings[start:start + ENCODE_CHUNK_ROWS], mean, projection)
+    return codes
+
+
+def save_codes(path: Path, codes: np.ndarray, mean: np.ndarray, projection: np.ndarray, method: str):
+    """ Enregistre les codes d'une collection et leur projection (fichier temporaire puis renommage). """
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, codes=codes, mean=mean, projection=projection, method=np.array(method))
+    os.replace(tmp_path, path)
+
+
+def fit_collection(embeddings_path: Path, codes_file: Path, bits: int = CODE_BITS, method: str = "itq",
+                   deleted_path: Path = None, train_size: int = TRAIN_SIZE) -> Path:
+    """ Apprend la projection d'une collection, encode toutes ses lignes et enregistre les codes.
+    :param embeddings_path: Fichier des embeddings (lu par projection en mémoire).
+    :param codes_file: Fichier des codes produit.
+    :param bits: Nombre de bits des codes.
+    :param method: Méthode d'apprentissage des projections, parmi METHODS.
+    :param deleted_path: Fichier des lignes supprimées (optionnel, ignoré s'il n'existe pas).
+    :param train_size: Nombre maximal de lignes d'apprentissage.
+    :return: Chemin des codes. """
+
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    deleted = np.load(deleted_path) if deleted_path is not None and Path(deleted_path).exists() else None
+    mean, projection = train_projection(embeddings, bits, method, deleted, train_size)
+    save_codes(codes_file, encode_collection(embeddings, mean, projection), mean, projection, method)
+    logging.info(f"Codes binaires ({bits} bits, {method}) de {len(embeddings)} images écrits dans {codes_file}.")
+    return Path(codes_file)
+
+
+def refresh_codes(codes_file: Path, embeddings_path: Path) -> Path | None:
+    """ Ré-encode une collection modifiée avec la projection déjà apprise, si elle a des codes.
+    :return: Chemin des codes, ou None si la collection n'en a pas. """
+
+    if not Path(codes_file).exists():
+        return None
+    with np.load(codes_file) as stored:
+        mean, projection, method = stored["mean"], stored["projection"], str(stored["method"])
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    save_codes(codes_file, encode_collection(embeddings, mean, projection), mean, projection, method)
+    return Path(codes_file)
+
+
+def update_codes(codes_file: Path, embeddings_path: Path, rows) -> Path | None:
+    """ Encode, avec la projection déjà apprise, les seules lignes modifiées et ajoutées d'une collection mise à jour
+    (voir src.index update), si elle a des codes : les autres lignes ne sont pas relues.
+    :param rows: Numéros des lignes modifiées ; les lignes au-delà des codes existants (ajoutées) sont aussi encodées.
+    :return: Chemin des codes, ou None si la collection n'en a pas. """
+
+    if not Path(codes_file).exists():
+        return None
+    with np.load(codes_file) as stored:
+        codes, mean, projection, method = stored["codes"], stored["mean"], stored["projection"], str(stored["method"])
+    embeddings = np.load(embeddings_path, mmap_mode="r")
+    codes = codes[:len(embeddings)]
+    rows = np.sort(np.asarray(list(rows), dtype=np.int64))
+    rows = rows[rows < len(codes)]
+    if len(rows):
+        codes[rows] = encode_collection(embeddings[rows], mean, projection)
+    codes = np.concatenate([codes, encode_collection(embeddings[len(codes):], mean, projection)])
+    save_codes(codes_file, codes, mean, projection, method)
+    return Path(codes_file)
+
+
+class BinaryIndex:
+    """ Index de codes binaires : présélection par distance de Hamming, puis re-classement par la distance exacte.
+    Sa méthode search suit la convention des index FAISS (distances et numéros de ligne, complétés par -1). """
+
+    def __init__(self, codes: np.ndarray, mean: np.ndarray, projection: np.ndarray, vectors: np.ndarray,
+                 metric: str = "l2", rows: np.ndarray = None, rerank: int = RERANK):
+        """ :param codes: Codes compactés des lignes recherchées (m, bits / 8).
+        :param mean: Centrage des vecteurs (d,).
+        :param projection: Directions de projection (d, bits).
+        :param vectors: Embeddings complets de la collection (n, d), lus seulement pour les candidats.
+        :param metric: Distance du re-classement : "l2" (carré de la distance euclidienne, comme IndexFlatL2) ou
+        "cosine" (1 - similarité cosinus).
+        :param rows: Numéro de ligne de chaque code (par défaut, les codes couvrent toutes les lignes dans l'ordre).
+        :param rerank: Facteur de présélection (voir RERANK). """
+
+        if metric not in METRICS:
+            raise ValueError(f"Distance inconnue : {metric} (attendu : {', '.join(METRICS)})")
+        self.mean, self.projection, self.vectors, self.metric, self.rerank = mean, projection, vectors, metric, rerank
+        self.rows = np.arange(len(codes)) if rows is None else np.asarray(rows, dtype=np.int64)
+        self.index = faiss.IndexBinaryFlat(projection.shape[1])
+        self.index.add(np.ascontiguousarray(codes))
+
+    @property
+    def d(self) -> int:
+        return self.projection.shape[0]
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def code_size(self) -> int:
+        return self.index.code_size
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """ Recherche les k plus proches voisins de chaque requête.
+        :param queries: Matrice (n, d) des requêtes.
+        :param k: Nombre de résultats par requête.
+        :return: Tuple (distances (n, k), numéros de ligne (n, k)), triés par distance croissante. """
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.d)
+        num_candidates = min(max(k * self.rerank, MIN_CANDIDATES), self.ntotal)
+        _, candidates = self.index.search(encode(queries, self.mean, self.projection), num_candidates)
+
+        distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = np.sort(self.rows[candidates[i][candidates[i] >= 0]])  # Lectures dans l'ordre du fichier
+            vectors = np.asarray(self.vectors[rows], dtype=np.float32)
+            if self.metric == "l2":
+                exact = ((vectors - query) ** 2).sum(axis=1)
+            else:
+                norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+                exact = 1 - vectors @ query / np.maximum(norms, 1e-12)
+            best = np.argsort(exact, kind="stable")[:k]
+            distances[i, :len(best)], indices[i, :len(best)] = exact[best], rows[best]
+        return distances, indices
+
+
+def load_index(codes_file: Path, vectors: np.ndarray, metric: str = "l2", deleted: np.ndarray = None,
+               rerank: int = RERANK) -> BinaryIndex | None:
+    """ Charge l'index binaire d'une collection, si elle a des codes.
+    :param codes_file: Fichier des codes (voir fit_collection).
+    :param vectors: Embeddings complets de la collection (voir BinaryIndex).
+    :param metric: Distance du re-classement.
+    :param deleted: Lignes supprimées, exclues de la recherche (optionnel).
+    :param rerank: Facteur de présélection.
+    :return: Index, ou None si la collection n'a pas de codes.
+    :raises ValueError: Si les codes n'ont pas été appris sur des vecteurs de cette dimension. """
+
+    if not Path(codes_file).exists():
+        return None
+    with np.load(codes_file) as stored:
+        codes, mean, projection = stored["codes"], stored["mean"], stored["projection"]
+    if projection.shape[0] != vectors.shape[1]:
+        raise ValueError(f"Codes {codes_file} appris en dimension {projection.shape[0]}, embeddings de dimension "
+                         f"{vectors.shape[1]} : relancer python -m src.binary_codes")
+    if len(codes) < len(vectors):  # Lignes ajoutées depuis l'encodage (mise à jour interrompue) : encodées ici
+        logging.warning(f"{len(vectors) - len(codes)} lignes sans code dans {codes_file} : encodées au chargement.")
+        codes = np.concatenate([codes, encode_collection(vectors[len(codes):], mean, projection)])
+    codes = codes[:len(vectors)]
+    rows = None if deleted is None else np.flatnonzero(~deleted[:len(vectors)])
+    return BinaryIndex(codes if rows is None else codes[rows], mean, projection, vectors, metric, rows, rerank)
+
+
+def main():
+    from src.projection import COLLECTIONS, collection_files  # Import différé : src.index importe ce module
+
+    parser = argparse.ArgumentParser(description="Codes binaires des collections (présélection par distance de "
+                                                 "Hamming, puis re-classement exact).")
+    parser.add_argument("--collection", nargs="+", choices=COLLECTIONS, default=list(COLLECTIONS),
+                        help="Collection(s) encodée(s)")
+    parser.add_argument("--bits", type=int, default=CODE_BITS, help="Nombre de bits des codes (multiple de 8)")
+    parser.add_argument("--method", choices=METHODS, default="itq", help="Apprentissage des projections")
+    parser.add_argument("--train-size", type=int, default=TRAIN_SIZE, help="Nombre maximal de lignes d'apprentissage")
+    parser.add_argument("--remove", action="store_true", help="Supprime les codes (recherche exacte)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    for name in args.collection:
+        files = collection_files(name)
+        if args.remove:
+            files["codes"].unlink(missing_ok=True)
+            continue
+        if files["embeddings"].exists():
+            print(fit_collection(files["embeddings"], files["codes"], args.bits, args.method, files["deleted"],
+                                 args.train_size))
+
+
+if __name__ == "__main__":
+    main()
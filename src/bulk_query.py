@@ -0,0 +1,212 @@
+""" Module de recherche en masse. Usage : python -m src.bulk_query --archive <images.zip|.tar> --output <résultats.csv>
+
+Pour les audits, les plus proches voisins de milliers d'images sont nécessaires. Plutôt que de les soumettre une à une
+à la page de recherche, ce module traite une archive d'images (zip ou tar, éventuellement compressée) au débit de
+l'indexation hors ligne :
+
+    - Les membres de l'archive sont lus au fil de l'eau, dans l'ordre de l'archive, et décodés dans un pool de
+    processus (le décodage JPEG et le redimensionnement occupent le processeur), avec un nombre borné d'images en vol.
+    - Les images décodées sont regroupées en lots : une passe du modèle et une recherche FAISS par lot.
+    - Les résultats sont ajoutés à un fichier CSV (requête, rang, identifiant, distance, chemin). Après chaque lot, un
+    fichier de progression (<sortie>.progress.json) enregistre le nombre d'images traitées et la taille du CSV : une
+    exécution interrompue reprend après le dernier lot terminé, sans doublons.
+
+La même fonction est utilisée par la page de recherche CBIR, qui accepte le téléversement d'une archive. """
+
+import argparse, csv, json, logging, multiprocessing, os, tarfile, zipfile, numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from tqdm import tqdm
+from src.cache import atomic_write_bytes
+from src.image_preprocessing import ALLOWED_EXTENSIONS, preprocess_image
+from src.index import make_encoder
+
+# Colonnes du fichier de résultats
+COLUMNS = ("query", "rank", "id", "distance", "path")
+
+# Datasets interrogeables : fonctions de recherche par lots et de chemin des images de similarity_search
+DATASETS = {
+    "open-images": ("oi_find_top_similar_images_batch", "oi_get_image_path"),
+    "tiny-imagenet": ("ti_find_top_similar_images_batch", "ti_get_image_path"),
+}
+
+
+def iter_archive(archive_path: str | os.PathLike):
+    """ Parcourt les images d'une archive, dans l'ordre de l'archive, sans l'extraire sur disque.
+    :param archive_path: Archive zip ou tar (éventuellement compressée : .tar.gz, .tgz...).
+    :return: Générateur de tuples (nom du membre, octets bruts).
+    :raises ValueError: Si le fichier n'est ni une archive zip, ni une archive tar. """
+
+    def is_image(name: str) -> bool:
+        return os.path.splitext(name)[1].lower() in ALLOWED_EXTENSIONS and not name.startswith("__MACOSX/")
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_image(info.filename):
+                    yield info.filename, archive.read(info)
+    elif tarfile.is_tarfile(archive_path):
+        with tarfile.open(archive_path, mode="r|*") as archive:  # Lecture en flux, y compris pour les tar compressés
+            for member in archive:
+                if member.isfile() and is_image(member.name):
+                    yield member.name, archive.extractfile(member).read()
+    else:
+        raise ValueError(f"Archive non supportée (zip ou tar attendu) : {archive_path}")
+
+
+def decode_query(name: str, data: bytes, target_size: tuple[int, int]):
+    """ Décode une image requête à la taille d'entrée du modèle (exécutée dans un processus du pool).
+    :return: Tuple (nom, pixels uint8 (H, W, 3) ou None, message d'erreur ou None). """
+
+    try:
+        return name, np.asarray(preprocess_image(data, target_size=target_size, to_tensor=False)), None
+    except Exception as e:  # Transmis sous forme de texte : toutes les exceptions ne sont pas sérialisables
+        return name, None, str(e)
+
+
+def decode_stream(members, target_size: tuple[int, int], workers: int, max_in_flight: int = None):
+    """ Décode les images dans un pool de processus, en conservant l'ordre de l'archive et en bornant le nombre
+    d'images en vol.
+    :param members: Itérable de tuples (nom, octets bruts).
+    :param target_size: Taille d'entrée du modèle.
+    :param workers: Nombre de processus (0 : décodage dans le processus courant).
+    :param max_in_flight: Nombre maximal d'images en vol (par défaut 4 fois le nombre de processus).
+    :return: Générateur de tuples (nom, pixels ou None, message d'erreur ou None). """
+
+    if workers == 0:
+        for name, data in members:
+            yield decode_query(name, data, target_size)
+        return
+
+    # spawn : le processus appelant (Streamlit, PyTorch) peut avoir des threads, que fork ne duplique pas proprement
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        pending, remaining = deque(), iter(members)
+        for name, data in remaining:
+            pending.append(pool.submit(decode_query, name, data, target_size))
+            if len(pending) >= (max_in_flight or 4 * workers):
+                break
+        while pending:
+            result = pending.popleft().result()
+            for name, data in remaining:  # Remplace l'image consommée par la suivante
+                pending.append(pool.submit(decode_query, name, data, target_size))
+                break
+            yield result
+
+
+def load_progress(progress_path: Path, params: dict, restart: bool = False) -> dict | None:
+    """ Charge la progression d'une exécution précédente, si elle porte sur les mêmes paramètres.
+    :return: Progression (paramètres, images traitées, images en erreur, taille du CSV), ou None. """
+
+    if restart or not progress_path.exists():
+        return None
+    with open(progress_path) as f:
+        progress = json.load(f)
+    if progress.get("params") != params:
+        logging.warning("Paramètres différents de l'exécution précédente : la recherche repart de zéro.")
+        return None
+    return progress
+
+
+def bulk_query(archive_path: str | os.PathLike, output_path: str | os.PathLike, dataset: str = "tiny-imagenet",
+               k: int = 10, batch_size: int = 32, workers: int = 4, restart: bool = False, device: str = None,
+               encoder=None, search=None, get_path=None, progress=None) -> dict:
+    """ Recherche les plus proches voisins de chaque image d'une archive et écrit les résultats dans un CSV.
+    :param archive_path: Archive zip ou tar des images requêtes.
+    :param output_path: Fichier CSV de sortie.
+    :param dataset: Dataset interrogé, parmi les clés de DATASETS.
+    :param k: Nombre de voisins par image.
+    :param batch_size: Nombre d'images par passe du modèle et par recherche.
+    :param workers: Nombre de processus de décodage.
+    :param restart: Si True, ignore la progression d'une exécution précédente.
+    :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
+    :param encoder: Encodeur déjà construit (put, encode, input_size ; par défaut MobileNetV3, voir make_encoder).
+    :param search: Fonction (vecteurs, k) -> voisins (identifiant, distance) de chaque vecteur (par défaut, celle de
+    similarity_search pour le dataset).
+    :param get_path: Fonction identifiant -> chemin ou URL de l'image (par défaut, celle de similarity_search).
+    :param progress: Fonction appelée avec le nombre d'images traitées après chaque lot (optionnel).
+    :return: Compteurs : images traitées (queries), en erreur (failed), reprises d'une exécution précédente (resumed).
+    :raises ValueError: Si le dataset est inconnu. """
+
+    if dataset not in DATASETS:
+        raise ValueError(f"Dataset inconnu : {dataset} (attendu : {', '.join(DATASETS)})")
+    if search is None or get_path is None:
+        from src import similarity_search  # Charge les embeddings : uniquement si la recherche n'est pas fournie
+        search = search or getattr(similarity_search, DATASETS[dataset][0])
+        get_path = get_path or getattr(similarity_search, DATASETS[dataset][1])
+    encoder = encoder or make_encoder("mobilenet", batch_size, device)
+
+    output_path = Path(output_path)
+    progress_path = output_path.with_name(output_path.name + ".progress.json")
+    archive_stat = os.stat(archive_path)
+    params = {"archive": os.path.basename(archive_path), "archive_size": archive_stat.st_size, "dataset": dataset,
+              "k": k}
+    state = load_progress(progress_path, params, restart) or {"params": params, "done": 0, "failed": 0, "offset": None}
+    resumed = state["done"]
+
+    members = iter_archive(archive_path)
+    for _ in range(resumed):  # Images déjà traitées : lues mais pas décodées
+        next(members, None)
+
+    with open(output_path, "r+" if state["offset"] is not None else "w", newline="") as f:
+        if state["offset"] is not None:
+            f.truncate(state["offset"])  # Supprime les lignes d'un lot interrompu
+            f.seek(state["offset"])
+        writer = csv.writer(f)
+        if state["offset"] is None:
+            writer.writerow(COLUMNS)
+
+        def flush(names, count):
+            """ Encode et recherche un lot, puis enregistre ses résultats et la progression. """
+            if count:
+                neighbours = search(encoder.encode(count), k)
+                writer.writerows((name, rank, int(idx), float(distance), get_path(idx))
+                                 for name, results in zip(names, neighbours)
+                                 for rank, (idx, distance) in enumerate(results))
+            f.flush()
+            os.fsync(f.fileno())
+            state["offset"] = f.tell()
+            atomic_write_bytes(progress_path, json.dumps(state).encode())  # Après les résultats du lot
+            if progress is not None:
+                progress(state["done"])
+
+        names, batch_done = [], 0
+        for name, pixels, error in tqdm(decode_stream(members, encoder.input_size, workers), desc="Requêtes",
+                                        unit="image", initial=resumed):
+            if error is not None:
+                logging.warning(f"Image ignorée {name}: {error}")
+                state["failed"] += 1
+            else:
+                encoder.put(len(names), pixels)
+                names.append(name)
+            batch_done += 1
+            if len(names) == batch_size:
+                state["done"] += batch_done
+                flush(names, len(names))
+                names, batch_done = [], 0
+        state["done"] += batch_done
+        flush(names, len(names))
+
+    return {"queries": state["done"] - state["failed"], "failed": state["failed"], "resumed": resumed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recherche en masse des plus proches voisins d'une archive d'images.")
+    parser.add_argument("--archive", required=True, help="Archive zip ou tar des images requêtes")
+    parser.add_argument("--output", required=True, help="Fichier CSV des résultats")
+    parser.add_argument("--dataset", choices=DATASETS, default="tiny-imagenet", help="Dataset interrogé")
+    parser.add_argument("-k", type=int, default=10, help="Nombre de voisins par image")
+    parser.add_argument("--batch-size", type=int, default=32, help="Nombre d'images par passe du modèle")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processus de décodage")
+    parser.add_argument("--restart", action="store_true", help="Ignorer la progression d'une exécution précédente")
+    parser.add_argument("--device", default=None, help="'cuda' ou 'cpu' (déduit automatiquement par défaut)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    counts = bulk_query(args.archive, args.output, dataset=args.dataset, k=args.k, batch_size=args.batch_size,
+                        workers=args.workers, restart=args.restart, device=args.device)
+    print(", ".join(f"{name} : {count}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
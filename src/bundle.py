@@ -0,0 +1,335 @@
+""" Module de démarrage à froid des processus de service. Usage : python -m src.bundle build|check [options]
+
+Au démarrage, un processus de service importe torchvision, construit mobilenet_v3_large et charge ses poids, charge CLIP
+(clip.load, qui peut télécharger le checkpoint), lit tous les fichiers .npy et reconstruit les index FAISS. Ce module
+prépare une fois pour toutes un « bundle » : un dossier versionné qui contient tout ce qu'il faut pour servir, sans
+accès au réseau :
+
+    - models/ : le réseau d'extraction de MobileNetV3 (déjà tronqué) et l'encodeur de texte de CLIP, exportés en
+    TorchScript. Leur chargement ne construit aucun modèle et ne passe pas par l'API des poids de torchvision.
+    - ressources/ : les fichiers des collections (embeddings, catégories, tables), dans la disposition de ressources/,
+    et les index FAISS déjà construits (faiss.write_index), lus par similarity_search au lieu d'être reconstruits.
+    - manifest.json : format, version, versions de torch et de faiss, taille et empreinte SHA-256 de chaque fichier.
+
+Le bundle est écrit dans un dossier temporaire puis renommé : un bundle incomplet n'est jamais visible. Le fichier
+LATEST du dossier des bundles désigne la dernière version construite.
+
+load_bundle (et python -m src.service --bundle) crée les backends du service à partir du bundle seul, puis exécute une
+requête de préchauffage par dataset : les initialisations paresseuses (threads, allocations, choix des noyaux) ont lieu
+avant la première vraie requête. """
+
+import argparse, hashlib, importlib, io, json, logging, os, shutil, sys, time, faiss, numpy as np, torch
+from datetime import datetime
+from pathlib import Path
+from PIL import Image
+from src.service import ImageSearchBackend, TextSearchBackend
+
+# Version de la disposition des fichiers d'un bundle
+BUNDLE_FORMAT = 1
+
+# Dossier des bundles, nom du manifeste et du fichier qui désigne la dernière version
+BUNDLE_DIR = Path(os.environ.get("PIXMATCHER_BUNDLE_DIR", "bundles"))
+MANIFEST_FILE = "manifest.json"
+LATEST_FILE = "LATEST"
+
+# Fichiers des collections copiés dans le bundle (relatifs au dossier des ressources), lorsqu'ils existent
+COLLECTION_FILES = [
+    "open-images/image_urls.json",
+    "open-images/mobilenet_embeddings.npy",
+    "open-images/clip_embeddings.npy",
+    *(f"tiny-imagenet/Tiny_ImageNet_{model}_{name}.npy" for model in ("MobilNetV3", "CLIP")
+      for name in ("Embeddings", "Categories", "Paths", "Deleted", "Thumbnails")),
+    "tiny-imagenet/tiny-imagenet-200/words.txt",
+    "open-images/mobilenet_codes.npz",
+    "open-images/clip_codes.npz",
+    "tiny-imagenet/Tiny_ImageNet_MobilNetV3_Codes.npz",
+    "tiny-imagenet/Tiny_ImageNet_CLIP_Codes.npz",
+]
+
+# Dossier des images de Tiny ImageNet : trop volumineux pour être copié, il est lié symboliquement
+IMAGES_DIR = "tiny-imagenet/tiny-imagenet-200/train"
+
+# Requête textuelle de préchauffage, et nombre de résultats demandés
+WARMUP_TEXT = "a photo"
+WARMUP_K = 10
+
+
+class TextEncoder(torch.nn.Module):
+    """ Encodeur de texte de CLIP : seule partie du modèle utilisée par la recherche TBIR. """
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, tokens: torch.Tensor) -> torch.Tensor:
+        return self.model.encode_text(tokens)
+
+
+def file_digest(path: Path) -> str:
+    """ Calcule l'empreinte SHA-256 d'un fichier, par blocs. """
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def export_backbone(module: torch.nn.Module, path: Path, target_size: tuple[int, int], feature_dim: int) -> Path:
+    """ Exporte un réseau d'extraction de caractéristiques en TorchScript, lisible par FeatureExtractor(backbone=...).
+    :param module: Réseau (image normalisée -> vecteur), par exemple FeatureExtractor.feature_extractor.
+    :param path: Fichier de destination.
+    :param target_size: Dimension des images d'entrée (largeur, hauteur).
+    :param feature_dim: Dimension des vecteurs produits, enregistrée avec le réseau.
+    :return: Chemin du fichier écrit. """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    example = torch.zeros(1, 3, target_size[1], target_size[0])
+    with torch.no_grad():
+        traced = torch.jit.trace(module.eval().cpu(), example)
+    torch.jit.save(traced, str(path), _extra_files={"feature_dim": str(feature_dim)})
+    return path
+
+
+def export_text_encoder(path: Path, clip_model: str = "ViT-B/32") -> Path:
+    """ Exporte l'encodeur de texte de CLIP en TorchScript, lu par clip_similarity_search
+    (PIXMATCHER_CLIP_TEXT_ENCODER).
+    :param path: Fichier de destination.
+    :param clip_model: Nom du modèle CLIP ou chemin vers un point de contrôle local.
+    :return: Chemin du fichier écrit.
+    :raises ImportError: Si le paquet clip n'est pas installé. """
+
+    import clip
+    model, _ = clip.load(clip_model, device="cpu")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        traced = torch.jit.trace(TextEncoder(model).eval(), clip.tokenize([WARMUP_TEXT, "a photo of a cat"]))
+    torch.jit.save(traced, str(path))
+    return path
+
+
+def copy_collection(source: Path, destination: Path) -> list[str]:
+    """ Copie les fichiers des collections dans le bundle, et lie le dossier des images. Jamais de liens physiques :
+    une mise à jour de l'index (src.index update) modifie les fichiers des ressources sur place, ce qui changerait les
+    embeddings du bundle sans ses index préconstruits.
+    :param source: Dossier des ressources.
+    :param destination: Dossier ressources/ du bundle.
+    :return: Fichiers copiés, relatifs à destination. """
+
+    copied = []
+    for name in COLLECTION_FILES:
+        if not (source / name).exists():
+            continue
+        (destination / name).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source / name, destination / name)
+        copied.append(name)
+    if (source / IMAGES_DIR).is_dir():
+        (destination / IMAGES_DIR).parent.mkdir(parents=True, exist_ok=True)
+        (destination / IMAGES_DIR).symlink_to((source / IMAGES_DIR).resolve(), target_is_directory=True)
+    return copied
+
+
+def export_indexes(search_module, destination: Path) -> list[str]:
+    """ Écrit les index FAISS construits par similarity_search, aux emplacements où il les relit (les index de codes
+    binaires sont reconstruits à partir des codes, copiés avec la collection).
+    :param search_module: Module similarity_search, chargé sur les ressources copiées.
+    :param destination: Dossier ressources/ du bundle.
+    :return: Fichiers écrits, relatifs à destination. """
+
+    written = []
+    for index, file in ((search_module.oi_index, search_module.OI_INDEX_FILE),
+                        (search_module.ti_index, search_module.TI_INDEX_FILE)):
+        if not isinstance(index, faiss.Index):
+            continue
+        name = file.relative_to(search_module.RESSOURCES_PATH).as_posix()
+        (destination / name).parent.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(index, str(destination / name))
+        written.append(name)
+    return written
+
+
+def write_manifest(path: Path, manifest: dict, files: list[str]) -> dict:
+    """ Complète le manifeste avec la taille et l'empreinte de chaque fichier, puis l'écrit dans le bundle.
+    :param path: Dossier du bundle.
+    :param manifest: Description du bundle (format, version, modèles...).
+    :param files: Fichiers du bundle, relatifs à path.
+    :return: Manifeste écrit. """
+
+    manifest["files"] = {name: {"size": (path / name).stat().st_size, "sha256": file_digest(path / name)}
+                         for name in files}
+    with open(path / MANIFEST_FILE, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def resolve_bundle(path: Path) -> Path:
+    """ Retourne le dossier d'un bundle : path lui-même, ou la version désignée par path/LATEST.
+    :raises ValueError: Si path n'est ni un bundle ni un dossier de bundles. """
+
+    path = Path(path)
+    if (path / MANIFEST_FILE).exists():
+        return path
+    if (path / LATEST_FILE).exists():
+        return path / (path / LATEST_FILE).read_text().strip()
+    raise ValueError(f"Aucun bundle dans {path}")
+
+
+def verify_bundle(path: Path, checksums: bool = False) -> dict:
+    """ Vérifie qu'un bundle est complet : format connu, fichiers présents et de la taille attendue.
+    :param path: Dossier du bundle.
+    :param checksums: Vérifie aussi les empreintes SHA-256 (lecture complète des fichiers).
+    :return: Manifeste du bundle.
+    :raises ValueError: Si le format est inconnu, ou si un fichier est absent, tronqué ou modifié. """
+
+    with open(path / MANIFEST_FILE) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Format de bundle non supporté : {manifest.get('format')} (attendu : {BUNDLE_FORMAT})")
+    for name, description in manifest["files"].items():
+        file = path / name
+        if not file.exists():
+            raise ValueError(f"Fichier absent du bundle : {name}")
+        if file.stat().st_size != description["size"]:
+            raise ValueError(f"Taille inattendue pour {name} : {file.stat().st_size} octets "
+                             f"(attendu : {description['size']})")
+        if checksums and file_digest(file) != description["sha256"]:
+            raise ValueError(f"Empreinte inattendue pour {name}")
+    return manifest
+
+
+def build_bundle(output: Path = BUNDLE_DIR, version: str = None, models: tuple = ("mobilenet", "clip"),
+                 clip_model: str = "ViT-B/32") -> Path:
+    """ Construit un bundle à partir des modèles et des ressources courants.
+    :param output: Dossier des bundles.
+    :param version: Nom de la version (par défaut, date et heure de construction).
+    :param models: Modèles exportés ("mobilenet" pour la recherche CBIR, "clip" pour la recherche TBIR). L'export de
+    CLIP est ignoré, avec un avertissement, si le paquet clip n'est pas installé.
+    :param clip_model: Nom du modèle CLIP ou chemin vers un point de contrôle local.
+    :return: Dossier du bundle.
+    :raises FileExistsError: Si cette version existe déjà. """
+
+    output = Path(output)
+    version = version or f"{datetime.now():%Y%m%d-%H%M%S}"
+    path = output / version
+    if path.exists():
+        raise FileExistsError(f"Le bundle {path} existe déjà")
+    staging = output / f".{version}.tmp"  # Renommé en fin de construction
+    shutil.rmtree(staging, ignore_errors=True)
+
+    manifest = {"format": BUNDLE_FORMAT, "version": version, "created": datetime.now().isoformat(timespec="seconds"),
+                "torch": torch.__version__, "faiss": faiss.__version__, "models": {}}
+    if "mobilenet" in models:
+        from src.feature_extractor import FeatureExtractor
+        extractor = FeatureExtractor(device="cpu")
+        export_backbone(extractor.feature_extractor, staging / "models" / "mobilenet.pt", extractor.target_size,
+                        extractor.feature_dim)
+        manifest["models"]["mobilenet"] = "models/mobilenet.pt"
+    if "clip" in models:
+        try:
+            export_text_encoder(staging / "models" / "clip_text.pt", clip_model)
+            manifest["models"]["clip_text"] = "models/clip_text.pt"
+        except ImportError:
+            logging.warning("Module clip non installé : le bundle ne permettra pas la recherche textuelle.")
+
+    from src import similarity_search
+    copied = copy_collection(similarity_search.RESSOURCES_PATH, staging / "ressources")
+    copied += export_indexes(similarity_search, staging / "ressources")
+    files = [f"ressources/{name}" for name in copied]
+    write_manifest(staging, manifest, list(manifest["models"].values()) + files)
+
+    os.replace(staging, path)
+    (output / f".{LATEST_FILE}.tmp").write_text(version)
+    os.replace(output / f".{LATEST_FILE}.tmp", output / LATEST_FILE)
+    logging.info(f"Bundle {version} écrit dans {path}.")
+    return path
+
+
+def warmup_image() -> bytes:
+    """ Image JPEG synthétique (dégradé), requête de préchauffage de la recherche CBIR. """
+
+    gradient = np.linspace(0, 255, 256, dtype=np.uint8)
+    pixels = np.stack(np.broadcast_arrays(gradient[:, None], gradient[None, :], gradient[::-1, None]), axis=-1)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def warm_up(backends: dict):
+    """ Exécute une requête synthétique par backend et par dataset (dans le thread appelant). """
+
+    queries = {"image": warmup_image, "text": lambda: WARMUP_TEXT}
+    for kind, backend in backends.items():
+        query = backend.prepare(queries[kind]())
+        for dataset in backend.search:
+            backend.run_batch([(query, dataset, WARMUP_K)])
+
+
+def load_bundle(path: Path = BUNDLE_DIR, device: str = None, search: tuple = ("image", "text"), warmup: bool = True,
+                checksums: bool = False) -> dict:
+    """ Crée les backends du service à partir d'un bundle seul, sans accès au réseau.
+    :param path: Dossier du bundle, ou dossier des bundles (dernière version).
+    :param device: 'cuda' ou 'cpu' (déduit automatiquement si None).
+    :param search: Types de recherche servis ("image", "text").
+    :param warmup: Exécute une requête de préchauffage par dataset avant de rendre la main.
+    :param checksums: Vérifie aussi les empreintes des fichiers (voir verify_bundle).
+    :return: Backends, par type de recherche (voir SearchServer).
+    :raises ValueError: Si le bundle est incomplet, ou sans le modèle d'un type de recherche demandé. """
+
+    start = time.perf_counter()
+    path = resolve_bundle(path)
+    manifest = verify_bundle(path, checksums)
+    models = manifest["models"]
+    missing = [kind for kind, model in (("image", "mobilenet"), ("text", "clip_text"))
+               if kind in search and model not in models]
+    if missing:
+        raise ValueError(f"Le bundle {manifest['version']} ne permet pas la recherche : {', '.join(missing)}")
+
+    # Les modules de recherche lisent ces variables à l'import (ou au rechargement, s'ils sont déjà importés)
+    os.environ["PIXMATCHER_RESSOURCES_DIR"] = str(path / "ressources")
+    if "clip_text" in models:
+        os.environ["PIXMATCHER_CLIP_TEXT_ENCODER"] = str(path / models["clip_text"])
+    for name in ("src.similarity_search", "src.clip_similarity_search"):
+        if name in sys.modules:
+            importlib.reload(sys.modules[name])
+
+    backends = {}
+    if "image" in search:
+        backends["image"] = ImageSearchBackend(device=device, backbone=path / models["mobilenet"])
+    if "text" in search:
+        backends["text"] = TextSearchBackend()
+    loaded = time.perf_counter()
+    if warmup:
+        warm_up(backends)
+    logging.info(f"Bundle {manifest['version']} prêt en {time.perf_counter() - start:.2f} s "
+                 f"(chargement : {loaded - start:.2f} s, préchauffage : {time.perf_counter() - loaded:.2f} s).")
+    return backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bundle de démarrage à froid du service de recherche.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Exporte les modèles, les collections et les index")
+    build_parser.add_argument("--output", default=BUNDLE_DIR, help="Dossier des bundles")
+    build_parser.add_argument("--version", default=None, help="Nom de la version (par défaut, date et heure)")
+    build_parser.add_argument("--model", nargs="+", choices=("mobilenet", "clip"), default=["mobilenet", "clip"],
+                              help="Modèles exportés")
+    build_parser.add_argument("--clip-model", default="ViT-B/32",
+                              help="Nom du modèle CLIP ou chemin vers un point de contrôle local")
+
+    check_parser = subparsers.add_parser("check", help="Vérifie un bundle, le charge et mesure le temps de démarrage")
+    check_parser.add_argument("path", nargs="?", default=BUNDLE_DIR, help="Bundle, ou dossier des bundles")
+    check_parser.add_argument("--search", nargs="+", choices=("image", "text"), default=["image", "text"],
+                              help="Types de recherche chargés")
+    check_parser.add_argument("--device", default=None, help="'cuda' ou 'cpu' (déduit automatiquement par défaut)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    if args.command == "build":
+        print(build_bundle(args.output, args.version, args.model, args.clip_model))
+    else:
+        load_bundle(args.path, args.device, args.search, checksums=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+""" Module de cache disque adressé par contenu.
+
+Ce module évite de redécoder et de ré-extraire les mêmes images d'une exécution à l'autre (ré-indexation, essais de
+différents réglages d'index...). Son fonctionnement est le suivant :
+
+    - Chaque entrée est identifiée par une empreinte du contenu de l'image (octets bruts), par le type de donnée stockée
+    (vecteur de caractéristiques, tenseur prétraité...) et par une empreinte de la configuration qui l'a produite
+    (modèle, poids, taille cible, mode de prétraitement). Changer de modèle invalide donc naturellement le cache.
+    - Les valeurs sont des tableaux numpy écrits au format .npy, de façon atomique (fichier temporaire puis os.replace),
+    si bien que plusieurs processus peuvent partager le même dossier sans jamais lire une entrée incomplète.
+    - La taille totale est plafonnée : au-delà, les entrées les moins récemment utilisées (date de modification,
+    rafraîchie à chaque lecture) sont supprimées. Un verrou de fichier évite que plusieurs processus évincent en même
+    temps.
+    - Le même mécanisme stocke aussi des octets bruts (par exemple des vignettes JPEG), avec une autre extension.
+
+Le dossier et le plafond sont configurables via les variables d'environnement PIXMATCHER_CACHE_DIR et
+PIXMATCHER_CACHE_MAX_BYTES. """
+
+import os, io, json, hashlib, logging, tempfile, numpy as np
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou entre processus, l'éviction reste sûre mais peut être redondante
+    fcntl = None
+
+# Dossier et taille maximale (en octets) par défaut du cache
+DEFAULT_CACHE_DIR = Path(os.environ.get("PIXMATCHER_CACHE_DIR", Path.home() / ".cache" / "pixmatcher"))
+DEFAULT_MAX_BYTES = int(os.environ.get("PIXMATCHER_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Après une éviction, la taille du cache est ramenée à cette fraction du plafond pour ne pas évincer à chaque écriture
+EVICTION_TARGET_RATIO = 0.9
+
+
+def content_hash(data: bytes) -> str:
+    """ Calcule l'empreinte du contenu d'une image.
+    :param data: Octets bruts de l'image (fichier encodé).
+    :return: Empreinte hexadécimale (BLAKE2b, 128 bits). """
+
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def config_fingerprint(config: dict) -> str:
+    """ Calcule l'empreinte d'une configuration de prétraitement / modèle.
+    :param config: Dictionnaire sérialisable en JSON décrivant la configuration.
+    :return: Empreinte hexadécimale courte, indépendante de l'ordre des clés. """
+
+    serialized = json.dumps(config, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(serialized, digest_size=8).hexdigest()
+
+
+def cache_key(data: bytes, kind: str, config: dict) -> str:
+    """ Construit la clé d'une entrée du cache.
+    :param data: Octets bruts de l'image.
+    :param kind: Type de donnée stockée (par exemple "features" ou "tensor").
+    :param config: Configuration ayant produit la donnée (voir config_fingerprint).
+    :return: Clé utilisable avec DiskCache. """
+
+    return f"{content_hash(data)}-{kind}-{config_fingerprint(config)}"
+
+
+def atomic_write_bytes(path: str | os.PathLike, data: bytes):
+    """ Écrit un fichier de façon atomique : écriture dans un fichier temporaire du même dossier, puis renommage.
+    Un lecteur concurrent voit soit l'ancien fichier, soit le nouveau complet, jamais un fichier partiel.
+    :param path: Chemin du fichier à écrire.
+    :param data: Contenu du fichier. """
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_image_bytes(image_input) -> bytes | None:
+    """ Retourne les octets bruts d'une entrée image, lorsqu'elle en a (chemin, octets, objet fichier).
+    :param image_input: Entrée acceptée par preprocess_image.
+    :return: Les octets de l'image, ou None pour les entrées déjà décodées (tableau NumPy, PIL.Image, tenseur). """
+
+    if isinstance(image_input, (bytes, bytearray, memoryview)):
+        return bytes(image_input)
+    if isinstance(image_input, (str, os.PathLike)):
+        try:
+            with open(image_input, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None  # L'erreur sera signalée par le prétraitement
+    if hasattr(image_input, 'getvalue'):  # BytesIO, fichier téléversé Streamlit
+        return image_input.getvalue()
+    return None
+
+
+class DiskCache:
+    """ Cache disque clé -> tableau numpy (ou octets bruts), à écritures atomiques et éviction LRU sous un plafond de
+    taille. Plusieurs processus peuvent partager le même dossier. """
+
+    def __init__(self, directory: str | os.PathLike = None, max_bytes: int = None, suffix: str = ".npy"):
+        """ Prépare le dossier du cache.
+        :param directory: Dossier racine du cache (par défaut DEFAULT_CACHE_DIR).
+        :param max_bytes: Taille maximale en octets (par défaut DEFAULT_MAX_BYTES).
+        :param suffix: Extension des fichiers des entrées. """
+
+        self.directory = Path(directory) if directory is not None else DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else DEFAULT_MAX_BYTES
+        self.suffix = suffix
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.current_bytes = None  # Estimation de la taille occupée, calculée au premier besoin
+        self.hits = 0
+        self.misses = 0
+
+    def path_for(self, key: str) -> Path:
+        """ Retourne le chemin du fichier d'une entrée (réparti en sous-dossiers selon les 2 premiers caractères). """
+
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def get_bytes(self, key: str) -> bytes | None:
+        """ Lit les octets bruts d'une entrée du cache et la marque comme récemment utilisée.
+        :param key: Clé de l'entrée.
+        :return: Le contenu stocké, ou None si l'entrée est absente. """
+
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # Rafraîchit la date de modification, utilisée comme date de dernier accès
+        except FileNotFoundError:  # Absente, ou évincée entre-temps par un autre processus
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def get(self, key: str) -> np.ndarray | None:
+        """ Lit une entrée du cache et la marque comme récemment utilisée.
+        :param key: Clé de l'entrée (voir cache_key).
+        :return: Le tableau stocké, ou None si l'entrée est absente. """
+
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        try:
+            return np.load(io.BytesIO(data), allow_pickle=False)
+        except (ValueError, EOFError):  # Entrée corrompue
+            self.hits -= 1
+            self.misses += 1
+            return None
+
+    def put(self, key: str, array: np.ndarray):
+        """ Écrit une entrée de façon atomique, puis évince les entrées les plus anciennes si le plafond est dépassé.
+        :param key: Clé de l'entrée (voir cache_key).
+        :param array: Tableau numpy à stocker. """
+
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(array), allow_pickle=False)
+        self.put_bytes(key, buffer.getvalue())
+
+    def put_bytes(self, key: str, data: bytes):
+        """ Écrit les octets bruts d'une entrée de façon atomique, puis évince les entrées les plus anciennes si le
+        plafond est dépassé.
+        :param key: Clé de l'entrée.
+        :param data: Contenu à stocker. """
+
+        path = self.path_for(key)
+        path.parent.mkdir(exist_ok=True)
+        atomic_write_bytes(path, data)  # Un lecteur concurrent ne voit jamais d'entrée partielle
+
+        if self.current_bytes is None:
+            self.current_bytes = self.disk_usage()
+        else:
+            self.current_bytes += len(data)
+        if self.current_bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self) -> list[tuple[float, int, Path]]:
+        """ Liste les entrées présentes sur disque.
+        :return: Liste de tuples (date de dernier accès, taille en octets, chemin). """
+
+        entries = []
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Supprimée entre-temps par un autre processus
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def disk_usage(self) -> int:
+        """ Retourne la taille totale (en octets) occupée par les entrées du cache. """
+
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """ Supprime les entrées les moins récemment utilisées jusqu'à repasser sous EVICTION_TARGET_RATIO du plafond.
+        Si un autre processus est déjà en train d'évincer, l'éviction est laissée à ce dernier. """
+
+        with open(self.directory / ".evict.lock", "a") as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)  # Libéré à la fermeture du fichier
+                except BlockingIOError:
+                    return
+            self.evict_entries()
+
+    def evict_entries(self):
+        """ Parcourt les entrées, de la moins récemment utilisée à la plus récente, et les supprime jusqu'à repasser
+        sous EVICTION_TARGET_RATIO du plafond. """
+
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICTION_TARGET_RATIO
+        removed = 0
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:  # Déjà évincée par un autre processus
+                pass
+            total -= size
+            removed += 1
+        logging.debug(f"Cache {self.directory} : {removed} entrées évincées, {total} octets restants.")
+        self.current_bytes = total
+
+    def clear(self):
+        """ Supprime toutes les entrées du cache. """
+
+        for _, _, path in self.entries():
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        self.current_bytes = 0
@@ -0,0 +1,104 @@
+""" Module de recherche exacte par blocs, pour les collections plus grandes que la mémoire.
+
+La recherche CLIP calcule la similarité de la requête avec toute la matrice d'embeddings, chargée en mémoire : la
+taille des collections est alors limitée par la RAM. Ce module parcourt à la place le fichier d'embeddings, projeté en
+mémoire, par blocs de taille fixe :
+
+    - Chaque bloc est lu (copié depuis le fichier) puis comparé à toutes les requêtes d'un lot en un seul produit
+    matriciel ; seuls les k meilleurs candidats du bloc sont conservés pour chaque requête (np.argpartition).
+    - Les blocs sont lus et comparés par plusieurs threads (numpy libère le GIL pendant les copies et les produits
+    matriciels), afin que les lectures sur disque se recouvrent avec les calculs.
+    - Les candidats des blocs sont fusionnés au fur et à mesure dans un top-k courant par requête : la mémoire
+    utilisée ne dépend que de la taille des blocs et du nombre de threads.
+
+Le résultat est identique à celui du calcul en mémoire, à l'ordre des ex aequo près. clip_similarity_search l'utilise
+pour les collections dont le fichier d'embeddings dépasse CHUNKED_SEARCH_BYTES (et n'a pas de codes binaires). """
+
+import os, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+
+# Taille (en octets) du fichier d'embeddings au-delà de laquelle une collection est parcourue par blocs au lieu d'être
+# chargée en mémoire (0 : toujours par blocs)
+CHUNKED_SEARCH_BYTES = int(os.environ.get("PIXMATCHER_CHUNKED_SEARCH_BYTES", 2 * 1024 ** 3))
+
+# Nombre de lignes par bloc (64 Mo pour des vecteurs CLIP de 512 dimensions en float32)
+BLOCK_ROWS = 32768
+
+# Nombre de threads de lecture et de calcul (chacun garde au plus un bloc en mémoire)
+THREADS = int(os.environ.get("PIXMATCHER_CHUNKED_THREADS", min(8, os.cpu_count() or 1)))
+
+# Scores comparés : "ip" (produit scalaire, vecteurs déjà normalisés) ou "cosine" (1 - similarité cosinus)
+METRICS = ("ip", "cosine")
+
+
+class ChunkedIndex:
+    """ Index exact parcouru par blocs, sur une matrice d'embeddings projetée en mémoire. Sa méthode search suit la
+    convention des index FAISS (scores et numéros de ligne, complétés par -1). """
+
+    def __init__(self, vectors: np.ndarray, metric: str = "ip", deleted: np.ndarray = None,
+                 block_rows: int = BLOCK_ROWS, threads: int = THREADS):
+        """ :param vectors: Embeddings de la collection (n, d), en général projetés en mémoire (np.load, mmap_mode="r").
+        :param metric: Score : "ip" (similarité par produit scalaire, comme IndexFlatIP) ou "cosine" (distance
+        1 - similarité cosinus, comme scipy.spatial.distance.cdist).
+        :param deleted: Lignes supprimées, exclues de la recherche (optionnel).
+        :param block_rows: Nombre de lignes par bloc.
+        :param threads: Nombre de threads de lecture et de calcul. """
+
+        if metric not in METRICS:
+            raise ValueError(f"Score inconnu : {metric} (attendu : {', '.join(METRICS)})")
+        self.vectors, self.metric, self.block_rows, self.threads = vectors, metric, block_rows, max(1, threads)
+        self.deleted = None if deleted is None or not deleted.any() else np.asarray(deleted[:len(vectors)], dtype=bool)
+
+    @property
+    def d(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.vectors) - (0 if self.deleted is None else int(self.deleted.sum()))
+
+    def score_block(self, queries: np.ndarray, start: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """ Lit un bloc et retient ses k meilleurs candidats pour chaque requête.
+        :param queries: Matrice (n, d) des requêtes (normalisées pour le score "cosine").
+        :param start: Première ligne du bloc.
+        :param k: Nombre de candidats retenus par requête.
+        :return: Tuple (scores à minimiser (n, k'), numéros de ligne (n, k')), avec k' = min(k, taille du bloc). """
+
+        block = np.asarray(self.vectors[start:start + self.block_rows], dtype=np.float32)  # Lecture sur disque
+        scores = -(queries @ block.T)
+        if self.metric == "cosine":
+            scores = 1 + scores / np.maximum(np.linalg.norm(block, axis=1), 1e-12)
+        if self.deleted is not None:
+            scores[:, self.deleted[start:start + len(block)]] = np.inf
+
+        k = min(k, len(block))
+        best = np.argpartition(scores, k - 1, axis=1)[:, :k]
+        return np.take_along_axis(scores, best, axis=1), best + start
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """ Recherche les k meilleurs résultats de chaque requête, en un seul parcours de la collection.
+        :param queries: Matrice (n, d) des requêtes.
+        :param k: Nombre de résultats par requête.
+        :return: Tuple (scores (n, k), numéros de ligne (n, k)) : similarités décroissantes pour "ip", distances
+        croissantes pour "cosine". """
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.d)
+        if self.metric == "cosine":
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        scores = np.full((len(queries), k), np.inf, dtype=np.float32)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="chunked_search") as pool:
+            blocks = pool.map(lambda start: self.score_block(queries, start, k),
+                              range(0, len(self.vectors), self.block_rows))
+            for block_scores, block_indices in blocks:  # Fusion dans le top-k courant, dans l'ordre des blocs
+                merged_scores = np.concatenate([scores, block_scores], axis=1)
+                merged_indices = np.concatenate([indices, block_indices], axis=1)
+                best = np.argpartition(merged_scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(merged_scores, best, axis=1)
+                indices = np.take_along_axis(merged_indices, best, axis=1)
+
+        order = np.argsort(scores, axis=1, kind="stable")
+        scores, indices = np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+        indices[np.isinf(scores)] = -1  # Moins de k lignes non supprimées
+        return (-scores if self.metric == "ip" else scores), indices
@@ -5,7 +5,9 @@ d’images à partir d’une requête en langage naturel. Il permet de :
 
     - Charger les embeddings CLIP des images des datasets Tiny ImageNet et Open Images V7
     - Transformer une requête textuelle en vecteur d’embedding via CLIP
-    - Comparer ce vecteur aux vecteurs d’images pour identifier les plus similaires
+    - Comparer ce vecteur aux vecteurs d’images pour identifier les plus similaires (ou, si la collection a des codes
+    binaires, présélectionner les candidats par distance de Hamming puis les re-classer : voir src.binary_codes ; si
+    elle dépasse la mémoire, parcourir le fichier d'embeddings par blocs : voir src.chunked_search)
     - Obtenir les indices ou chemins (locaux ou URLs) des images correspondantes
 
 Le modèle utilisé est CLIP ViT-B/32, pré-entraîné et exploité ici en inférence (sans apprentissage). """
@@ -13,12 +15,30 @@ Le modèle utilisé est CLIP ViT-B/32, pré-entraîné et exploité ici en infé
 import torch, clip, numpy as np, json, os
 from scipy.spatial.distance import cdist
 from pathlib import Path
+from src import metrics, profiling
+from src.binary_codes import load_index
+from src.chunked_search import ChunkedIndex, CHUNKED_SEARCH_BYTES
+
+# Dossier des embeddings, catégories et tables des deux datasets (remplaçable, par exemple par des collections
+# synthétiques pour les benchmarks)
+RESSOURCES_PATH = Path(os.environ.get("PIXMATCHER_RESSOURCES_DIR",
+                                      Path(__file__).parent.parent / "ressources"))
 
 # Sélection du device pour l'inférence (CUDA si disponible, sinon CPU)
 device = "cuda" if torch.cuda.is_available() else "cpu"
 
+# Encodeur de texte TorchScript exporté par src.bundle (optionnel) : le checkpoint CLIP n'est alors ni chargé ni
+# téléchargé, seul le tokenizer du paquet clip est utilisé
+TEXT_ENCODER_FILE = os.environ.get("PIXMATCHER_CLIP_TEXT_ENCODER")
+
 # Chargement du modèle CLIP (version ViT-B/32) et du préprocesseur associé
-model, preprocess = clip.load("ViT-B/32", device=device)
+with metrics.span("model_load"):
+    if TEXT_ENCODER_FILE:
+        model, preprocess = None, None
+        encode_text = torch.jit.load(TEXT_ENCODER_FILE, map_location=device).eval()
+    else:
+        model, preprocess = clip.load("ViT-B/32", device=device)
+        encode_text = model.encode_text
 
 
 def text_to_vector(text):
@@ -26,22 +46,40 @@ def text_to_vector(text):
     :param text: Chaîne de texte à encoder
     :return: Vecteur numpy normalisé représentant la requête textuelle """
 
-    with torch.no_grad(): # Pas de gradients car inférence
+    return text_to_vectors([text])
+
+
+def text_to_vectors(texts):
+    """ Encode plusieurs requêtes textuelles en une seule passe de CLIP.
+    :param texts: Liste des chaînes de texte à encoder
+    :return: Matrice numpy (n, d) des vecteurs normalisés, dans l'ordre des requêtes """
+
+    with metrics.span("text_encode"), profiling.model_profile("clip"), torch.no_grad(): # Pas de gradients (inférence)
         # Tokenisation puis encodage du texte avec CLIP
-        text_features = model.encode_text(clip.tokenize([text]).to(device))
+        text_features = encode_text(clip.tokenize(list(texts)).to(device))
         # Normalisation du vecteur
         text_features /= text_features.norm(dim=-1, keepdim=True)
+        text_features = text_features.cpu().numpy()
 
-    return text_features.cpu().numpy()
+    return text_features
 
 
 """ --------------------- Partie Open Image V7 ---------------------- """
 
-# Chemin vers les embeddings CLIP des images Open Image V7
-OI_EMBEDDINGS_PATH = np.load(Path(__file__).parent.parent / "ressources" / "open-images" / "clip_embeddings.npy")
+# Codes binaires appris par src.binary_codes (optionnels) : présélection par distance de Hamming, puis re-classement
+# exact des seuls candidats, dont les embeddings restent alors projetés en mémoire
+OI_CODES_FILE = RESSOURCES_PATH / "open-images" / "clip_codes.npz"
+
+# Chemin vers les embeddings CLIP des images Open Image V7, parcourus par blocs (sans être chargés en mémoire) au-delà
+# de CHUNKED_SEARCH_BYTES
+OI_EMBEDDINGS_FILE = RESSOURCES_PATH / "open-images" / "clip_embeddings.npy"
+OI_CHUNKED = OI_EMBEDDINGS_FILE.stat().st_size > CHUNKED_SEARCH_BYTES
+OI_EMBEDDINGS_PATH = np.load(OI_EMBEDDINGS_FILE, mmap_mode="r" if OI_CODES_FILE.exists() or OI_CHUNKED else None)
+OI_CODES = load_index(OI_CODES_FILE, OI_EMBEDDINGS_PATH, metric="cosine")
+OI_CHUNKED_INDEX = ChunkedIndex(OI_EMBEDDINGS_PATH, metric="ip") if OI_CODES is None and OI_CHUNKED else None
 
 # Chargement du mapping entre index FAISS et nom de fichier image
-with open(Path(__file__).parent.parent / "ressources" / "open-images" / "image_urls.json", "r") as f:
+with open(RESSOURCES_PATH / "open-images" / "image_urls.json", "r") as f:
     image_urls = json.load(f)
 
 # URL de base pour accéder aux images stockées sur S3
@@ -53,13 +91,40 @@ def oi_find_similar_images(text, top_k=10):
     :param top_k: Nombre d’images similaires à retourner
     :return: Liste des indices des images les plus proches """
 
-    query_vector = text_to_vector(text)  # Encodage de la requête
+    return oi_search_vector(text_to_vector(text), top_k)  # Encodage de la requête, puis recherche
 
-    # Calcul du score de similarité par produit scalaire (vecteurs déjà normalisés)
-    similarities = (query_vector @ OI_EMBEDDINGS_PATH.T)[0]
 
-    # Retourne les indices des images les plus proches (tri décroissant)
-    return np.argsort(-similarities)[:top_k]
+def oi_search_vector(query_vector, top_k=10):
+    """ Trouve les top_k images les plus similaires à une requête déjà encodée dans Open Image V7 (pages suivantes
+    d'une recherche, sans nouvel encodage du texte).
+    :param query_vector: Vecteur normalisé de la requête (voir text_to_vector)
+    :param top_k: Nombre d’images similaires à retourner
+    :return: Liste des indices des images les plus proches """
+
+    return oi_search_vectors(query_vector, top_k)[0]
+
+
+def oi_search_vectors(query_vectors, top_k=10):
+    """ Trouve les top_k images les plus similaires à plusieurs requêtes encodées dans Open Image V7, en un seul
+    produit matriciel.
+    :param query_vectors: Matrice (n, d) des vecteurs normalisés des requêtes
+    :param top_k: Nombre d’images similaires à retourner par requête
+    :return: Matrice (n, top_k) des indices des images les plus proches """
+
+    if OI_CODES is not None:
+        with metrics.span("similarity_search"), profiling.search_profile("oi_search_vectors", OI_CODES):
+            return OI_CODES.search(query_vectors, top_k)[1][:, :min(top_k, OI_CODES.ntotal)]
+
+    if OI_CHUNKED_INDEX is not None:
+        with metrics.span("similarity_search"), profiling.search_profile("oi_search_vectors", OI_CHUNKED_INDEX):
+            return OI_CHUNKED_INDEX.search(query_vectors, top_k)[1][:, :min(top_k, OI_CHUNKED_INDEX.ntotal)]
+
+    with metrics.span("similarity_search"), profiling.search_profile("oi_search_vectors", OI_EMBEDDINGS_PATH):
+        # Calcul du score de similarité par produit scalaire (vecteurs déjà normalisés)
+        similarities = query_vectors @ OI_EMBEDDINGS_PATH.T
+
+        # Retourne les indices des images les plus proches (tri décroissant)
+        return np.argsort(-similarities, axis=1)[:, :top_k]
 
 
 def oi_get_image_path(index):
@@ -67,7 +132,8 @@ def oi_get_image_path(index):
     :param index: Index de l’image dans les embeddings
     :return: URL S3 de l’image """
 
-    filename = image_urls.get(str(index))
+    with metrics.span("path_resolution"):
+        filename = image_urls.get(str(index))
     if filename:
         return BASE_URL + filename
     else:
@@ -76,14 +142,31 @@ def oi_get_image_path(index):
 
 """ --------------------- Partie Tiny ImageNet ---------------------- """
 
-# Chargement des embeddings et catégories CLIP des images Tiny ImageNet
-TI_EMBEDDINGS_PATH = np.load(Path(__file__).parent.parent / "ressources" / "tiny-imagenet"
-                             / "Tiny_ImageNet_CLIP_Embeddings.npy")
-CATEGORIES_PATH = np.load(Path(__file__).parent.parent / "ressources" / "tiny-imagenet"
-                          / "Tiny_ImageNet_CLIP_Categories.npy", allow_pickle=True)
+# Codes binaires appris par src.binary_codes (optionnels)
+TI_CODES_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_CLIP_Codes.npz"
+
+# Chargement des embeddings (parcourus par blocs au-delà de CHUNKED_SEARCH_BYTES) et catégories CLIP des images Tiny
+# ImageNet
+TI_EMBEDDINGS_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_CLIP_Embeddings.npy"
+TI_CHUNKED = TI_EMBEDDINGS_FILE.stat().st_size > CHUNKED_SEARCH_BYTES
+TI_EMBEDDINGS_PATH = np.load(TI_EMBEDDINGS_FILE, mmap_mode="r" if TI_CODES_FILE.exists() or TI_CHUNKED else None)
+CATEGORIES_PATH = np.load(RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_CLIP_Categories.npy",
+                          allow_pickle=True)
+
+# Chemins relatifs des images et lignes supprimées, produits par src.index (absents des anciennes collections)
+PATHS_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_CLIP_Paths.npy"
+DELETED_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_CLIP_Deleted.npy"
+THUMBNAILS_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_CLIP_Thumbnails.npy"
+PATHS = np.load(PATHS_FILE) if PATHS_FILE.exists() else None
+# Atlas de vignettes (N, H, W, 3), projeté en mémoire : seules les lignes affichées sont lues sur disque
+THUMBNAILS = np.load(THUMBNAILS_FILE, mmap_mode="r") if THUMBNAILS_FILE.exists() else None
+DELETED = np.load(DELETED_FILE) if DELETED_FILE.exists() else np.zeros(len(CATEGORIES_PATH), dtype=bool)
+TI_EMBEDDINGS_PATH = TI_EMBEDDINGS_PATH[:len(DELETED)]  # Lignes au-delà : mise à jour incrémentale interrompue
+TI_CODES = load_index(TI_CODES_FILE, TI_EMBEDDINGS_PATH, metric="cosine", deleted=DELETED)
+TI_CHUNKED_INDEX = ChunkedIndex(TI_EMBEDDINGS_PATH, "cosine", DELETED) if TI_CODES is None and TI_CHUNKED else None
 
 # Chemin de base vers les images locales Tiny ImageNet
-BASE_PATH = Path(__file__).parent.parent / "ressources" / "tiny-imagenet" / "tiny-imagenet-200" / "train"
+BASE_PATH = RESSOURCES_PATH / "tiny-imagenet" / "tiny-imagenet-200" / "train"
 
 
 def ti_find_similar_images(text, top_k=10):
@@ -92,12 +175,39 @@ def ti_find_similar_images(text, top_k=10):
     :param top_k: Nombre d'images à retourner (par défaut 5).
     :return: Indices des images les plus similaires. """
 
-    query_vector = text_to_vector(text)  # Encodage du texte en vecteur
+    return ti_search_vector(text_to_vector(text), top_k)  # Encodage du texte en vecteur, puis recherche
 
-    # Calcul des distances cosinus entre la requête et chaque embedding image
-    distances = cdist(query_vector, TI_EMBEDDINGS_PATH, metric="cosine")[0]
 
-    return np.argsort(distances)[:top_k]  # Indices des images les plus proches
+def ti_search_vector(query_vector, top_k=10):
+    """ Trouve les top_k images les plus similaires à une requête déjà encodée (pages suivantes d'une recherche,
+    sans nouvel encodage du texte).
+    :param query_vector: Vecteur normalisé de la requête (voir text_to_vector).
+    :param top_k: Nombre d'images à retourner.
+    :return: Indices des images les plus similaires. """
+
+    return ti_search_vectors(query_vector, top_k)[0]
+
+
+def ti_search_vectors(query_vectors, top_k=10):
+    """ Trouve les top_k images les plus similaires à plusieurs requêtes encodées, en un seul calcul de distances.
+    :param query_vectors: Matrice (n, d) des vecteurs normalisés des requêtes.
+    :param top_k: Nombre d'images à retourner par requête.
+    :return: Matrice (n, top_k) des indices des images les plus similaires. """
+
+    if TI_CODES is not None:
+        with metrics.span("similarity_search"), profiling.search_profile("ti_search_vectors", TI_CODES):
+            return TI_CODES.search(query_vectors, top_k)[1][:, :min(top_k, TI_CODES.ntotal)]
+
+    if TI_CHUNKED_INDEX is not None:
+        with metrics.span("similarity_search"), profiling.search_profile("ti_search_vectors", TI_CHUNKED_INDEX):
+            return TI_CHUNKED_INDEX.search(query_vectors, top_k)[1][:, :min(top_k, TI_CHUNKED_INDEX.ntotal)]
+
+    with metrics.span("similarity_search"), profiling.search_profile("ti_search_vectors", TI_EMBEDDINGS_PATH):
+        # Calcul des distances cosinus entre les requêtes et chaque embedding image
+        distances = cdist(query_vectors, TI_EMBEDDINGS_PATH, metric="cosine")
+        distances[:, DELETED] = np.inf  # Images supprimées par une ré-indexation incrémentale
+
+        return np.argsort(distances, axis=1)[:, :top_k]  # Indices des images les plus proches
 
 
 def ti_get_image_path(index):
@@ -105,6 +215,16 @@ def ti_get_image_path(index):
     :param index: Index de l'image dans le fichier d'embeddings
     :return: Chemin complet vers l'image """
 
+    with metrics.span("path_resolution"):
+        return ti_resolve_image_path(index)
+
+
+def ti_resolve_image_path(index):
+    """ Construit le chemin de l'image à partir de son index (voir ti_get_image_path). """
+
+    if PATHS is not None:  # Collection produite par src.index : le chemin relatif de chaque ligne est enregistré
+        return os.path.join(BASE_PATH, PATHS[index])
+
     class_id = CATEGORIES_PATH[index]  # ID WordNet de la classe de l’image
     class_indices = np.where(CATEGORIES_PATH == class_id)[0]  # Tous les indices de la même classe
     image_index = np.where(class_indices == index)[0][0]  # Trouve l’indice dans la sous-liste
@@ -113,3 +233,13 @@ def ti_get_image_path(index):
     image_path = os.path.join(BASE_PATH, class_id, "images", image_name)
 
     return image_path
+
+
+def ti_get_thumbnail(index):
+    """ Retrouve la vignette d'une image dans l'atlas produit par src.index (option --thumbnails).
+    :param index: Index de l'image dans le fichier d'embeddings
+    :return: Tableau uint8 (H, W, 3), ou None si l'atlas n'a pas été produit """
+
+    if THUMBNAILS is None:
+        return None
+    return np.asarray(THUMBNAILS[index])
@@ -0,0 +1,200 @@
+""" Module d'évaluation des index FAISS. Usage : python -m src.evaluation --collection <nom> --config <index> [...]
+
+Remplacer l'index exact (IndexFlatL2) par un index approché ou compressé est un compromis entre qualité, vitesse et
+mémoire. Ce module mesure ce compromis sur une collection Tiny ImageNet, dont les catégories servent de vérité terrain :
+
+    - Chaque configuration est une chaîne de la fabrique d'index FAISS, suivie éventuellement des paramètres de
+    recherche (par exemple "IVF1024,Flat:nprobe=16", "HNSW32:efSearch=64", "PCA128,Flat", ou "PCAW128,Flat" pour une
+    ACP blanchie, comme celle de src.reduction).
+    - Les requêtes sont des images de la collection (l'image elle-même est exclue de ses résultats). Pour chacune, le
+    rappel@k compare les k voisins de l'index à ceux de la recherche exacte, la précision@k et le mAP@k comptent les
+    voisins de la même catégorie que la requête.
+    - Le débit (requêtes par seconde) est mesuré pour plusieurs tailles de lot, ainsi que le temps de construction
+    (entraînement et ajout) et la taille de l'index sérialisé.
+
+Le résultat est un tableau (affiché, et écrit en CSV avec --output) qui sert au dimensionnement. """
+
+import argparse, csv, time, faiss, numpy as np
+from src.projection import collection_files
+
+# Collections évaluables (les catégories de Tiny ImageNet servent de vérité terrain)
+COLLECTIONS = ("tiny-imagenet-mobilenet", "tiny-imagenet-clip")
+
+# Configurations évaluées par défaut : chaîne de la fabrique FAISS, puis paramètres de recherche après ':'
+DEFAULT_CONFIGS = ["Flat", "IVF1024,Flat:nprobe=16", "HNSW32:efSearch=64", "IVF1024,PQ48:nprobe=16", "PCA128,Flat",
+                   "PCAW128,Flat", "PCA256,Flat"]
+
+# Nombre de requêtes, nombre de voisins et tailles de lot des mesures de débit
+NUM_QUERIES = 1000
+K = 10
+BATCH_SIZES = [1, 16, 256]
+
+# Nombre maximal de vecteurs utilisés pour l'entraînement des index (IVF, PQ, PCA)
+TRAIN_SIZE = 100000
+
+
+def parse_config(config: str) -> tuple[str, str]:
+    """ Sépare une configuration en chaîne de la fabrique FAISS et paramètres de recherche.
+    :param config: Configuration, par exemple "IVF1024,Flat:nprobe=16".
+    :return: Tuple (chaîne de la fabrique, paramètres de recherche ou chaîne vide). """
+
+    factory, _, params = config.partition(":")
+    return factory.strip(), params.strip()
+
+
+def build_index(config: str, vectors: np.ndarray, seed: int = 0) -> tuple[faiss.Index, float]:
+    """ Construit (entraîne si besoin, puis remplit) l'index d'une configuration.
+    :param config: Configuration (voir parse_config).
+    :param vectors: Vecteurs float32 de la collection.
+    :param seed: Graine du tirage des vecteurs d'entraînement.
+    :return: Tuple (index prêt pour la recherche, temps de construction en secondes). """
+
+    factory, params = parse_config(config)
+    start = time.perf_counter()
+    index = faiss.index_factory(vectors.shape[1], factory)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        train = vectors if len(vectors) <= TRAIN_SIZE else vectors[np.sort(rng.choice(len(vectors), TRAIN_SIZE,
+                                                                                     replace=False))]
+        index.train(train)
+    index.add(vectors)
+    build_time = time.perf_counter() - start
+    if params:
+        faiss.ParameterSpace().set_index_parameters(index, params)
+    return index, build_time
+
+
+def search_excluding(index: faiss.Index, queries: np.ndarray, query_rows: np.ndarray, k: int) -> np.ndarray:
+    """ Recherche les k voisins de chaque requête, en excluant la requête elle-même (image de la collection).
+    :return: Matrice (n, k) des lignes voisines (-1 si l'index en retourne moins de k). """
+
+    _, indices = index.search(queries, k + 1)
+    neighbours = np.full((len(queries), k), -1, dtype=np.int64)
+    for i, (row, found) in enumerate(zip(query_rows, indices)):
+        found = found[found != row][:k]
+        neighbours[i, :len(found)] = found
+    return neighbours
+
+
+def recall_at_k(neighbours: np.ndarray, exact: np.ndarray) -> float:
+    """ Proportion moyenne des k voisins exacts retrouvés par l'index. """
+
+    return float(np.mean([len(np.intersect1d(found[found >= 0], truth)) / exact.shape[1]
+                          for found, truth in zip(neighbours, exact)]))
+
+
+def precision_map_at_k(neighbours: np.ndarray, query_categories: np.ndarray, categories: np.ndarray,
+                       class_sizes: dict) -> tuple[float, float]:
+    """ Calcule la précision@k et le mAP@k, un voisin étant pertinent s'il a la catégorie de la requête.
+    :param neighbours: Matrice (n, k) des lignes voisines (-1 : absent).
+    :param query_categories: Catégorie de chaque requête.
+    :param categories: Catégorie de chaque ligne de la collection.
+    :param class_sizes: Nombre de lignes par catégorie (requête comprise).
+    :return: Tuple (précision@k, mAP@k). """
+
+    k = neighbours.shape[1]
+    relevant = (neighbours >= 0) & (categories[np.maximum(neighbours, 0)] == query_categories[:, None])
+    precision_at_rank = np.cumsum(relevant, axis=1) / np.arange(1, k + 1)
+    # AP@k : moyenne des précisions aux rangs pertinents, rapportée au nombre de voisins pertinents atteignable
+    reachable = np.array([max(1, min(k, class_sizes[category] - 1)) for category in query_categories])
+    average_precision = (precision_at_rank * relevant).sum(axis=1) / reachable
+    return float(relevant.mean()), float(average_precision.mean())
+
+
+def queries_per_second(index: faiss.Index, queries: np.ndarray, k: int, batch_size: int) -> float:
+    """ Mesure le débit de recherche de l'index, les requêtes étant soumises par lots de batch_size. """
+
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        index.search(queries[offset:offset + batch_size], k)
+    return len(queries) / (time.perf_counter() - start)
+
+
+def evaluate(vectors: np.ndarray, categories: np.ndarray, configs: list[str], k: int = K,
+             num_queries: int = NUM_QUERIES, batch_sizes: list[int] = BATCH_SIZES, seed: int = 0) -> list[dict]:
+    """ Évalue chaque configuration d'index sur une collection.
+    :param vectors: Vecteurs de la collection (lignes non supprimées).
+    :param categories: Catégorie de chaque vecteur.
+    :param configs: Configurations à évaluer (voir parse_config).
+    :param k: Nombre de voisins évalués.
+    :param num_queries: Nombre de requêtes, tirées dans la collection.
+    :param batch_sizes: Tailles de lot des mesures de débit.
+    :param seed: Graine du tirage des requêtes.
+    :return: Une ligne de résultats par configuration (config, recall, precision, map, qps@<lot>, build_s,
+    memory_mb, bytes_per_vector). """
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    query_rows = np.sort(rng.choice(len(vectors), min(num_queries, len(vectors)), replace=False))
+    queries = vectors[query_rows]
+    labels, counts = np.unique(categories, return_counts=True)
+    class_sizes = dict(zip(labels, counts))
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    exact = search_excluding(exact_index, queries, query_rows, k)
+
+    results = []
+    for config in configs:
+        index, build_time = build_index(config, vectors, seed)
+        neighbours = search_excluding(index, queries, query_rows, k)
+        precision, mean_ap = precision_map_at_k(neighbours, categories[query_rows], categories, class_sizes)
+        memory = len(faiss.serialize_index(index))
+        result = {"config": config, "recall": recall_at_k(neighbours, exact), "precision": precision, "map": mean_ap}
+        for batch_size in batch_sizes:
+            result[f"qps@{batch_size}"] = queries_per_second(index, queries, k, batch_size)
+        result.update({"build_s": build_time, "memory_mb": memory / 1024 ** 2,
+                       "bytes_per_vector": memory / len(vectors)})
+        results.append(result)
+    return results
+
+
+def format_table(results: list[dict], k: int = K) -> str:
+    """ Met en forme les résultats en tableau texte, une ligne par configuration. """
+
+    columns = [name for name in results[0] if name != "config"]
+    headers = {"recall": f"recall@{k}", "precision": f"precision@{k}", "map": f"mAP@{k}"}
+    width = max(len("config"), *(len(result["config"]) for result in results))
+    lines = [f"{'config':<{width}} | " + " | ".join(f"{headers.get(name, name):>12}" for name in columns)]
+    for result in results:
+        values = [f"{result[name]:12.3f}" if name in headers else f"{result[name]:12.1f}" for name in columns]
+        lines.append(f"{result['config']:<{width}} | " + " | ".join(values))
+    return "\n".join(lines)
+
+
+def load_collection(name: str) -> tuple[np.ndarray, np.ndarray]:
+    """ Charge les vecteurs et catégories des lignes non supprimées d'une collection Tiny ImageNet.
+    :param name: Nom de la collection (voir COLLECTIONS).
+    :return: Tuple (vecteurs float32, catégories). """
+
+    files = collection_files(name)
+    categories = np.load(files["categories"], allow_pickle=True)
+    embeddings = np.load(files["embeddings"], mmap_mode="r")[:len(categories)]
+    deleted = np.load(files["deleted"]) if files["deleted"].exists() else np.zeros(len(categories), dtype=bool)
+    rows = np.flatnonzero(~deleted)
+    return np.asarray(embeddings[rows], dtype=np.float32), categories[rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Évaluation qualité / vitesse / mémoire de configurations d'index.")
+    parser.add_argument("--collection", choices=COLLECTIONS, default=COLLECTIONS[0], help="Collection évaluée")
+    parser.add_argument("--config", nargs="+", default=DEFAULT_CONFIGS,
+                        help="Configurations : chaîne de la fabrique FAISS, puis ':' et paramètres de recherche")
+    parser.add_argument("-k", type=int, default=K, help="Nombre de voisins évalués")
+    parser.add_argument("--queries", type=int, default=NUM_QUERIES, help="Nombre de requêtes")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES, help="Tailles de lot du débit")
+    parser.add_argument("--output", default=None, help="Fichier CSV des résultats (optionnel)")
+    args = parser.parse_args()
+
+    vectors, categories = load_collection(args.collection)
+    results = evaluate(vectors, categories, args.config, args.k, args.queries, args.batch_sizes)
+    print(format_table(results, args.k))
+    if args.output:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0]))
+            writer.writeheader()
+            writer.writerows(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,45 +8,88 @@ en s'appuyant sur le modèle MobileNetV3-Large pré-entraîné sur ImageNet. Son
     - Le modèle est tronqué pour ne conserver que les couches convolutionnelles et le pooling global,
     en supprimant la tête de classification, de sorte à obtenir uniquement ce qui est nécessaire.
     - Le résultat est un vecteur 1D de caractéristiques représentant le contenu visuel de l'image.
+    - Optionnellement, les vecteurs sont conservés dans un cache disque adressé par contenu (cache.py) : une image déjà
+    vue avec la même configuration de modèle ne coûte alors qu'une lecture et un calcul d'empreinte. Sur demande, les
+    images décodées et redimensionnées y sont aussi conservées : changer de modèle n'oblige plus à les redécoder.
 
 Ce vecteur est ensuite utilisé pour la recherche de similarité. """
 
-import logging, torch, numpy as np
+import io, logging, torch, numpy as np
 from PIL import Image
 from torchvision.models import mobilenet_v3_large, MobileNet_V3_Large_Weights
 from torchvision.transforms import Compose, Resize, ToTensor, Normalize
 
-try:  # Tenter d'importer le module de prétraitement personnalisé
-    from image_preprocessing import preprocess_image
+try:  # Tenter d'importer le module de prétraitement personnalisé (depuis le paquet src, ou depuis le dossier src)
+    try:
+        from src.image_preprocessing import (preprocess_image, InvalidImageFormatError, BatchCollator,
+                                             TO_TENSOR_TRANSFORM)
+    except ImportError:
+        from image_preprocessing import (preprocess_image, InvalidImageFormatError, BatchCollator,
+                                         TO_TENSOR_TRANSFORM)
 except ImportError:
     preprocess_image = None
     logging.warning("Module de prétraitement d'image non trouvé. Utilisation d'un prétraitement minimal.")
 
+try:
+    from src.cache import DiskCache, cache_key, read_image_bytes
+    from src import metrics, profiling
+except ImportError:
+    from cache import DiskCache, cache_key, read_image_bytes
+    import metrics, profiling
+
 
 class FeatureExtractor:
     """ Extrait les caractéristiques d'une image avec MobileNetV3. """
 
-    def __init__(self, device: str = None, target_size: tuple[int, int] = (224, 224)):
+    def __init__(self, device: str = None, target_size: tuple[int, int] = (224, 224), cache: DiskCache = None,
+                 backbone: str = None, cache_tensors: bool = False):
         """ Initialise MobileNetV3 en mode évaluation et prépare le pipeline d'extraction des features.
         :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
-        :param target_size: Dimension d'entrée exigée par le modèle (largeur, hauteur). """
+        :param target_size: Dimension d'entrée exigée par le modèle (largeur, hauteur).
+        :param cache: Cache disque des vecteurs de caractéristiques (optionnel).
+        :param backbone: Réseau TorchScript exporté par src.bundle (optionnel) : il remplace la construction du modèle
+        torchvision et le chargement de ses poids, sans accès au réseau.
+        :param cache_tensors: Si True, le cache conserve aussi les images décodées et redimensionnées (pixels uint8,
+        150 Ko en 224x224), indépendantes du modèle : un changement de modèle ou de poids ne coûte alors plus que la
+        passe du modèle. Sans effet en l'absence du module image_preprocessing. """
 
         if device is None:  # Détermination automatique du device si non spécifié
             device = 'cuda' if torch.cuda.is_available() else 'cpu'
         self.device = device
-
-        weights = MobileNet_V3_Large_Weights.IMAGENET1K_V1  # Chargement du modèle MobileNetV3 pré-entraîné sur ImageNet
-        self.model = mobilenet_v3_large(weights=weights)
-        self.model.eval()  # Passage en mode évaluation (désactive dropout, etc.)
-        self.model.to(self.device)  # Déplacement du modèle sur le device approprié
         self.target_size = target_size
 
-        # On extrait uniquement les features en supprimant la couche de classification
-        self.feature_extractor = torch.nn.Sequential(
-            self.model.features,  # Convolutional backbone
-            self.model.avgpool,  # Global average pooling
-            torch.nn.Flatten()  # Mise à plat du tenseur pour obtenir un vecteur 1D
-        )
+        weights = MobileNet_V3_Large_Weights.IMAGENET1K_V1  # Chargement du modèle MobileNetV3 pré-entraîné sur ImageNet
+        if backbone is not None:
+            # Réseau déjà tronqué, enregistré avec la dimension de ses vecteurs
+            extra_files = {"feature_dim": ""}
+            with metrics.span("model_load"):
+                self.feature_extractor = torch.jit.load(str(backbone), map_location=self.device,
+                                                        _extra_files=extra_files)
+                self.feature_extractor.eval()
+            self.model = None
+            self.feature_dim = int(extra_files["feature_dim"])
+        else:
+            with metrics.span("model_load"):
+                self.model = mobilenet_v3_large(weights=weights)
+                self.model.eval()  # Passage en mode évaluation (désactive dropout, etc.)
+                self.model.to(self.device)  # Déplacement du modèle sur le device approprié
+
+            # On extrait uniquement les features en supprimant la couche de classification
+            self.feature_extractor = torch.nn.Sequential(
+                self.model.features,  # Convolutional backbone
+                self.model.avgpool,  # Global average pooling
+                torch.nn.Flatten()  # Mise à plat du tenseur pour obtenir un vecteur 1D
+            )
+            self.feature_dim = self.model.classifier[0].in_features  # Dimension des vecteurs produits (960)
+        self.collator = None  # Tampons de lots réutilisables, créés au premier appel à extract_features_batch
+
+        # Cache des vecteurs : la configuration décrit tout ce qui influe sur le résultat, et fait partie de la clé
+        self.cache = cache
+        self.cache_config = {"model": "mobilenet_v3_large", "weights": weights.name, "target_size": list(target_size),
+                             "preprocessing": "quality" if preprocess_image else "basic"}
+        # Les images prétraitées ne dépendent que du redimensionnement, pas du modèle
+        self.cache_tensors = cache_tensors
+        self.tensor_config = {"target_size": list(target_size), "preprocessing": "quality"}
 
         # Pipeline de prétraitement minimal en cas d'absence du module personnalisé
         self.basic_transform = Compose([
@@ -58,28 +101,150 @@ class FeatureExtractor:
 
     def extract_features(self, image_input, from_preprocessed: bool = False) -> np.ndarray:
         """ Extrait et retourne le vecteur de caractéristiques de l'image.
-        :param image_input: Chemin vers l'image ou objet PIL.Image.
+        :param image_input: Chemin vers l'image, octets (bytes, BytesIO, fichier téléversé), tableau NumPy uint8
+        ou objet PIL.Image. Les entrées en mémoire ne passent jamais par le disque.
         :param from_preprocessed: Si True, l'image est déjà sous forme de tensor.
-        :return: Vecteur 1D des caractéristiques en format numpy. """
+        :return: Vecteur 1D des caractéristiques en format numpy.
+        :raises ValueError: Si l'image est introuvable, illisible ou dans un format non supporté. """
+
+        key = None
+        if self.cache is not None and not from_preprocessed:
+            data = read_image_bytes(image_input)
+            if data is not None:  # Seules les entrées encodées (chemin, octets, fichier) ont une empreinte de contenu
+                key = cache_key(data, "features", self.cache_config)
+                cached_features = self.cache.get(key)
+                metrics.count("pixmatcher_cache_total", cache="features",
+                              result="miss" if cached_features is None else "hit")
+                if cached_features is not None:
+                    return cached_features
+                image_input = data  # Le contenu est déjà en mémoire : évite une seconde lecture du fichier
 
         if from_preprocessed:
             image_tensor = image_input  # L'image est supposée déjà prête à l'inférence
         else:
-            if preprocess_image:  # Utilisation du module personnalisé de prétraitement
-                image_tensor = preprocess_image(image_input, target_size=self.target_size, to_tensor=True)
-            else:  # Prétraitement minimal en cas d'absence du module dédié
-                try:
-                    image = Image.open(image_input).convert("RGB")
-                except Exception as e:
-                    raise ValueError(f"Erreur lors de l'ouverture de l'image {image_input}: {e}")
-                image_tensor = self.basic_transform(image)
+            with metrics.span("preprocess"):
+                if preprocess_image:  # Utilisation du module personnalisé de prétraitement
+                    try:
+                        if key is not None and self.cache_tensors:
+                            image_tensor = TO_TENSOR_TRANSFORM(self.decode(image_input))
+                        else:
+                            image_tensor = preprocess_image(image_input, target_size=self.target_size, to_tensor=True)
+                    except (FileNotFoundError, InvalidImageFormatError) as e:
+                        raise ValueError(f"Erreur lors de l'ouverture de l'image : {e}") from e
+                else:  # Prétraitement minimal en cas d'absence du module dédié
+                    image_tensor = self.basic_preprocess(image_input)
 
         if image_tensor.ndim == 3:  # Si l'image est un tensor 3D (C, H, W), ajoute une dimension batch
             image_tensor = image_tensor.unsqueeze(0)  # Ajoute une dimension en début de tensor pour simuler un batch
 
-        image_tensor = image_tensor.to(self.device)  # Déplace le tensor vers le périphérique spécifié (GPU ou CPU)
-
-        with torch.no_grad():  # Désactive le calcul des gradients pour l'inférence (optimise la mémoire et les calculs)
-            features = self.feature_extractor(image_tensor)  # Extraction des caractéristiques via le modèle MobileNetV3
-
-        return features.cpu().numpy().flatten()  # Convertit les caractéristiques en numpy array 1D et les retourne
+        features = self.forward_batch(image_tensor).flatten()  # Vecteur 1D des caractéristiques
+        if key is not None:
+            self.cache.put(key, features)
+        return features
+
+    def decode(self, data: bytes) -> np.ndarray:
+        """ Décode et redimensionne une image encodée, en consultant d'abord le cache des images prétraitées.
+        :param data: Contenu encodé de l'image.
+        :return: Pixels uint8 (H, W, 3) de l'image redimensionnée.
+        :raises FileNotFoundError, InvalidImageFormatError, ValueError: Voir preprocess_image. """
+
+        key = cache_key(data, "tensor", self.tensor_config)
+        pixels = self.cache.get(key)
+        metrics.count("pixmatcher_cache_total", cache="tensor", result="miss" if pixels is None else "hit")
+        if pixels is None:
+            pixels = np.asarray(preprocess_image(data, target_size=self.target_size, to_tensor=False))
+            self.cache.put(key, pixels)
+        return pixels
+
+    def basic_preprocess(self, image_input) -> torch.Tensor:
+        """ Prétraitement minimal (torchvision), utilisé en l'absence du module image_preprocessing.
+        :param image_input: Chemin, octets, objet fichier, tableau NumPy ou PIL.Image.
+        :return: Tenseur (3, H, W) normalisé.
+        :raises ValueError: Si l'image ne peut pas être ouverte. """
+
+        try:
+            if isinstance(image_input, (bytes, bytearray, memoryview)):
+                image_input = io.BytesIO(image_input)
+            if isinstance(image_input, np.ndarray):
+                image = Image.fromarray(image_input).convert("RGB")
+            elif isinstance(image_input, Image.Image):
+                image = image_input.convert("RGB")
+            else:
+                image = Image.open(image_input).convert("RGB")
+        except Exception as e:
+            raise ValueError(f"Erreur lors de l'ouverture de l'image {image_input}: {e}")
+        return self.basic_transform(image)
+
+    def forward_batch(self, batch_tensor: torch.Tensor) -> np.ndarray:
+        """ Calcule les caractéristiques d'un lot d'images déjà prétraitées.
+        :param batch_tensor: Tenseur (N, 3, H, W) normalisé.
+        :return: Matrice numpy (N, feature_dim) des caractéristiques. """
+
+        # Déplace le tensor vers le périphérique spécifié (GPU ou CPU), de façon asynchrone si la mémoire est épinglée
+        batch_tensor = batch_tensor.to(self.device, non_blocking=True)
+
+        # Pas de gradients pour l'inférence (mémoire et calculs) ; trace torch.profiler si la requête est profilée
+        with metrics.span("forward"), profiling.model_profile("mobilenet"), torch.no_grad():
+            features = self.feature_extractor(batch_tensor)  # Extraction des caractéristiques via le modèle MobileNetV3
+            features = features.cpu().numpy()  # Dans le bloc mesuré : attend la fin du calcul sur GPU
+
+        return features
+
+    def extract_features_batch(self, image_inputs, batch_size: int = 32) -> np.ndarray:
+        """ Extrait les vecteurs de caractéristiques d'une liste d'images, par lots.
+        Les images sont décodées dans des tampons réutilisés et normalisées par lot (voir BatchCollator), sans
+        allocation ni concaténation par image. Avec un cache, seules les images absentes du cache passent par le modèle.
+        :param image_inputs: Liste d'entrées acceptées par extract_features.
+        :param batch_size: Nombre d'images par passe du modèle.
+        :return: Matrice numpy (N, feature_dim) des caractéristiques, dans l'ordre des entrées.
+        :raises ValueError: Si une image est introuvable, illisible ou dans un format non supporté. """
+
+        features = np.empty((len(image_inputs), self.feature_dim), dtype=np.float32)
+        if preprocess_image and (self.collator is None or self.collator.batch_size != batch_size):
+            self.collator = BatchCollator(batch_size, target_size=self.target_size,
+                                          pin_memory=self.device.startswith('cuda'))
+
+        # Consultation du cache : pending contient les positions des images qui restent à calculer
+        image_inputs = list(image_inputs)
+        keys = [None] * len(image_inputs)
+        pending = []
+        for i, image_input in enumerate(image_inputs):
+            data = read_image_bytes(image_input) if self.cache is not None else None
+            if data is not None:
+                keys[i] = cache_key(data, "features", self.cache_config)
+                cached_features = self.cache.get(keys[i])
+                metrics.count("pixmatcher_cache_total", cache="features",
+                              result="miss" if cached_features is None else "hit")
+                if cached_features is not None:
+                    features[i] = cached_features
+                    continue
+                image_inputs[i] = data  # Évite une seconde lecture du fichier
+            pending.append(i)
+
+        for start in range(0, len(pending), batch_size):
+            batch_positions = pending[start:start + batch_size]
+            batch_inputs = [image_inputs[i] for i in batch_positions]
+            metrics.observe_size("pixmatcher_batch_size", len(batch_inputs), stage="forward")
+            with metrics.span("preprocess"):
+                if preprocess_image:
+                    try:
+                        if self.cache is not None and self.cache_tensors:
+                            for position, i in enumerate(batch_positions):
+                                if keys[i] is None:  # Entrée sans empreinte (PIL.Image, tableau) : pas de cache
+                                    self.collator.put(position, image_inputs[i])
+                                else:
+                                    pixels = torch.from_numpy(self.decode(image_inputs[i]))
+                                    self.collator.uint8_buffer[position].copy_(pixels.permute(2, 0, 1))
+                            batch_tensor = self.collator.normalize(len(batch_positions))
+                        else:
+                            batch_tensor = self.collator.collate(batch_inputs)
+                    except (FileNotFoundError, InvalidImageFormatError) as e:
+                        raise ValueError(f"Erreur lors de l'ouverture de l'image : {e}") from e
+                else:  # Prétraitement minimal image par image en cas d'absence du module dédié
+                    batch_tensor = torch.stack([self.basic_preprocess(image_input) for image_input in batch_inputs])
+            features[batch_positions] = self.forward_batch(batch_tensor)
+            for i in batch_positions:
+                if keys[i] is not None:
+                    self.cache.put(keys[i], features[i])
+
+        return features
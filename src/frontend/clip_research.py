@@ -3,10 +3,17 @@ et la recherche s'effectue. """
 
 import streamlit as st
 from PIL import Image
-import requests
-from io import BytesIO
-from src.clip_similarity_search import (oi_find_similar_images, oi_get_image_path, ti_find_similar_images,
-                                        ti_get_image_path)
+from src.image_fetcher import fetch_thumbnails
+from src.pagination import open_cursor
+from src.service import MAX_K, SEARCH_URL, SearchClient
+from src.clip_similarity_search import (oi_get_image_path, oi_search_vector, text_to_vector, ti_get_image_path,
+                                        ti_get_thumbnail, ti_search_vector)
+
+# Nombre d'images par page de résultats
+PAGE_SIZE = 10
+
+# Client du service de recherche, si PIXMATCHER_SEARCH_URL est définie
+search_client = SearchClient() if SEARCH_URL else None
 
 
 def main():
@@ -123,35 +130,54 @@ def main():
 
     query = st.text_input("", placeholder="Enter description here")
     if st.button("Research"):
+        st.session_state.tbir_query = query  # Conservée pour les pages suivantes (« Load more » relance la page)
+    if st.session_state.get("tbir_query") is not None:
+        query = st.session_state.tbir_query
         try:
+            def make_search():
+                """ Encode le texte une seule fois ; les pages suivantes réutilisent le vecteur. """
+                if search_client is not None:  # Recherche confiée au service HTTP (voir src.service)
+                    dataset = "open-images" if selected_dataset == "Open Images" else "tiny-imagenet"
+                    return lambda k: [result["id"] for result in
+                                      search_client.search_text(query, dataset, min(k, MAX_K))]
+                query_vector = text_to_vector(query)
+                search = oi_search_vector if selected_dataset == "Open Images" else ti_search_vector
+                return lambda k: search(query_vector, k)
+
+            # Résultats servis par pages depuis les candidats du curseur, sans nouvel encodage
+            cursor = open_cursor(st.session_state, "tbir_cursor", f"{selected_dataset}-{query}", make_search, PAGE_SIZE)
+            pages = st.session_state.tbir_cursor["pages"]
+            top_indices = [index for number in range(pages) for index in cursor.page(number)]
+
             if selected_dataset == "Open Images":
-                top_indices = oi_find_similar_images(query)
                 st.subheader("Assimilated images")
                 cols = st.columns(5)  # Affichage en 5 colonnes
 
-                for i, idx in enumerate(top_indices):
-                    img_url = oi_get_image_path(idx)
-
-                    if img_url:  # Charger l'image depuis une URL AWS
-                        response = requests.get(img_url)
-                        img = Image.open(BytesIO(response.content)).convert('RGB')
+                # Charger les images depuis le cache disque, ou depuis AWS, toutes en parallèle
+                images = fetch_thumbnails([oi_get_image_path(idx) for idx in top_indices])
 
+                for i, (idx, img) in enumerate(zip(top_indices, images)):
+                    if not isinstance(img, Exception):
                         with cols[i % 5]:
                             st.image(img, caption=f"Image {i + 1}", use_container_width=True)
                     else:
                         st.error(f"Impossible de récupérer l'image pour l'index {idx}")
 
             if selected_dataset == "Tiny ImageNet":
-                top_indices = ti_find_similar_images(query)
                 st.subheader("Assimilated images")
                 cols = st.columns(5)  # Affichage des images en ligne
 
                 for i, idx in enumerate(top_indices):
-                    img_path = ti_get_image_path(idx)
-                    image = Image.open(img_path)
+                    image = ti_get_thumbnail(idx)  # Vignette lue dans l'atlas, s'il a été produit
+                    if image is None:
+                        image = Image.open(ti_get_image_path(idx))
                     with cols[i % 5]:
                         st.image(image, caption=f"Image {i + 1}", use_container_width=True)
 
+            if cursor.has_more(pages - 1) and st.button("Load more"):
+                st.session_state.tbir_cursor["pages"] += 1
+                st.rerun()
+
         except Exception as e:
             st.error(f"Erreur lors de la recherche : {e}")
 
@@ -8,6 +8,7 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 import streamlit as st
 
 from streamlit_option_menu import option_menu
+from src import metrics, profiling
 
 st.set_page_config(page_title="PixMatcher App", layout="wide")
 st.markdown(
@@ -27,6 +28,9 @@ st.markdown(
 
 st.title("Welcome to the PixMatcher app")
 
+# Export local des métriques (/metrics), si PIXMATCHER_METRICS_PORT est définie
+metrics.start_metrics_server()
+
 # Menu de navigation dans la barre latérale
 with st.sidebar:
     page = option_menu(
@@ -37,16 +41,19 @@ with st.sidebar:
         default_index=0,
     )
 # Charger et exécuter la page sélectionnée correct
-if page == "Search via Image":
-    import research
-    research.main()  # Appelle la fonction main() correctement
-elif page == "Search via Text":
-    import clip_research
-    clip_research.main()
-elif page == "Visualization":
-    import visualization
-    visualization.main()
-elif page == "About":
-    import about
-    about.main()
+# Chaque exécution d'une page est une requête : durées de ses étapes (voir src.metrics), et profil si l'URL contient
+# ?profile=1 (voir src.profiling)
+with metrics.request(page), profiling.profile(page, enabled=st.query_params.get("profile") == "1"):
+    if page == "Search via Image":
+        import research
+        research.main()  # Appelle la fonction main() correctement
+    elif page == "Search via Text":
+        import clip_research
+        clip_research.main()
+    elif page == "Visualization":
+        import visualization
+        visualization.main()
+    elif page == "About":
+        import about
+        about.main()
 
@@ -1,13 +1,27 @@
 """ Page de recherche CBIR. C'est la page sur laquelle l'on atterrit lorsqu'on lance le site. Après une présentation
 du CBIR et un choix du dataset, l'utilisateur transmet son image et la recherche de similarité s'effectue. """
 
-import streamlit as st, tempfile, os, traceback, requests
-from io import BytesIO
+import streamlit as st, os, tempfile, traceback
 from PIL import Image
+from src import metrics
+from src.bulk_query import bulk_query
+from src.cache import content_hash
 from src.image_preprocessing import preprocess_image
+from src.image_fetcher import fetch_thumbnails
 from src.feature_extractor import FeatureExtractor
+from src.pagination import open_cursor
+from src.service import MAX_K, SEARCH_URL, SearchClient
 from src.similarity_search import (oi_find_top_similar_images, oi_get_image_path, ti_find_top_similar_images,
-                                   ti_get_image_path)
+                                   ti_get_image_path, ti_get_thumbnail)
+
+# Nombre d'images par page de résultats
+PAGE_SIZE = 12
+
+# Client du service de recherche, si PIXMATCHER_SEARCH_URL est définie
+search_client = SearchClient() if SEARCH_URL else None
+
+# Processus de décodage des archives de la recherche en masse
+BULK_WORKERS = 2
 
 
 def main():
@@ -166,51 +180,63 @@ def main():
         image = Image.open(st.session_state.uploaded_image)
         st.image(image, width=300)
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix="." + uploaded_image.name.split('.')[-1]) as tmp_file:
-                tmp_file.write(uploaded_image.getvalue())
-                tmp_file_path = tmp_file.name
+            # L'image téléversée est prétraitée directement depuis la mémoire, sans fichier temporaire
+            image_bytes = st.session_state.uploaded_image.getvalue()
 
-            if selected_dataset == "Open Images":
-                processed_image = preprocess_image(tmp_file_path, target_size=(224, 224), to_tensor=True)
+            def make_search():
+                """ Encode l'image une seule fois ; les pages suivantes réutilisent le vecteur. """
+                if search_client is not None:  # Recherche confiée au service HTTP (voir src.service)
+                    dataset = "open-images" if selected_dataset == "Open Images" else "tiny-imagenet"
+                    return lambda k: [(result["id"], result["distance"]) for result in
+                                      search_client.search_image(image_bytes, dataset, min(k, MAX_K))]
+                with metrics.span("preprocess"):
+                    processed_image = preprocess_image(image_bytes, target_size=(224, 224), to_tensor=True)
                 extractor = FeatureExtractor()
                 features = extractor.extract_features(processed_image, from_preprocessed=True)
-                top = oi_find_top_similar_images(features, 12)
+                find = oi_find_top_similar_images if selected_dataset == "Open Images" else ti_find_top_similar_images
+                # FAISS complète par -1 lorsque k dépasse la taille de la collection
+                return lambda k: [(index, distance) for index, distance in find(features, k) if index >= 0]
+
+            # Résultats servis par pages depuis les candidats du curseur, sans nouvelle inférence
+            cursor = open_cursor(st.session_state, "cbir_cursor", f"{selected_dataset}-{content_hash(image_bytes)}",
+                                 make_search, PAGE_SIZE)
+            pages = st.session_state.cbir_cursor["pages"]
+            top = [result for number in range(pages) for result in cursor.page(number)]
 
+            if selected_dataset == "Open Images":
                 st.markdown('<h2 class="subtitle">Assimilated images</h2>', unsafe_allow_html=True)
                 cols = st.columns(3)
 
-                for i, (index, distance) in enumerate(top):
+                # Vignettes servies par le cache disque, les autres téléchargées toutes en parallèle
+                image_urls = [oi_get_image_path(index) for index, _ in top]
+                similar_images = fetch_thumbnails(image_urls)
 
-                    image_url = oi_get_image_path(index)
-                    try:
-                        response = requests.get(image_url)
-                        response.raise_for_status()  # vérifier que la requête a réussi
-                        similar_image = Image.open(BytesIO(response.content)).convert("RGB")
-                        with cols[i % 3]:
-                            st.markdown('<div class="similar-image-container">', unsafe_allow_html=True)
-                            st.image(similar_image, use_container_width=True)
-                            st.markdown(
-                                f'<p style="text-align: center; color: black;">Image {i} - Distance: {distance:.4f}</p>',
-                                unsafe_allow_html=True)
-                            st.markdown('</div>', unsafe_allow_html=True)
-                    except Exception as e:
-                        st.error(f"Erreur lors du chargement de l'image {image_url}: {e}")
+                for i, ((index, distance), image_url, similar_image) in enumerate(zip(top, image_urls,
+                                                                                       similar_images)):
+                    if isinstance(similar_image, Exception):
+                        st.error(f"Erreur lors du chargement de l'image {image_url}: {similar_image}")
+                        continue
+                    with cols[i % 3]:
+                        st.markdown('<div class="similar-image-container">', unsafe_allow_html=True)
+                        st.image(similar_image, use_container_width=True)
+                        st.markdown(
+                            f'<p style="text-align: center; color: black;">Image {i} - Distance: {distance:.4f}</p>',
+                            unsafe_allow_html=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
 
             if selected_dataset == "Tiny ImageNet":
-                processed_image = preprocess_image(tmp_file_path, target_size=(224, 224), to_tensor=True)
-                extractor = FeatureExtractor()
-                features = extractor.extract_features(processed_image, from_preprocessed=True)
-                top = ti_find_top_similar_images(features, 12)
-
-
                 st.markdown('<h2 class="subtitle">Assimilated images</h2>', unsafe_allow_html=True)
                 cols = st.columns(3)
 
                 for i, (index, distance) in enumerate(top):
 
-                    image_path = ti_get_image_path(index)
-                    if os.path.exists(image_path):
-                        similar_image = Image.open(image_path).convert("RGB")
+                    # Vignette lue dans l'atlas si l'indexation l'a produit, sinon fichier JPEG du dataset
+                    similar_image = ti_get_thumbnail(index)
+                    if similar_image is None:
+                        image_path = ti_get_image_path(index)
+                        if os.path.exists(image_path):
+                            similar_image = Image.open(image_path).convert("RGB")
+                    if similar_image is not None:
                         with cols[i % 3]:
                             st.markdown('<div class="similar-image-container">', unsafe_allow_html=True)
                             st.image(similar_image, use_container_width=True)
@@ -221,15 +247,38 @@ def main():
                     else:
                         st.write(f"Image non trouvée : {image_path}")
 
+            if cursor.has_more(pages - 1) and st.button("Load more"):
+                st.session_state.cbir_cursor["pages"] += 1
+                st.rerun()
+
         except Exception as e:
             st.error(f"Erreur lors du traitement de l'image : {e}")
             st.text(traceback.format_exc())
-        finally:
-            if os.path.exists(tmp_file_path):
-                os.remove(tmp_file_path)
 
     st.markdown('</div>', unsafe_allow_html=True)
 
+    # Recherche en masse : une archive d'images, un fichier CSV des plus proches voisins de chacune
+    with st.expander("Bulk query (zip / tar archive of images)"):
+        archive = st.file_uploader("Archive", type=["zip", "tar", "gz", "tgz"], key="bulk_archive")
+        if archive is not None and st.button("Run bulk query"):
+            dataset = "open-images" if selected_dataset == "Open Images" else "tiny-imagenet"
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                archive_path = os.path.join(tmp_dir, archive.name)
+                with open(archive_path, "wb") as f:
+                    f.write(archive.getvalue())
+                output_path = os.path.join(tmp_dir, "results.csv")
+                status = st.empty()
+                try:
+                    counts = bulk_query(archive_path, output_path, dataset=dataset, k=PAGE_SIZE,
+                                        workers=BULK_WORKERS, progress=lambda done: status.text(f"{done} images"))
+                except Exception as e:
+                    st.error(f"Erreur lors de la recherche en masse : {e}")
+                else:
+                    status.text(f"{counts['queries']} images traitées, {counts['failed']} en erreur")
+                    with open(output_path, "rb") as f:
+                        st.download_button("Download results (CSV)", f.read(), file_name="results.csv",
+                                           mime="text/csv")
+
 
 # Lancer la page
 if __name__ == "__main__":
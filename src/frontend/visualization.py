@@ -1,8 +1,41 @@
-import streamlit as st
-from PIL import Image
-import os
-import numpy as np
+""" Page de visualisation des embeddings. Elle affiche la projection 2D (t-SNE) d'une collection, calculée hors ligne
+par python -m src.projection : la page ne fait que lire le fichier de projection et dessiner un nombre borné de points
+(niveau de détail), ce qui la rend instantanée quelle que soit la taille de la collection. """
+
+import streamlit as st, io, os, numpy as np, matplotlib
+matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+from src.projection import COLLECTIONS, collection_files, load_projection
+
+# Nombre de points dessinés par défaut, et bornes du réglage du niveau de détail
+DEFAULT_MAX_POINTS = 20000
+MIN_POINTS = 1000
+
+
+@st.cache_data(show_spinner=False)
+def render_projection(path: str, mtime: float, max_points: int) -> tuple[bytes, int, int]:
+    """ Dessine les premiers points d'une projection (sous-échantillon uniforme), colorés par catégorie.
+    :param path: Fichier de projection.
+    :param mtime: Date de modification du fichier (invalide le cache de Streamlit après un nouveau calcul).
+    :param max_points: Nombre maximal de points dessinés.
+    :return: Tuple (image PNG, nombre de points dessinés, nombre total de points). """
+
+    projection = load_projection(path, max_points)
+    coordinates, categories = projection["coordinates"], projection["categories"]
+    fig, ax = plt.subplots(figsize=(8, 8))
+    if categories is not None:
+        _, colors = np.unique(categories, return_inverse=True)
+        ax.scatter(coordinates[:, 0], coordinates[:, 1], c=colors % 20, cmap="tab20", s=2, alpha=0.6, linewidths=0)
+    else:
+        ax.scatter(coordinates[:, 0], coordinates[:, 1], s=2, alpha=0.6, linewidths=0)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=100, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue(), len(coordinates), projection["total"]
+
+
 def main():
 
     st.markdown("""
@@ -20,47 +53,28 @@ def main():
             max-width: 800px;
             margin: auto;
         }
-        .stButton>button {
-            background-color: #4CAF50;
-            color: white;
-            padding: 10px 24px;
-            border-radius: 8px;
-            cursor: pointer;
-        }
-        .stButton>button:hover {
-            background-color: #45a049;
-        }
     </style>
     """, unsafe_allow_html=True)
     st.markdown('<h2 class="subtitle">Visualizing Embeddings with t-SNE</h2>', unsafe_allow_html=True)
     st.markdown("""<p style="color: black; font-size: 16px;">
-                Explore the spatial distribution of embeddings using the t-SNE (t-distributed Stochastic Neighbor 
-                Embedding) method. This projection allows you to intuitively visualize the similarities between 
+                Explore the spatial distribution of embeddings using the t-SNE (t-distributed Stochastic Neighbor
+                Embedding) method. This projection allows you to intuitively visualize the similarities between
                 different visual representations.</p>""", unsafe_allow_html=True)
 
-    # Régénérer la visualisation t-SNE
-    if st.button("🔄 Regenerate t-SNE visualization"):
-        x = np.random.randn(100)
-        y = np.random.randn(100)
-        fig, ax = plt.subplots()
-        ax.scatter(x, y, alpha=0.6)
-        st.session_state.tsne_data = fig
-        st.success("Visualization successfully regenerated!")
-    # Vérifier si la visualisation t-SNE est déjà stockée en session
-    if "tsne_data" not in st.session_state:
-        x = np.random.randn(100)
-        y = np.random.randn(100)
-        fig, ax = plt.subplots()
-        ax.scatter(x, y, alpha=0.6)
-        st.session_state.tsne_data = fig
-    # Afficher l’image de t-SNE stockée
-    st.pyplot(st.session_state.tsne_data)
-    # Charger et afficher l'image générée
-    image_path = os.path.join("ressources", "tsne_plot.png")
-    if os.path.exists(image_path):
-        st.image(Image.open(image_path), caption="Projection t-SNE", use_container_width=True)
-    else:
-        st.error("L'image t-SNE n'a pas été trouvée.")
+    # Seules les collections dont la projection a été calculée sont proposées
+    available = [name for name in COLLECTIONS if collection_files(name)["projection"].exists()]
+    if not available:
+        st.error("Aucune projection trouvée. Lancer d'abord : python -m src.projection")
+        return
+    name = st.selectbox("Collection", available)
+    path = collection_files(name)["projection"]
+
+    # Niveau de détail : les points sont stockés dans un ordre aléatoire, les N premiers forment un sous-échantillon
+    max_points = st.select_slider("Points displayed", options=[MIN_POINTS, 5000, DEFAULT_MAX_POINTS, 50000, 100000],
+                                  value=DEFAULT_MAX_POINTS)
+    image, shown, total = render_projection(str(path), os.path.getmtime(path), max_points)
+    st.image(image, caption=f"Projection t-SNE : {shown} points sur {total}", use_container_width=True)
+
     # Informations supplémentaires
     with st.expander("Learn more about t-SNE"):
         st.markdown("""
@@ -0,0 +1,249 @@
+""" Module de téléchargement des images de résultats (Open Images, hébergées sur S3).
+
+Les pages de recherche affichent une grille de 10 à 12 images distantes. Ce module les récupère toutes en parallèle,
+pour que le temps d'affichage de la page soit proche de celui du téléchargement le plus lent plutôt que de leur somme :
+
+    - Une session HTTP unique (requests.Session), partagée par toutes les recherches, réutilise les connexions
+    (keep-alive) au lieu d'ouvrir une connexion par image.
+    - Un pool de threads, lui aussi partagé, lance les requêtes simultanément, chacune avec son propre délai maximal.
+    - Les images ne sont décodées qu'à la taille d'une vignette (mode draft de Pillow pour les JPEG), ce qui évite de
+    décoder des photos pleine résolution pour les afficher sur quelques centaines de pixels.
+    - Les vignettes sont conservées sur disque (cache.DiskCache, partagé entre processus Streamlit), par URL d'image
+    (et non par numéro de ligne, qui change à chaque ingestion) : un résultat déjà affiché ne repasse plus par le
+    réseau. Les URLs affichées sont comptées dans un journal borné, ce qui permet de préremplir le cache avec les
+    résultats les plus fréquents (python -m src.image_fetcher --warm N). """
+
+import argparse, io, logging, os, threading, requests
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+from requests.adapters import HTTPAdapter
+from src import metrics
+from src.cache import DEFAULT_CACHE_DIR, DiskCache, atomic_write_bytes, content_hash
+from src.image_preprocessing import open_image
+
+# Nombre maximal de téléchargements simultanés (et de connexions conservées par la session)
+MAX_WORKERS = 16
+
+# Délais maximaux (en secondes) d'établissement de la connexion et de réception de la réponse
+FETCH_TIMEOUT = (3.05, 10)
+
+# Taille maximale des vignettes affichées dans les grilles de résultats
+THUMBNAIL_SIZE = (400, 400)
+
+# Dossier, taille maximale (en octets), format et qualité des vignettes conservées sur disque
+THUMBNAIL_CACHE_DIR = Path(os.environ.get("PIXMATCHER_THUMBNAIL_DIR", DEFAULT_CACHE_DIR / "thumbnails"))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get("PIXMATCHER_THUMBNAIL_MAX_BYTES", 512 * 1024 ** 2))
+THUMBNAIL_FORMAT = "JPEG"
+THUMBNAIL_QUALITY = 85
+
+# Journal des URLs affichées (lignes "nombre d'affichages<TAB>URL"), dans le dossier des vignettes
+POPULARITY_LOG = "popularity.log"
+
+# Taille (en octets) au-delà de laquelle le journal est compacté en un compte par URL, limité aux
+# POPULARITY_MAX_ENTRIES URLs les plus affichées
+POPULARITY_LOG_MAX_BYTES = 1024 ** 2
+POPULARITY_MAX_ENTRIES = 10000
+
+# Session et pool de threads partagés, créés au premier téléchargement
+session = None
+pool = None
+thumbnail_cache = None
+init_lock = threading.Lock()  # Streamlit exécute les pages de plusieurs utilisateurs dans des threads distincts
+
+
+def get_session() -> requests.Session:
+    """ Retourne la session HTTP partagée, en la créant au premier appel. """
+
+    global session, pool
+    with init_lock:
+        if session is None:
+            pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="image_fetcher")
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+    return session
+
+
+def make_thumbnail(data: bytes, size: tuple[int, int] = THUMBNAIL_SIZE) -> Image.Image:
+    """ Décode une image directement à la taille d'une vignette.
+    :param data: Octets bruts de l'image.
+    :param size: Taille maximale de la vignette (les proportions sont conservées).
+    :return: Vignette RGB.
+    :raises InvalidImageFormatError: Si le contenu n'est pas une image supportée. """
+
+    image = open_image(data)
+    image.draft('RGB', size)  # Pour les JPEG : décodage réduit, à une taille supérieure ou égale à la vignette
+    image = image.convert('RGB')
+    image.thumbnail(size, Image.BILINEAR)
+    return image
+
+
+def fetch_image(url: str, size: tuple[int, int] = THUMBNAIL_SIZE, timeout=FETCH_TIMEOUT) -> Image.Image:
+    """ Télécharge une image et la décode en vignette.
+    :param url: URL de l'image.
+    :param size: Taille maximale de la vignette.
+    :param timeout: Délai maximal de la requête (voir FETCH_TIMEOUT).
+    :return: Vignette RGB.
+    :raises ValueError: Si l'URL est absente.
+    :raises requests.RequestException: En cas d'erreur réseau ou HTTP. """
+
+    if not url:
+        raise ValueError("URL de l'image introuvable")
+    response = get_session().get(url, timeout=timeout)
+    response.raise_for_status()  # Vérifier que la requête a réussi
+    return make_thumbnail(response.content, size)
+
+
+def fetch_images(urls: list[str], size: tuple[int, int] = THUMBNAIL_SIZE, timeout=FETCH_TIMEOUT) -> list:
+    """ Télécharge plusieurs images en parallèle et les décode en vignettes.
+    :param urls: URLs des images (None pour une image introuvable).
+    :param size: Taille maximale des vignettes.
+    :param timeout: Délai maximal de chaque requête (voir FETCH_TIMEOUT).
+    :return: Liste, dans l'ordre des URLs, des vignettes ou de l'exception rencontrée pour chaque image. """
+
+    get_session()
+    futures = [pool.submit(fetch_image, url, size, timeout) for url in urls]
+    results = []
+    for url, future in zip(urls, futures):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logging.warning(f"Erreur lors du chargement de l'image {url}: {e}")
+            results.append(e)
+    return results
+
+
+def get_thumbnail_cache() -> DiskCache:
+    """ Retourne le cache disque des vignettes partagé, en le créant au premier appel. """
+
+    global thumbnail_cache
+    with init_lock:
+        if thumbnail_cache is None:
+            thumbnail_cache = DiskCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES,
+                                        suffix=f".{THUMBNAIL_FORMAT.lower()}")
+    return thumbnail_cache
+
+
+def thumbnail_key(url: str, size: tuple[int, int] = THUMBNAIL_SIZE) -> str:
+    """ Construit la clé d'une vignette : empreinte de l'URL de l'image et taille maximale. L'URL désigne l'objet
+    stocké, alors que le numéro de ligne d'une image change lorsque la collection est ré-ingérée. L'empreinte vient
+    en tête : le cache répartit ses fichiers en sous-dossiers selon les premiers caractères de la clé. """
+
+    return f"{content_hash(url.encode())}-oi-{size[0]}x{size[1]}"
+
+
+def read_popularity(cache: DiskCache) -> Counter:
+    """ Lit le journal de popularité : nombre d'affichages de chaque URL. """
+
+    counter = Counter()
+    try:
+        with open(cache.directory / POPULARITY_LOG) as f:
+            for line in f:
+                count, _, url = line.rstrip("\n").partition("\t")
+                if url and count.isdigit():  # Ligne partielle (écriture interrompue) ignorée
+                    counter[url] += int(count)
+    except FileNotFoundError:
+        pass
+    return counter
+
+
+def record_popularity(urls, cache: DiskCache):
+    """ Ajoute des URLs affichées au journal de popularité, puis le compacte s'il dépasse POPULARITY_LOG_MAX_BYTES.
+    Une seule écriture en mode ajout : les lignes de plusieurs processus ne s'entremêlent pas. """
+
+    line = "".join(f"1\t{url}\n" for url in urls if url).encode()
+    fd = os.open(cache.directory / POPULARITY_LOG, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+        size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+    if size > POPULARITY_LOG_MAX_BYTES:
+        compact_popularity(cache)
+
+
+def compact_popularity(cache: DiskCache):
+    """ Remplace le journal de popularité par une ligne par URL (nombre total d'affichages), pour les
+    POPULARITY_MAX_ENTRIES URLs les plus affichées. Les affichages journalisés par un autre processus pendant le
+    compactage peuvent être perdus, ce qui est sans conséquence pour un simple classement. """
+
+    counter = read_popularity(cache)
+    lines = "".join(f"{count}\t{url}\n" for url, count in counter.most_common(POPULARITY_MAX_ENTRIES))
+    atomic_write_bytes(cache.directory / POPULARITY_LOG, lines.encode())
+
+
+def most_popular(count: int, cache: DiskCache) -> list[str]:
+    """ Retourne les URLs les plus souvent affichées, d'après le journal de popularité.
+    :param count: Nombre d'URLs.
+    :param cache: Cache des vignettes.
+    :return: URLs, de la plus fréquente à la moins fréquente. """
+
+    return [url for url, _ in read_popularity(cache).most_common(count)]
+
+
+def fetch_thumbnails(urls: list[str], size: tuple[int, int] = THUMBNAIL_SIZE, timeout=FETCH_TIMEOUT,
+                     cache: DiskCache = None, record: bool = True) -> list:
+    """ Retourne les vignettes d'images, depuis le cache disque lorsque c'est possible, sinon en les téléchargeant en
+    parallèle (voir fetch_images) puis en les ajoutant au cache.
+    :param urls: URLs des images (None pour une image introuvable).
+    :param size: Taille maximale des vignettes.
+    :param timeout: Délai maximal de chaque requête (voir FETCH_TIMEOUT).
+    :param cache: Cache des vignettes (par défaut, voir get_thumbnail_cache).
+    :param record: Si True, les URLs sont ajoutées au journal de popularité.
+    :return: Liste, dans l'ordre, des vignettes ou de l'exception rencontrée pour chaque image. """
+
+    cache = cache or get_thumbnail_cache()
+    if record:
+        record_popularity(urls, cache)
+
+    results = [None] * len(urls)
+    missing = []
+    for i, url in enumerate(urls):
+        data = cache.get_bytes(thumbnail_key(url, size)) if url else None
+        if data is not None:
+            results[i] = Image.open(io.BytesIO(data))  # Vignette déjà réduite : ni réseau, ni décodage pleine taille
+        else:
+            missing.append(i)
+    metrics.count("pixmatcher_cache_total", len(urls) - len(missing), cache="thumbnails", result="hit")
+    metrics.count("pixmatcher_cache_total", len(missing), cache="thumbnails", result="miss")
+
+    with metrics.span("thumbnail_fetch"):
+        fetched = fetch_images([urls[i] for i in missing], size, timeout)
+    for i, thumbnail in zip(missing, fetched):
+        results[i] = thumbnail
+        if isinstance(thumbnail, Exception):
+            metrics.count("pixmatcher_errors_total", stage="thumbnail_fetch")
+        else:
+            buffer = io.BytesIO()
+            thumbnail.save(buffer, format=THUMBNAIL_FORMAT, quality=THUMBNAIL_QUALITY)
+            cache.put_bytes(thumbnail_key(urls[i], size), buffer.getvalue())
+    return results
+
+
+def warm_thumbnails(count: int, size: tuple[int, int] = THUMBNAIL_SIZE, cache: DiskCache = None) -> int:
+    """ Préremplit le cache avec les vignettes des images les plus souvent affichées.
+    :param count: Nombre d'images les plus populaires à garantir dans le cache.
+    :param size: Taille maximale des vignettes.
+    :param cache: Cache des vignettes (par défaut, voir get_thumbnail_cache).
+    :return: Nombre de vignettes téléchargées. """
+
+    cache = cache or get_thumbnail_cache()
+    missing = [url for url in most_popular(count, cache) if not cache.path_for(thumbnail_key(url, size)).exists()]
+    results = fetch_thumbnails(missing, size, cache=cache, record=False)
+    return sum(not isinstance(result, Exception) for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Préremplissage du cache des vignettes Open Images.")
+    parser.add_argument("--warm", type=int, required=True, help="Nombre d'images les plus affichées à précharger")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    print(f"{warm_thumbnails(args.warm)} vignettes téléchargées.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,24 @@
 Ce module fournit une fonction principale, preprocess_image, utilisée pour préparer des images
 avant leur passage dans MobileNetV3, le CNN utilisé. Il prend en charge les étapes suivantes :
 
-  - Vérifie que le fichier existe et que son extension est parmi les formats supportés (JPEG, PNG).
+  - Accepte un chemin, des octets (bytes, BytesIO, fichier téléversé), un tableau NumPy ou une PIL.Image, de sorte
+    qu'une image reçue en mémoire n'ait jamais besoin de transiter par le disque.
+  - Vérifie le format d'après le contenu (signature des premiers octets) parmi les formats supportés (JPEG, PNG).
   - Ouvre l'image avec Pillow, et convertit les modes non-RGB en RGB pour assurer la compatibilité.
-  - Redimensionne l'image de manière proportionnelle si elle dépasse une taille maximale définie.
-  - Redimensionne ensuite l'image à une taille fixe requise par le CNN (par défaut 224x224).
+  - Pour les JPEG, réduit l'image directement au décodage (mode draft de Pillow, mise à l'échelle dans le domaine DCT)
+    afin de ne pas décoder des pixels aussitôt jetés.
+  - Redimensionne l'image en une seule passe à la taille fixe requise par le CNN (par défaut 224x224), avec un
+    compromis qualité / vitesse configurable (voir PREPROCESSING_MODES).
   - Convertit l'image en tenseur PyTorch normalisé (optionnel), avec les statistiques standard d'ImageNet.
 
+Pour l'extraction par lots, BatchCollator décode une liste d'images dans un tampon uint8 (N, 3, H, W) préalloué et
+réutilisé, puis normalise tout le lot en une seule opération vectorisée (collate_uint8 joue le même rôle dans les
+workers d'un DataLoader).
+
 Ce module garantit une homogénéité des données d'entrée tout en gérant les cas d'erreurs courants
 (fichier introuvable, format non supporté, image illisible). """
 
-import os, logging
+import os, io, logging, torch, numpy as np
 from PIL import Image, UnidentifiedImageError
 from torchvision import transforms
 
@@ -22,6 +30,32 @@ logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
 # Seules ces extensions d'image sont acceptées par le système
 ALLOWED_EXTENSIONS = ['.jpg', '.jpeg', '.png']
 
+# Signatures (premiers octets) des formats d'image acceptés, associées au nom du format pour Pillow
+IMAGE_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'\x89PNG\r\n\x1a\n': 'PNG',
+}
+
+# Modes de prétraitement disponibles : filtre de redimensionnement et échelle minimale conservée au décodage JPEG.
+#   - "quality" : le décodage JPEG n'est jamais réduit sous la résolution bornée par max_dim, puis un seul
+#     redimensionnement LANCZOS est appliqué (résultat proche de l'ancien pipeline en deux passes).
+#   - "speed" : le décodage JPEG est réduit jusqu'à la plus petite échelle DCT >= taille cible, puis un seul
+#     redimensionnement BILINEAR (avec réduction préalable par blocs) est appliqué.
+PREPROCESSING_MODES = {
+    "quality": Image.LANCZOS,
+    "speed": Image.BILINEAR,
+}
+
+# Moyennes et écarts-types des canaux RGB utilisés lors de l'entraînement des modèles ImageNet
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Conversion en tenseur normalisé, construite une seule fois pour tous les appels à preprocess_image
+TO_TENSOR_TRANSFORM = transforms.Compose([
+    transforms.ToTensor(),
+    transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+])
+
 
 class InvalidImageFormatError(Exception):
     """ Exception personnalisée pour un format d'image non supporté. """
@@ -37,57 +71,221 @@ def is_allowed_extension(file_path: str) -> bool:
     return ext in ALLOWED_EXTENSIONS
 
 
-def preprocess_image(image_path: str, target_size: tuple[int, int] = (224, 224), max_dim: int = 1024,
-                     to_tensor: bool = True):
+def sniff_image_format(header: bytes) -> str | None:
+    """ Détermine le format d'une image d'après ses premiers octets.
+    :param header: Premiers octets du contenu (au moins 8).
+    :return: Nom du format Pillow ('JPEG', 'PNG') si le format est accepté, None sinon. """
+
+    for signature, image_format in IMAGE_SIGNATURES.items():
+        if header.startswith(signature):
+            return image_format
+    return None
+
+
+def open_image(image_input) -> Image.Image:
+    """ Ouvre une image à partir d'une source en mémoire ou sur disque, sans la décoder entièrement.
+    :param image_input: Chemin (str ou os.PathLike), octets (bytes, bytearray, memoryview), objet fichier binaire
+    (BytesIO, fichier téléversé...), tableau NumPy uint8 (H, W) ou (H, W, 3|4), ou PIL.Image.
+    :return: L'image ouverte (décodage paresseux pour les sources encodées, ce qui permet Image.draft).
+    :raises FileNotFoundError: Si le chemin n'existe pas.
+    :raises InvalidImageFormatError: Si le contenu n'est pas dans un format supporté.
+    :raises ValueError: Si l'image ne peut pas être ouverte. """
+
+    if isinstance(image_input, Image.Image):  # Image déjà ouverte : rien à faire
+        return image_input
+
+    if isinstance(image_input, np.ndarray):  # Pixels bruts : pas de décodage nécessaire
+        if image_input.dtype != np.uint8 or image_input.ndim not in (2, 3):
+            raise ValueError(f"Tableau d'image invalide : attendu uint8 (H, W) ou (H, W, C), reçu "
+                             f"{image_input.dtype} {image_input.shape}")
+        return Image.fromarray(image_input)
+
+    if isinstance(image_input, (str, os.PathLike)):
+        if not os.path.exists(image_input):  # Vérification de l'existence du fichier
+            raise FileNotFoundError(f"L'image spécifiée n'existe pas : {image_input}")
+        with open(image_input, 'rb') as f:
+            header = f.read(16)
+        source, name = image_input, image_input
+    else:
+        if isinstance(image_input, (bytes, bytearray, memoryview)):
+            image_input = io.BytesIO(image_input)
+        elif not hasattr(image_input, 'read'):
+            raise ValueError(f"Type d'entrée non supporté : {type(image_input).__name__}")
+        elif not (hasattr(image_input, 'seekable') and image_input.seekable()):
+            image_input = io.BytesIO(image_input.read())  # Flux non rembobinable : lecture en mémoire
+        position = image_input.tell()
+        header = image_input.read(16)
+        image_input.seek(position)
+        source, name = image_input, f"<{type(image_input).__name__}>"
+
+    # Vérification du format d'après le contenu, et non d'après l'extension
+    image_format = sniff_image_format(header)
+    if image_format is None:
+        raise InvalidImageFormatError(f"Format de fichier non supporté : {name}")
+
+    try:
+        return Image.open(source, formats=[image_format])  # Ouverture de l'image
+    except UnidentifiedImageError as e:
+        raise ValueError(f"Impossible d'ouvrir l'image {name}. Erreur : {e}")
+
+
+def draft_size(image_size: tuple[int, int], target_size: tuple[int, int], max_dim: int, mode: str) -> tuple[int, int]:
+    """ Calcule la taille minimale à conserver lors du décodage JPEG réduit (Image.draft).
+    :param image_size: Taille (largeur, hauteur) de l'image d'origine.
+    :param target_size: Taille finale (largeur, hauteur) exigée par le réseau.
+    :param max_dim: Taille maximale utile pour la plus grande dimension de l'image (mode "quality").
+    :param mode: Mode de prétraitement ("quality" ou "speed").
+    :return: Taille (largeur, hauteur) en dessous de laquelle le décodeur ne doit pas descendre. """
+
+    if mode == "speed":
+        return target_size
+
+    # En mode qualité, on ne descend jamais sous la taille qu'aurait produite l'ancienne réduction à max_dim,
+    # ni sous la taille cible.
+    width, height = image_size
+    scaling_factor = min(1.0, max_dim / max(width, height))
+    return (max(target_size[0], int(width * scaling_factor)),
+            max(target_size[1], int(height * scaling_factor)))
+
+
+def preprocess_image(image_input, target_size: tuple[int, int] = (224, 224), max_dim: int = 1024,
+                     to_tensor: bool = True, mode: str = "quality"):
     """ Prétraite une image pour la rendre compatible avec l'entrée d'un CNN.
-    :param image_path: Chemin vers l'image.
+    :param image_input: Chemin, octets, objet fichier, tableau NumPy ou PIL.Image (voir open_image).
     :param target_size: Taille finale (largeur, hauteur) exigée par le réseau.
-    :param max_dim: Taille maximale autorisée pour la plus grande dimension de l'image avant redimensionnement.
+    :param max_dim: Taille maximale utile pour la plus grande dimension de l'image lors du décodage (mode "quality").
     :param to_tensor: Si True, convertit l'image en torch.Tensor et la normalise.
+    :param mode: Compromis qualité / vitesse, parmi les clés de PREPROCESSING_MODES.
     :return: L'image prétraitée sous forme de PIL.Image ou torch.Tensor selon to_tensor.
     :raises FileNotFoundError: Si le fichier n'existe pas.
     :raises InvalidImageFormatError: Si le format de l'image n'est pas supporté.
-    :raises ValueError: Si l'image ne peut pas être ouverte. """
+    :raises ValueError: Si l'image ne peut pas être ouverte ou si le mode est inconnu. """
 
-    if not os.path.exists(image_path):  # Vérification de l'existence du fichier
-        raise FileNotFoundError(f"L'image spécifiée n'existe pas : {image_path}")
+    if mode not in PREPROCESSING_MODES:
+        raise ValueError(f"Mode de prétraitement inconnu : {mode} (attendu : {', '.join(PREPROCESSING_MODES)})")
 
-    if not is_allowed_extension(image_path):  # Vérification de l'extension du fichier
-        raise InvalidImageFormatError(f"Format de fichier non supporté : {image_path}")
+    image = open_image(image_input)  # Ouverture de l'image, avec vérification de l'existence et du format
 
-    try:
-        image = Image.open(image_path)  # Ouverture de l'image
-    except UnidentifiedImageError as e:
-        raise ValueError(f"Impossible d'ouvrir l'image {image_path}. Erreur : {e}")
+    # Pour les JPEG, le décodeur peut réduire l'image d'un facteur 1/2, 1/4 ou 1/8 directement dans le domaine DCT :
+    # draft choisit la plus petite échelle dont la taille reste supérieure ou égale à celle demandée.
+    # Sans effet pour les autres formats. Une PIL.Image fournie par l'appelant n'est pas réduite : draft la modifierait
+    # en place.
+    if image is not image_input:
+        image.draft('RGB', draft_size(image.size, target_size, max_dim, mode))
 
     if image.mode != 'RGB':  # Conversion en RGB si l'image n'est pas déjà dans ce mode
-        logging.info(f"Conversion de l'image en RGB (mode initial : {image.mode}).")
+        logging.debug(f"Conversion de l'image en RGB (mode initial : {image.mode}).")
         image = image.convert('RGB')
 
-    width, height = image.size  # Récupération des dimensions actuelles de l'image
-    # Si une des dimensions dépasse la limite autorisée (max_dim), on redimensionne
-    # l'image en conservant le ratio (aspect ratio) pour ne pas la déformer.
-    if max(width, height) > max_dim:
-        scaling_factor = max_dim / max(width, height)  # Rapport de réduction à appliquer
-        new_size = (int(width * scaling_factor), int(height * scaling_factor))  # Nouvelles dimensions calculées
-        logging.info(f"Image trop grande ({width}x{height}). Redimensionnement à {new_size} pour conserver l'aspect.")
-        image = image.resize(new_size, Image.LANCZOS)  # Redimensionnement avec un filtre haute qualité (LANCZOS)
-
-    # Redimensionnement strict à la taille cible requise par le CNN
+    # Redimensionnement strict, en une seule passe, à la taille cible requise par le CNN.
     # Cela permet de standardiser toutes les entrées, quel que soit le format d'origine.
     if image.size != target_size:
-        logging.info(f"Redimensionnement final de l'image à la taille cible : {target_size}.")
-        image = image.resize(target_size, Image.LANCZOS)
+        logging.debug(f"Redimensionnement de l'image de {image.size} à la taille cible {target_size} (mode {mode}).")
+        # En mode vitesse, reducing_gap effectue d'abord une réduction entière par blocs, bien moins coûteuse
+        reducing_gap = 2.0 if mode == "speed" else None
+        image = image.resize(target_size, PREPROCESSING_MODES[mode], reducing_gap=reducing_gap)
 
     # Si demandé, conversion en tenseur PyTorch suivi d'une normalisation avec les moyennes/écarts-types
     # utilisés lors de l'entraînement des modèles ImageNet.
     # Cette étape est indispensable pour que les entrées soient compatibles avec les modèles pré-entraînés.
     if to_tensor:
-        to_tensor_transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                 std=[0.229, 0.224, 0.225])
-        ])
-        image = to_tensor_transform(image)
+        image = TO_TENSOR_TRANSFORM(image)
 
     return image
+
+
+def collate_uint8(image_inputs, target_size: tuple[int, int] = (224, 224), max_dim: int = 1024,
+                  mode: str = "quality", out: torch.Tensor = None) -> torch.Tensor:
+    """ Décode une liste d'images dans un unique tenseur uint8 (N, 3, H, W), sans conversion en flottants.
+    Utilisable comme collate_fn d'un DataLoader : dans un worker, le tenseur est alloué en mémoire partagée, ce qui
+    évite sa copie lors du transfert vers le processus principal.
+    :param image_inputs: Liste d'entrées acceptées par preprocess_image.
+    :param target_size: Taille finale (largeur, hauteur) des images.
+    :param max_dim: Voir preprocess_image.
+    :param mode: Voir preprocess_image.
+    :param out: Tampon uint8 d'au moins N lignes dans lequel écrire ; alloué si None.
+    :return: Tenseur uint8 (N, 3, H, W) au format mémoire channels_last (pixels RGB contigus). """
+
+    width, height = target_size
+    if out is None:
+        out = torch.empty((len(image_inputs), 3, height, width), dtype=torch.uint8, memory_format=torch.channels_last)
+        if torch.utils.data.get_worker_info() is not None:  # Dans un worker de DataLoader
+            out.share_memory_()
+    # Vue (N, H, W, 3) sur le même stockage : chaque image décodée y est copiée d'un seul bloc
+    pixels = out.permute(0, 2, 3, 1).numpy()
+    for i, image_input in enumerate(image_inputs):
+        image = preprocess_image(image_input, target_size=target_size, max_dim=max_dim, to_tensor=False, mode=mode)
+        np.copyto(pixels[i], np.asarray(image))
+    return out[:len(image_inputs)]
+
+
+class BatchCollator:
+    """ Assemble des lots d'images normalisées dans des tampons préalloués et réutilisés d'un lot à l'autre. """
+
+    def __init__(self, batch_size: int, target_size: tuple[int, int] = (224, 224), max_dim: int = 1024,
+                 mode: str = "quality", mean: tuple = IMAGENET_MEAN, std: tuple = IMAGENET_STD,
+                 pin_memory: bool = False):
+        """ Alloue les tampons uint8 et float32 (batch_size, 3, H, W).
+        :param batch_size: Nombre maximal d'images par lot.
+        :param target_size: Taille finale (largeur, hauteur) des images.
+        :param max_dim: Voir preprocess_image.
+        :param mode: Voir preprocess_image.
+        :param mean: Moyennes des canaux RGB pour la normalisation.
+        :param std: Écarts-types des canaux RGB pour la normalisation.
+        :param pin_memory: Si True (et CUDA disponible), le tampon float32 est alloué en mémoire épinglée, ce qui
+        permet un transfert asynchrone vers le GPU. """
+
+        if mode not in PREPROCESSING_MODES:
+            raise ValueError(f"Mode de prétraitement inconnu : {mode} (attendu : {', '.join(PREPROCESSING_MODES)})")
+        self.batch_size = batch_size
+        self.target_size = target_size
+        self.max_dim = max_dim
+        self.mode = mode
+
+        width, height = target_size
+        shape = (batch_size, 3, height, width)
+        self.uint8_buffer = torch.empty(shape, dtype=torch.uint8, memory_format=torch.channels_last)
+        self.float_buffer = torch.empty(shape, dtype=torch.float32, memory_format=torch.channels_last)
+        if pin_memory and torch.cuda.is_available():
+            self.float_buffer = self.float_buffer.pin_memory()
+
+        # normalisé = (pixel / 255 - mean) / std = pixel * scale + shift
+        std = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+        self.scale = 1.0 / (255.0 * std)
+        self.shift = -torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1) / std
+
+        self._pixels = self.uint8_buffer.permute(0, 2, 3, 1).numpy()  # Vue (N, H, W, 3) sur le tampon uint8
+
+    def put(self, position: int, image_input):
+        """ Décode une image et l'écrit à la position donnée du tampon uint8.
+        :param position: Position dans le lot (0 <= position < batch_size).
+        :param image_input: Entrée acceptée par preprocess_image.
+        :raises FileNotFoundError, InvalidImageFormatError, ValueError: Voir preprocess_image. """
+
+        image = preprocess_image(image_input, target_size=self.target_size, max_dim=self.max_dim, to_tensor=False,
+                                 mode=self.mode)
+        np.copyto(self._pixels[position], np.asarray(image))
+
+    def normalize(self, count: int, uint8_batch: torch.Tensor = None) -> torch.Tensor:
+        """ Normalise les count premières images en une seule opération vectorisée.
+        :param count: Nombre d'images du lot.
+        :param uint8_batch: Lot uint8 (N, 3, H, W) à normaliser (par exemple produit par collate_uint8) ; par défaut
+        le tampon interne rempli par put.
+        :return: Vue float32 (count, 3, H, W) sur le tampon réutilisé, valide jusqu'au prochain appel. """
+
+        if uint8_batch is None:
+            uint8_batch = self.uint8_buffer
+        out = self.float_buffer[:count]
+        torch.addcmul(self.shift, uint8_batch[:count], self.scale, out=out)
+        return out
+
+    def collate(self, image_inputs) -> torch.Tensor:
+        """ Décode et normalise une liste d'au plus batch_size images.
+        :param image_inputs: Liste d'entrées acceptées par preprocess_image.
+        :return: Vue float32 (N, 3, H, W) sur le tampon réutilisé, valide jusqu'au prochain appel. """
+
+        if len(image_inputs) > self.batch_size:
+            raise ValueError(f"Lot trop grand : {len(image_inputs)} images pour un tampon de {self.batch_size}")
+        for position, image_input in enumerate(image_inputs):
+            self.put(position, image_input)
+        return self.normalize(len(image_inputs))
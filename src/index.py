@@ -0,0 +1,919 @@
+""" Module d'indexation hors ligne du dataset Tiny ImageNet. Usage : python -m src.index build [options]
+
+Ce module remplace les scripts d'extraction exécutés sur Google Colab. Il fonctionne entièrement hors ligne, sur une
+copie locale du dataset, et peut reprendre après une interruption :
+
+    - Les images du dossier train/ sont listées dans un ordre déterministe (classes triées, puis numéro d'image), qui
+    correspond à la convention de nommage utilisée par ti_get_image_path.
+    - Les embeddings sont calculés par lots (MobileNetV3 ou CLIP) et écrits par blocs de taille fixe (shards), chacun
+    de façon atomique. Un manifeste recense les shards terminés : une exécution relancée après un arrêt reprend au
+    premier shard manquant.
+    - Les embeddings déjà présents dans le cache disque (cache.py) ne sont pas recalculés.
+    - Plusieurs modèles peuvent être indexés en une seule passe (--model mobilenet clip) : chaque image n'est lue et
+    décodée qu'une fois, puis prétraitée par chaque encodeur. Les collections produites ont des lignes identiques.
+    - Une fois tous les shards terminés, les fichiers chargés par les modules de recherche (embeddings, catégories,
+    chemins des images et masque des lignes supprimées, au format .npy) sont assemblés dans le dossier de sortie.
+    L'assemblage écrit chaque shard directement dans sa tranche de fichiers projetés en mémoire (np.memmap) : la
+    mémoire utilisée ne dépend pas de la taille de la collection, qui peut dépasser la RAM. Les embeddings peuvent
+    être stockés en float16 (--dtype float16) pour diviser leur taille par deux.
+    - Optionnellement (--thumbnails), un atlas de vignettes est produit à partir des images déjà décodées : un tableau
+    uint8 (N, H, W, 3) aligné sur les lignes de la collection, dont les pages de résultats lisent directement les
+    lignes (projection en mémoire) au lieu d'ouvrir et de décoder un fichier JPEG par résultat.
+    - Un manifeste des fichiers (chemin -> taille, date de modification, empreinte du contenu, ligne) permet ensuite
+    une ré-indexation incrémentale (python -m src.index update) : seules les images nouvelles ou modifiées sont
+    encodées, les images disparues sont marquées comme supprimées, et la collection est mise à jour sur place. Les
+    collections construites ensemble sont mises à jour ensemble, et restent alignées.
+
+Les poids des modèles doivent être disponibles localement (cache de torchvision pour MobileNetV3, point de contrôle
+passé via --clip-model pour CLIP). """
+
+import argparse, io, json, logging, os, re, time, torch, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from numpy.lib.format import open_memmap
+from PIL import Image, ImageOps
+from tqdm import tqdm
+from src.cache import DiskCache, atomic_write_bytes, cache_key, content_hash
+from src.feature_extractor import FeatureExtractor
+from src.image_preprocessing import BatchCollator, draft_size, open_image
+from src import binary_codes
+from src.reduction import fit_collection
+
+RESSOURCES_PATH = Path(__file__).parent.parent / "ressources" / "tiny-imagenet"
+
+# Dimension maximale conservée au décodage des images (identique à preprocess_image)
+DECODE_MAX_DIM = 1024
+
+# Nombre de lignes recopiées à la fois lors de la recopie d'une collection (voir rewrite_rows et
+# EmbeddingWriter.shrink). Une ligne de l'atlas de vignettes occupe 12 Ko (64 x 64 x 3) : 8192 lignes représentent
+# 100 Mo par bloc, contre 800 Mo pour 65536 lignes
+COPY_CHUNK_ROWS = 8192
+
+# Taille par défaut des vignettes de l'atlas (taille native des images Tiny ImageNet)
+THUMBNAIL_SIZE = (64, 64)
+
+# Types acceptés pour le stockage des embeddings
+EMBEDDING_DTYPES = ("float32", "float16")
+
+# Préfixe des fichiers produits pour chaque modèle, tel qu'attendu par similarity_search et clip_similarity_search
+OUTPUT_PREFIXES = {
+    "mobilenet": "Tiny_ImageNet_MobilNetV3",
+    "clip": "Tiny_ImageNet_CLIP",
+}
+
+
+class MobileNetEncoder:
+    """ Encodeur MobileNetV3 (vecteurs de 960 dimensions), identique à FeatureExtractor. """
+
+    def __init__(self, batch_size: int, device: str = None):
+        """ Charge le modèle et alloue les tampons de lot.
+        :param batch_size: Nombre maximal d'images par lot.
+        :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement. """
+
+        self.extractor = FeatureExtractor(device=device)
+        self.collator = BatchCollator(batch_size, target_size=self.extractor.target_size,
+                                      pin_memory=self.extractor.device.startswith('cuda'))
+        self.dim = self.extractor.feature_dim
+        self.input_size = self.extractor.target_size
+        self.cache_config = self.extractor.cache_config  # Entrées de cache partagées avec l'application
+
+    def put(self, position: int, image):
+        """ Prétraite une image et la place à la position donnée du lot. """
+
+        self.collator.put(position, image)
+
+    def encode(self, count: int) -> np.ndarray:
+        """ Calcule les embeddings des count premières images du lot. """
+
+        return self.extractor.forward_batch(self.collator.normalize(count))
+
+
+class ClipEncoder:
+    """ Encodeur d'images CLIP (vecteurs normalisés), identique aux embeddings utilisés par clip_similarity_search. """
+
+    def __init__(self, batch_size: int, device: str = None, model_name: str = "ViT-B/32"):
+        """ Charge le modèle CLIP et alloue le tampon de lot.
+        :param batch_size: Nombre maximal d'images par lot.
+        :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
+        :param model_name: Nom du modèle CLIP, ou chemin vers un point de contrôle local (fonctionnement hors ligne). """
+
+        import clip  # Dépendance chargée uniquement lorsque l'encodeur CLIP est utilisé
+
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.model, self.preprocess = clip.load(model_name, device=self.device)
+        self.model.eval()
+        resolution = self.model.visual.input_resolution
+        self.batch = torch.empty((batch_size, 3, resolution, resolution))
+        self.dim = self.model.visual.output_dim
+        self.input_size = (resolution, resolution)
+        self.cache_config = {"model": "clip", "name": os.path.basename(model_name), "normalized": True}
+
+    def put(self, position: int, image):
+        """ Prétraite une image (pipeline CLIP) et la place à la position donnée du lot. """
+
+        self.batch[position] = self.preprocess(image.convert("RGB"))
+
+    def encode(self, count: int) -> np.ndarray:
+        """ Calcule les embeddings normalisés des count premières images du lot. """
+
+        with torch.no_grad():
+            features = self.model.encode_image(self.batch[:count].to(self.device))
+            features /= features.norm(dim=-1, keepdim=True)  # Normalisation des embeddings
+        return features.float().cpu().numpy()
+
+
+ENCODERS = {
+    "mobilenet": MobileNetEncoder,
+    "clip": ClipEncoder,
+}
+
+
+def make_encoder(model: str, batch_size: int, device: str = None, clip_model: str = "ViT-B/32"):
+    """ Construit l'encodeur d'un modèle.
+    :param model: Modèle, parmi les clés de ENCODERS.
+    :param batch_size: Nombre maximal d'images par lot.
+    :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
+    :param clip_model: Nom du modèle CLIP ou chemin vers un point de contrôle local.
+    :return: L'encodeur. """
+
+    if model == "clip":
+        return ClipEncoder(batch_size, device=device, model_name=clip_model)
+    return ENCODERS[model](batch_size, device=device)
+
+
+def image_sort_key(file_name: str):
+    """ Clé de tri naturel des noms d'images : n01443537_2.JPEG avant n01443537_10.JPEG. """
+
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", file_name)]
+
+
+def list_dataset_images(dataset_path: str | os.PathLike) -> list[tuple[str, str]]:
+    """ Liste les images d'entraînement du dataset Tiny ImageNet dans un ordre déterministe.
+    :param dataset_path: Dossier tiny-imagenet-200 (contenant train/<classe>/images/).
+    :return: Liste de tuples (chemin relatif au dossier train, identifiant WordNet de la classe). """
+
+    train_path = Path(dataset_path) / "train"
+    if not train_path.is_dir():
+        raise FileNotFoundError(f"Dossier d'entraînement introuvable : {train_path}")
+
+    items = []
+    for category in sorted(os.listdir(train_path)):
+        category_path = train_path / category / "images"
+        if not category_path.is_dir():
+            continue  # Ignorer si le chemin n'est pas un dossier valide
+        for image_file in sorted(os.listdir(category_path), key=image_sort_key):
+            items.append((f"{category}/images/{image_file}", category))
+    return items
+
+
+def decode_image(data: bytes, input_size: tuple[int, int]) -> Image.Image:
+    """ Décode une image une seule fois, pour l'ensemble des encodeurs.
+    :param data: Octets bruts de l'image.
+    :param input_size: Plus grande taille d'entrée des encodeurs ; le décodage JPEG réduit la conserve.
+    :return: Image RGB décodée. """
+
+    image = open_image(data)
+    image.draft('RGB', draft_size(image.size, input_size, DECODE_MAX_DIM, "quality"))
+    return image.convert('RGB')
+
+
+def make_atlas_thumbnail(image: Image.Image, size: tuple[int, int] = THUMBNAIL_SIZE) -> np.ndarray:
+    """ Réduit une image décodée en vignette de l'atlas, recadrée au centre à la taille exacte demandée.
+    :param image: Image RGB décodée.
+    :param size: Taille (largeur, hauteur) de la vignette.
+    :return: Tableau uint8 (hauteur, largeur, 3). """
+
+    return np.asarray(ImageOps.fit(image, size, Image.BILINEAR))
+
+
+def embed_items(encoders: dict, items: list[tuple[str, str]], train_path: Path, batch_size: int,
+                cache: DiskCache = None, pool: ThreadPoolExecutor = None,
+                thumbnail_size: tuple[int, int] = None) -> tuple[dict, np.ndarray, list[dict], np.ndarray]:
+    """ Calcule les embeddings d'une liste d'images, par lots, pour un ou plusieurs modèles, en réutilisant le cache
+    disque. Chaque image est lue et décodée une seule fois, puis placée dans le lot de chaque encodeur.
+    Les images illisibles sont signalées puis ignorées.
+    :param encoders: Dictionnaire modèle -> encodeur (voir ENCODERS).
+    :param items: Liste de tuples (chemin relatif, catégorie).
+    :param train_path: Dossier train du dataset.
+    :param batch_size: Nombre d'images par passe du modèle.
+    :param cache: Cache disque des embeddings (optionnel).
+    :param pool: Pool de threads pour la lecture et le décodage des images (optionnel).
+    :param thumbnail_size: Taille des vignettes de l'atlas, produites à partir des images décodées ; toutes les images
+    sont alors décodées, même celles dont les embeddings sont en cache. Sans vignettes si None.
+    :return: Embeddings (M, dim) de chaque modèle, positions (M,) dans items des images traitées avec succès par
+    tous les modèles, pour chacune l'enregistrement du manifeste des fichiers (taille, date de modification,
+    empreinte du contenu), et leurs vignettes (M, H, W, 3) ou None. """
+
+    embeddings = {name: np.empty((len(items), encoder.dim), dtype=np.float32) for name, encoder in encoders.items()}
+    done = {name: np.zeros(len(items), dtype=bool) for name in encoders}
+    records = [None] * len(items)
+    sizes = [encoder.input_size for encoder in encoders.values()] + [thumbnail_size or (0, 0)]
+    input_size = tuple(max(size[i] for size in sizes) for i in range(2))
+    thumbnails = None
+    if thumbnail_size is not None:
+        thumbnails = np.zeros((len(items), thumbnail_size[1], thumbnail_size[0], 3), dtype=np.uint8)
+        done["thumbnails"] = np.zeros(len(items), dtype=bool)
+    map_function = pool.map if pool is not None else map
+
+    def read(i):
+        try:
+            path = train_path / items[i][0]
+            stat = os.stat(path)  # Relevé avant la lecture : une modification ultérieure sera détectée à la mise à jour
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logging.error(f"Erreur avec {items[i][0]}: {e}")
+            return None
+        records[i] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": content_hash(data)}
+        return data
+
+    for start in range(0, len(items), batch_size):
+        positions = range(start, min(start + batch_size, len(items)))
+        contents = list(map_function(read, positions))
+
+        # Images absentes du cache pour au moins un modèle, avec la clé de cache de chaque modèle concerné
+        pending = []
+        for i, data in zip(positions, contents):
+            if data is None:
+                continue
+            missing = {}
+            for name, encoder in encoders.items():
+                key = cache_key(data, "features", encoder.cache_config) if cache is not None else None
+                cached = cache.get(key) if key is not None else None
+                if cached is not None:
+                    embeddings[name][i], done[name][i] = cached, True
+                else:
+                    missing[name] = key
+            if missing or thumbnails is not None:
+                pending.append((i, data, missing))
+
+        def decode(slot):
+            i, data, _ = pending[slot]
+            try:
+                image = decode_image(data, input_size)
+                if thumbnails is not None:
+                    thumbnails[i], done["thumbnails"][i] = make_atlas_thumbnail(image, thumbnail_size), True
+                return image
+            except Exception as e:
+                logging.error(f"Erreur avec {items[i][0]}: {e}")
+                return None
+
+        images = list(map_function(decode, range(len(pending))))
+        for name, encoder in encoders.items():
+            # Seules les images décodées et absentes du cache pour ce modèle, sur des positions contiguës du lot : le
+            # modèle ne traite ni les positions des images en erreur, ni celles déjà en cache
+            slots = [slot for slot, (_, _, missing) in enumerate(pending)
+                     if images[slot] is not None and name in missing]
+            if not slots:
+                continue
+            list(map_function(lambda j: encoder.put(j, images[slots[j]]), range(len(slots))))
+            batch_embeddings = encoder.encode(len(slots))
+            for j, slot in enumerate(slots):
+                i, _, missing = pending[slot]
+                embeddings[name][i], done[name][i] = batch_embeddings[j], True
+                if missing[name] is not None:
+                    cache.put(missing[name], batch_embeddings[j])
+        del images
+
+    positions = np.flatnonzero(np.logical_and.reduce(list(done.values())))
+    return ({name: values[positions] for name, values in embeddings.items()}, positions,
+            [records[i] for i in positions], thumbnails[positions] if thumbnails is not None else None)
+
+
+def load_manifest(work_path: Path, expected: dict, restart: bool = False) -> dict:
+    """ Charge le manifeste des shards terminés, ou en crée un nouveau.
+    :param work_path: Dossier de travail contenant les shards et le manifeste.
+    :param expected: Paramètres de l'indexation ; un manifeste existant doit avoir les mêmes pour être repris.
+    :param restart: Si True, ignore un manifeste existant et recommence depuis le début.
+    :return: Manifeste (paramètres et liste des shards terminés). """
+
+    manifest_path = work_path / "manifest.json"
+    if manifest_path.exists() and not restart:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["parameters"] != expected:
+            raise ValueError(f"Le manifeste {manifest_path} correspond à une autre indexation (dataset, modèle ou "
+                             f"taille de shard différents). Relancer avec --restart pour recommencer.")
+        logging.info(f"Reprise de l'indexation : {len(manifest['completed'])} shards déjà terminés.")
+        return manifest
+    return {"parameters": expected, "completed": []}
+
+
+def save_manifest(work_path: Path, manifest: dict):
+    """ Écrit le manifeste de façon atomique. """
+
+    atomic_write_bytes(work_path / "manifest.json", json.dumps(manifest, indent=2).encode())
+
+
+def save_npy(path: str | os.PathLike, array: np.ndarray):
+    """ Écrit un tableau au format .npy de façon atomique. """
+
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+    atomic_write_bytes(path, buffer.getvalue())
+
+
+def save_npz(path: str | os.PathLike, **arrays):
+    """ Écrit plusieurs tableaux dans une archive .npz, de façon atomique. """
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    atomic_write_bytes(path, buffer.getvalue())
+
+
+def collection_paths(output_path: Path, prefix: str) -> dict:
+    """ Retourne les chemins des fichiers d'une collection (voir OUTPUT_PREFIXES).
+    :param output_path: Dossier de la collection.
+    :param prefix: Préfixe des fichiers.
+    :return: Dictionnaire nom -> chemin (embeddings, catégories, chemins relatifs des images, lignes supprimées, atlas
+    de vignettes, réduction de dimension, codes binaires). """
+
+    return {"embeddings": output_path / f"{prefix}_Embeddings.npy",
+            "categories": output_path / f"{prefix}_Categories.npy",
+            "paths": output_path / f"{prefix}_Paths.npy",
+            "deleted": output_path / f"{prefix}_Deleted.npy",
+            "thumbnails": output_path / f"{prefix}_Thumbnails.npy",
+            "reduction": output_path / f"{prefix}_PCA.faiss",
+            "codes": output_path / f"{prefix}_Codes.npz"}
+
+
+def load_file_manifest(work_path: Path) -> dict:
+    """ Charge le manifeste des fichiers indexés (chemin relatif -> taille, date de modification, empreinte, ligne). """
+
+    manifest_path = work_path / "files.json"
+    if not manifest_path.exists():
+        raise FileNotFoundError(f"Manifeste des fichiers introuvable : {manifest_path}. Lancer d'abord "
+                                f"python -m src.index build.")
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_file_manifest(work_path: Path, files: dict):
+    """ Écrit le manifeste des fichiers indexés de façon atomique. """
+
+    atomic_write_bytes(work_path / "files.json", json.dumps(files).encode())
+
+
+class EmbeddingWriter:
+    """ Écrit une collection (embeddings, catégories, chemins, lignes supprimées) directement sur disque, tranche par
+    tranche, dans des fichiers .npy projetés en mémoire. Les fichiers sont écrits à côté des fichiers finaux, puis
+    les remplacent à la fermeture : un lecteur voit l'ancienne collection jusqu'au bout.
+
+    Usage :
+        with EmbeddingWriter(paths, num_rows, dim) as writer:
+            writer.write(embeddings, categories, image_paths) """
+
+    def __init__(self, paths: dict, num_rows: int, dim: int, dtype: str = "float32", category_width: int = 16,
+                 path_width: int = 64, thumbnail_size: tuple[int, int] = None):
+        """ Préalloue les fichiers de la collection.
+        :param paths: Chemins des fichiers finaux (voir collection_paths). Seules les colonnes présentes sont écrites
+        (par exemple les embeddings seuls).
+        :param num_rows: Nombre total de lignes.
+        :param dim: Dimension des embeddings.
+        :param dtype: Type de stockage des embeddings, parmi EMBEDDING_DTYPES.
+        :param category_width: Longueur maximale d'une catégorie (colonne de chaînes de taille fixe).
+        :param path_width: Longueur maximale d'un chemin relatif.
+        :param thumbnail_size: Taille (largeur, hauteur) des vignettes de l'atlas ; sans atlas si None.
+        :raises ValueError: Si le type de stockage n'est pas supporté. """
+
+        if str(dtype) not in EMBEDDING_DTYPES:
+            raise ValueError(f"Type d'embeddings non supporté : {dtype}. Choisir parmi {EMBEDDING_DTYPES}.")
+        shapes = {"embeddings": ((num_rows, dim), dtype), "categories": ((num_rows,), f"<U{max(category_width, 1)}"),
+                  "paths": ((num_rows,), f"<U{max(path_width, 1)}"), "deleted": ((num_rows,), bool)}
+        if thumbnail_size is not None:
+            shapes["thumbnails"] = ((num_rows, thumbnail_size[1], thumbnail_size[0], 3), np.uint8)
+        self.paths = {name: path for name, path in paths.items() if name in shapes}
+        self.tmp_paths = {name: path.with_name(path.name + ".tmp") for name, path in self.paths.items()}
+        self.columns = {name: open_memmap(self.tmp_paths[name], mode="w+", dtype=dtype, shape=shape)
+                        for name, (shape, dtype) in shapes.items() if name in self.paths}
+        self.num_rows = num_rows
+        self.position = 0
+
+    def write(self, embeddings: np.ndarray, categories=None, image_paths=None, deleted=None, thumbnails=None) -> int:
+        """ Écrit un bloc de lignes à la suite des précédentes.
+        :param embeddings: Embeddings du bloc (n, dim), convertis au type de stockage.
+        :param categories: Catégories du bloc (n,).
+        :param image_paths: Chemins relatifs des images du bloc (n,).
+        :param deleted: Lignes supprimées du bloc (n,), toutes actives par défaut.
+        :param thumbnails: Vignettes du bloc (n, H, W, 3), si la collection a un atlas.
+        :return: Numéro de la première ligne écrite.
+        :raises ValueError: Si le bloc dépasse le nombre de lignes préalloué. """
+
+        start, end = self.position, self.position + len(embeddings)
+        if end > self.num_rows:
+            raise ValueError(f"Le bloc dépasse la taille de la collection ({end} > {self.num_rows} lignes).")
+        values = {"embeddings": embeddings, "categories": categories, "paths": image_paths,
+                  "deleted": False if deleted is None else deleted, "thumbnails": thumbnails}
+        for name, column in self.columns.items():
+            column[start:end] = values[name]
+        self.position = end
+        return start
+
+    def shrink(self):
+        """ Réduit les fichiers au nombre de lignes effectivement écrites, lorsque certaines lignes préallouées n'ont
+        pas pu être produites (images illisibles). Les lignes sont recopiées par blocs de COPY_CHUNK_ROWS. """
+
+        for name, column in self.columns.items():
+            shrunk_path = self.tmp_paths[name].with_name(self.tmp_paths[name].name + ".shrink")
+            shrunk = open_memmap(shrunk_path, mode="w+", dtype=column.dtype,
+                                 shape=(self.position,) + column.shape[1:])
+            for start in range(0, self.position, COPY_CHUNK_ROWS):
+                shrunk[start:start + COPY_CHUNK_ROWS] = column[start:min(start + COPY_CHUNK_ROWS, self.position)]
+            os.replace(shrunk_path, self.tmp_paths[name])
+            self.columns[name] = shrunk
+        self.num_rows = self.position
+
+    def close(self):
+        """ Vide les fichiers sur disque, puis remplace les fichiers finaux (les embeddings en premier).
+        :raises ValueError: Si toutes les lignes préallouées n'ont pas été écrites. """
+
+        if self.position != self.num_rows:
+            self.abort()
+            raise ValueError(f"Collection incomplète : {self.position} lignes écrites sur {self.num_rows}.")
+        for name, column in self.columns.items():
+            column.flush()
+        self.columns = {}  # Libère les projections avant le renommage
+        for name in ("embeddings", "categories", "paths", "deleted", "thumbnails"):
+            if name in self.tmp_paths:
+                os.replace(self.tmp_paths[name], self.paths[name])
+
+    def abort(self):
+        """ Abandonne l'écriture et supprime les fichiers temporaires. """
+
+        self.columns = {}
+        for path in self.tmp_paths.values():
+            if path.exists():
+                path.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def build_index(dataset_path: str | os.PathLike, output_path: str | os.PathLike, model: str = "mobilenet",
+                shard_size: int = 4096, batch_size: int = 32, workers: int = 4, cache: DiskCache = None,
+                restart: bool = False, device: str = None, clip_model: str = "ViT-B/32", encoder=None,
+                dtype: str = "float32", thumbnail_size: tuple[int, int] = None, pca_dim: int = None,
+                whiten: bool = False, code_bits: int = None, code_method: str = "itq") -> dict:
+    """ Construit (ou reprend) l'indexation du dataset pour un modèle (voir build_indexes).
+    :param model: Modèle utilisé, parmi les clés de ENCODERS.
+    :param encoder: Encodeur déjà construit ; par défaut, il n'est construit (voir make_encoder) que s'il reste des
+    shards à calculer.
+    :return: Chemins des fichiers produits. """
+
+    return build_indexes(dataset_path, output_path, models=(model,), shard_size=shard_size, batch_size=batch_size,
+                         workers=workers, cache=cache, restart=restart, device=device, clip_model=clip_model,
+                         encoders={model: encoder} if encoder is not None else None, dtype=dtype,
+                         thumbnail_size=thumbnail_size, pca_dim=pca_dim, whiten=whiten, code_bits=code_bits,
+                         code_method=code_method)[model]
+
+
+def build_indexes(dataset_path: str | os.PathLike, output_path: str | os.PathLike, models=("mobilenet",),
+                  shard_size: int = 4096, batch_size: int = 32, workers: int = 4, cache: DiskCache = None,
+                  restart: bool = False, device: str = None, clip_model: str = "ViT-B/32", encoders: dict = None,
+                  dtype: str = "float32", thumbnail_size: tuple[int, int] = None, pca_dim: int = None,
+                  whiten: bool = False, code_bits: int = None, code_method: str = "itq") -> dict:
+    """ Construit (ou reprend) l'indexation du dataset pour un ou plusieurs modèles en une seule passe, puis assemble
+    les fichiers de chaque collection. Les collections produites ont les mêmes lignes, dans le même ordre.
+    :param dataset_path: Dossier tiny-imagenet-200.
+    :param output_path: Dossier de sortie des fichiers .npy (le dossier de travail y est créé dans .index/).
+    :param models: Modèles utilisés, parmi les clés de ENCODERS.
+    :param shard_size: Nombre d'images par shard (unité de reprise).
+    :param batch_size: Nombre d'images par passe du modèle.
+    :param workers: Nombre de threads de lecture et de décodage.
+    :param cache: Cache disque des embeddings (optionnel).
+    :param restart: Si True, recommence depuis le début même si un manifeste existe.
+    :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
+    :param clip_model: Nom du modèle CLIP ou chemin vers un point de contrôle local.
+    :param encoders: Dictionnaire modèle -> encodeur déjà construit ; par défaut, les encodeurs ne sont construits
+    (voir make_encoder) que s'il reste des shards à calculer.
+    :param dtype: Type de stockage des embeddings assemblés, parmi EMBEDDING_DTYPES.
+    :param thumbnail_size: Taille (largeur, hauteur) des vignettes de l'atlas de chaque collection ; sans atlas si None.
+    :param pca_dim: Dimension de la réduction apprise sur la collection MobileNetV3 (voir src.reduction) ; sans
+    réduction si None.
+    :param whiten: Blanchiment des composantes de la réduction.
+    :param code_bits: Nombre de bits des codes binaires appris sur chaque collection (voir src.binary_codes) ; si None,
+    les codes existants sont ré-encodés avec leur projection.
+    :param code_method: Méthode d'apprentissage des codes binaires, parmi binary_codes.METHODS.
+    :return: Dictionnaire modèle -> chemins des fichiers produits. """
+
+    dataset_path, output_path = Path(dataset_path), Path(output_path)
+    models = list(dict.fromkeys(models))
+    items = list_dataset_images(dataset_path)
+    work_path = output_path / ".index" / "+".join(models)
+    work_path.mkdir(parents=True, exist_ok=True)
+
+    thumbnail_size = tuple(thumbnail_size) if thumbnail_size is not None else None
+    expected = {"version": 3, "dataset": str(dataset_path.resolve()), "models": models, "shard_size": shard_size,
+                "num_items": len(items), "items": content_hash("\n".join(p for p, _ in items).encode()),
+                "thumbnail_size": list(thumbnail_size) if thumbnail_size is not None else None}
+    manifest = load_manifest(work_path, expected, restart)
+    num_shards = (len(items) + shard_size - 1) // shard_size
+    remaining = [shard for shard in range(num_shards) if shard not in manifest["completed"]]
+
+    if remaining:
+        encoders = encoders or {model: make_encoder(model, batch_size, device, clip_model) for model in models}
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for shard in tqdm(remaining, desc=f"Indexation {'+'.join(models)}", unit="shard"):
+                shard_items = items[shard * shard_size:(shard + 1) * shard_size]
+                embeddings, positions, records, thumbnails = embed_items(encoders, shard_items, dataset_path / "train",
+                                                                         batch_size, cache, pool, thumbnail_size)
+                arrays = {f"embeddings_{model}": embeddings[model] for model in models}
+                if thumbnails is not None:
+                    arrays["thumbnails"] = thumbnails
+                # Les positions sont enregistrées en indices globaux, pour réassocier les catégories à l'assemblage
+                save_npz(work_path / f"shard_{shard:05d}.npz", items=positions + shard * shard_size,
+                         sizes=np.array([r["size"] for r in records], dtype=np.int64),
+                         mtimes=np.array([r["mtime"] for r in records], dtype=np.int64),
+                         hashes=np.array([r["hash"] for r in records], dtype="U32"),
+                         **arrays)
+                manifest["completed"].append(shard)
+                save_manifest(work_path, manifest)  # Le shard n'est compté comme terminé qu'une fois écrit
+        logging.info(f"{len(remaining)} shards calculés en {time.time() - start_time:.2f} secondes.")
+
+    collections = {model: finalize_index(work_path, output_path, model, items, num_shards, dtype, thumbnail_size)
+                   for model in models}
+    if pca_dim and "mobilenet" in models:  # Seule la recherche CBIR passe par un index FAISS
+        paths = collection_paths(output_path, OUTPUT_PREFIXES["mobilenet"])
+        collections["mobilenet"]["reduction"] = fit_collection(paths["embeddings"], paths["reduction"], pca_dim,
+                                                               whiten, paths["deleted"])
+    for model in models:
+        paths = collection_paths(output_path, OUTPUT_PREFIXES[model])
+        if code_bits:
+            binary_codes.fit_collection(paths["embeddings"], paths["codes"], code_bits, code_method, paths["deleted"])
+        elif binary_codes.refresh_codes(paths["codes"], paths["embeddings"]) is None:
+            continue
+        collections[model]["codes"] = paths["codes"]
+    return collections
+
+
+def finalize_index(work_path: Path, output_path: Path, model: str, items: list[tuple[str, str]],
+                   num_shards: int, dtype: str = "float32", thumbnail_size: tuple[int, int] = None) -> dict:
+    """ Assemble les shards en fichiers de collection chargés par les modules de recherche, et écrit le manifeste
+    des fichiers utilisé par la ré-indexation incrémentale (dans .index/<modèle>). Un seul shard est chargé en
+    mémoire à la fois.
+    :param work_path: Dossier de travail contenant les shards.
+    :param output_path: Dossier de sortie.
+    :param model: Modèle dont la collection est assemblée (voir OUTPUT_PREFIXES).
+    :param items: Liste de tuples (chemin relatif, catégorie) du dataset.
+    :param num_shards: Nombre total de shards.
+    :param dtype: Type de stockage des embeddings, parmi EMBEDDING_DTYPES.
+    :param thumbnail_size: Taille des vignettes de l'atlas (présentes dans les shards) ; sans atlas si None.
+    :return: Chemins des fichiers produits. """
+
+    shard_paths = [work_path / f"shard_{shard:05d}.npz" for shard in range(num_shards)]
+    num_rows, dim = 0, 0
+    for shard_path in shard_paths:  # Première passe : taille de la collection, sans charger les embeddings
+        with np.load(shard_path) as shard:
+            num_rows += len(shard["items"])
+            dim = shard[f"embeddings_{model}"].shape[1]
+
+    paths = collection_paths(output_path, OUTPUT_PREFIXES[model])
+    if thumbnail_size is None and paths["thumbnails"].exists():
+        paths["thumbnails"].unlink()  # Atlas d'une indexation précédente, qui ne serait plus aligné sur les lignes
+    # Réduction apprise sur la collection précédente : réapprise par build_indexes si pca_dim est donné
+    paths["reduction"].unlink(missing_ok=True)
+    files = {}
+    with EmbeddingWriter(paths, num_rows, dim, dtype, category_width=max((len(c) for _, c in items), default=1),
+                         path_width=max((len(p) for p, _ in items), default=1),
+                         thumbnail_size=thumbnail_size) as writer:
+        for shard_path in shard_paths:
+            with np.load(shard_path) as shard:
+                rows, sizes, mtimes, hashes = shard["items"], shard["sizes"], shard["mtimes"], shard["hashes"]
+                start = writer.write(shard[f"embeddings_{model}"], [items[item][1] for item in rows],
+                                     [items[item][0] for item in rows],
+                                     thumbnails=shard["thumbnails"] if thumbnail_size else None)
+            for offset, item in enumerate(rows):
+                files[items[item][0]] = {"size": int(sizes[offset]), "mtime": int(mtimes[offset]),
+                                         "hash": str(hashes[offset]), "row": start + offset}
+    files_path = output_path / ".index" / model
+    files_path.mkdir(parents=True, exist_ok=True)
+    save_file_manifest(files_path, files)
+    logging.info(f"Index {model} assemblé : {num_rows} images sur {len(items)}, sauvegardé dans {output_path}.")
+    return writer.paths
+
+
+def grow_header(path: Path, num_rows: int, rows: np.ndarray) -> tuple[int, bytes, np.dtype] | None:
+    """ Prépare l'agrandissement sur place d'un fichier .npy : des lignes écrites à la suite des num_rows premières
+    lignes, puis l'en-tête réécrit avec le nouveau nombre de lignes (numpy complète l'en-tête par des espaces, ce qui
+    laisse la place de nombres de lignes plus longs).
+    :param path: Fichier .npy de la colonne.
+    :param num_rows: Nombre de lignes conservées.
+    :param rows: Lignes ajoutées.
+    :return: Tuple (position des données, nouvel en-tête, type stocké), ou None si le fichier ne peut pas être agrandi
+    sur place (format d'en-tête, forme ou type incompatibles, chaînes plus longues que la colonne, en-tête trop
+    court). """
+
+    with open(path, "rb") as f:
+        version = np.lib.format.read_magic(f)
+        if version not in ((1, 0), (2, 0)):
+            return None
+        read_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_header(f)
+        offset = f.tell()
+    if fortran_order or shape[0] < num_rows or shape[1:] != rows.shape[1:]:
+        return None
+    if not np.can_cast(rows.dtype, dtype, "same_kind") or (dtype.kind == "U" and rows.dtype.itemsize > dtype.itemsize):
+        return None
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False,
+                   "shape": (num_rows + len(rows),) + shape[1:]})
+    header_length = offset - (10 if version == (1, 0) else 12)  # Après la signature, la version et la longueur
+    if len(header) + 1 > header_length:
+        return None
+    return offset, (header.ljust(header_length - 1) + "\n").encode("latin1"), dtype
+
+
+def write_rows(path: Path, header: tuple[int, bytes, np.dtype], num_rows: int, rows: np.ndarray):
+    """ Agrandit un fichier .npy sur place (voir grow_header). Les données sont écrites avant l'en-tête : un lecteur
+    voit l'ancien nombre de lignes tant que l'en-tête n'est pas réécrit. """
+
+    offset, header_bytes, dtype = header
+    rows = np.ascontiguousarray(rows, dtype=dtype)
+    with open(path, "r+b") as f:
+        f.seek(offset + num_rows * (rows.nbytes // len(rows)))
+        f.write(rows.tobytes())
+        f.truncate()  # Lignes d'une mise à jour interrompue, au-delà des nouvelles lignes
+        f.flush()
+        f.seek(offset - len(header_bytes))
+        f.write(header_bytes)
+
+
+def append_rows(paths: dict, num_rows: int, deleted: np.ndarray, embeddings: np.ndarray,
+                new_items: list[tuple[str, str]], thumbnails: np.ndarray = None):
+    """ Agrandit une collection existante. Les nouvelles lignes sont écrites sur place, à la suite des lignes
+    actuelles de chaque fichier (en recouvrant les lignes d'une mise à jour interrompue) : le coût ne dépend que du
+    nombre de lignes ajoutées. Le masque des lignes supprimées, qui fixe le nombre de lignes lues par les modules de
+    recherche, est écrit en dernier. À défaut (voir grow_header), la collection est
+    recopiée (voir rewrite_rows).
+    :param paths: Chemins des fichiers de la collection (voir collection_paths).
+    :param num_rows: Nombre de lignes actuelles de la collection.
+    :param deleted: Lignes supprimées actuelles (num_rows,).
+    :param embeddings: Embeddings des nouvelles lignes.
+    :param new_items: Liste de tuples (chemin relatif, catégorie) des nouvelles lignes.
+    :param thumbnails: Vignettes des nouvelles lignes, si la collection a un atlas. """
+
+    columns = {"embeddings": np.asarray(embeddings), "categories": np.array([c for _, c in new_items]),
+               "paths": np.array([p for p, _ in new_items])}
+    if thumbnails is not None:
+        columns["thumbnails"] = np.asarray(thumbnails)
+    headers = {name: grow_header(paths[name], num_rows, rows) for name, rows in columns.items()}
+    if any(header is None for header in headers.values()):
+        rewrite_rows(paths, num_rows, deleted, embeddings, new_items, thumbnails)
+        return
+    for name, rows in columns.items():
+        write_rows(paths[name], headers[name], num_rows, rows)
+    save_npy(paths["deleted"], np.concatenate([deleted[:num_rows], np.zeros(len(new_items), dtype=bool)]))
+
+
+def rewrite_rows(paths: dict, num_rows: int, deleted: np.ndarray, embeddings: np.ndarray,
+                 new_items: list[tuple[str, str]], thumbnails: np.ndarray = None):
+    """ Agrandit une collection existante en la recopiant : les lignes actuelles sont recopiées par blocs dans de
+    nouveaux fichiers projetés en mémoire, suivies des nouvelles lignes (voir append_rows pour les paramètres). """
+
+    names = ("embeddings", "categories", "paths") + (("thumbnails",) if thumbnails is not None else ())
+    stored = {name: np.load(paths[name], mmap_mode="r") for name in names}
+    category_width = max([stored["categories"].dtype.itemsize // 4] + [len(c) for _, c in new_items])
+    path_width = max([stored["paths"].dtype.itemsize // 4] + [len(p) for p, _ in new_items])
+    thumbnail_size = thumbnails.shape[2:0:-1] if thumbnails is not None else None
+    with EmbeddingWriter(paths, num_rows + len(new_items), stored["embeddings"].shape[1],
+                         stored["embeddings"].dtype.name, category_width, path_width, thumbnail_size) as writer:
+        for start in range(0, num_rows, COPY_CHUNK_ROWS):
+            end = min(start + COPY_CHUNK_ROWS, num_rows)
+            writer.write(stored["embeddings"][start:end], stored["categories"][start:end],
+                         stored["paths"][start:end], deleted[start:end],
+                         stored["thumbnails"][start:end] if thumbnails is not None else None)
+        writer.write(embeddings, [c for _, c in new_items], [p for p, _ in new_items], thumbnails=thumbnails)
+        del stored  # Libère les projections des anciens fichiers avant leur remplacement
+
+
+def update_index(dataset_path: str | os.PathLike, output_path: str | os.PathLike, model: str = "mobilenet",
+                 batch_size: int = 32, workers: int = 4, cache: DiskCache = None, device: str = None,
+                 clip_model: str = "ViT-B/32", encoder=None) -> dict:
+    """ Met à jour une collection déjà construite (voir update_indexes).
+    :param model: Modèle utilisé, parmi les clés de ENCODERS.
+    :param encoder: Encodeur déjà construit ; par défaut, il n'est construit que s'il y a des images à encoder.
+    :return: Nombre d'images ajoutées, modifiées, supprimées et inchangées. """
+
+    return update_indexes(dataset_path, output_path, models=(model,), batch_size=batch_size, workers=workers,
+                          cache=cache, device=device, clip_model=clip_model,
+                          encoders={model: encoder} if encoder is not None else None)
+
+
+def built_models(output_path: Path) -> list[str]:
+    """ Liste les modèles dont une collection a été construite dans un dossier (voir finalize_index). """
+
+    return [model for model in ENCODERS if (output_path / ".index" / model / "files.json").exists()]
+
+
+def update_indexes(dataset_path: str | os.PathLike, output_path: str | os.PathLike, models=None,
+                   batch_size: int = 32, workers: int = 4, cache: DiskCache = None, device: str = None,
+                   clip_model: str = "ViT-B/32", encoders: dict = None) -> dict:
+    """ Met à jour des collections déjà construites, en n'encodant que les images nouvelles ou modifiées.
+    Une image est considérée inchangée si sa taille et sa date de modification n'ont pas changé, ou à défaut si
+    l'empreinte de son contenu est identique. Les images modifiées sont ré-encodées sur leur ligne, les nouvelles
+    ajoutées en fin de collection, et les images disparues marquées comme supprimées. L'atlas de vignettes, s'il
+    existe, est tenu à jour de la même façon.
+    Les collections construites ensemble (mêmes lignes, dans le même ordre, voir build_indexes) sont mises à jour en
+    une seule passe, chaque image n'étant lue et décodée qu'une fois : elles restent alignées. Une mise à jour
+    interrompue, y compris entre deux collections, est rejouée au passage suivant (les manifestes sont écrits en
+    dernier).
+    :param dataset_path: Dossier tiny-imagenet-200.
+    :param output_path: Dossier des collections (voir build_indexes).
+    :param models: Modèles mis à jour, parmi les clés de ENCODERS ; par défaut, tous ceux dont une collection a été
+    construite dans output_path.
+    :param batch_size: Nombre d'images par passe du modèle.
+    :param workers: Nombre de threads de lecture et de décodage.
+    :param cache: Cache disque des embeddings (optionnel).
+    :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
+    :param clip_model: Nom du modèle CLIP ou chemin vers un point de contrôle local.
+    :param encoders: Dictionnaire modèle -> encodeur déjà construit ; par défaut, les encodeurs ne sont construits que
+    s'il y a des images à encoder.
+    :return: Nombre d'images ajoutées, modifiées, supprimées et inchangées.
+    :raises FileNotFoundError: Si aucune collection n'a été construite dans output_path.
+    :raises ValueError: Si les collections mises à jour ne sont pas alignées, ou si une collection alignée sur elles
+    est laissée de côté (elle ne le serait plus après la mise à jour). """
+
+    dataset_path, output_path = Path(dataset_path), Path(output_path)
+    train_path = dataset_path / "train"
+    available = built_models(output_path)
+    models = list(dict.fromkeys(models or available))
+    if not models:
+        raise FileNotFoundError(f"Aucune collection construite dans {output_path}. Lancer d'abord "
+                                f"python -m src.index build.")
+    paths = {model: collection_paths(output_path, OUTPUT_PREFIXES[model]) for model in models}
+    files = load_file_manifest(output_path / ".index" / models[0])
+    # Le manifeste, écrit en dernier, fait foi : les lignes au-delà de la dernière qu'il référence et le masque des
+    # lignes supprimées d'une mise à jour interrompue avant son écriture sont ignorés, puis recouverts par cette mise à
+    # jour (qui rejoue la précédente). Seules les lignes du manifeste sont vivantes.
+    rows = {path: entry["row"] for path, entry in files.items()}
+    num_rows = max(rows.values(), default=-1) + 1
+    deleted = np.ones(num_rows, dtype=bool)
+    deleted[list(rows.values())] = False
+
+    # Alignement des collections : mêmes images sur les mêmes lignes
+    for model in available:
+        other = load_file_manifest(output_path / ".index" / model)
+        aligned = {path: entry["row"] for path, entry in other.items()} == rows
+        if model in models and not aligned:
+            raise ValueError(f"Les collections {models[0]} et {model} ne sont pas alignées : les mettre à jour "
+                             f"séparément (--model).")
+        if model not in models and aligned:
+            raise ValueError(f"La collection {model} est alignée sur {models[0]} : la mettre à jour en même temps "
+                             f"(--model {' '.join(models + [model])}).")
+
+    thumbnail_sizes = {model: np.load(paths[model]["thumbnails"], mmap_mode="r").shape[2:0:-1]  # (largeur, hauteur)
+                       for model in models if paths[model]["thumbnails"].exists()}
+    if len(set(thumbnail_sizes.values())) > 1:
+        raise ValueError(f"Atlas de vignettes de tailles différentes : {thumbnail_sizes}.")
+    thumbnail_size = next(iter(thumbnail_sizes.values()), None)
+
+    # Repérage des changements : la date de modification et la taille évitent de relire les fichiers inchangés
+    changed, unchanged = [], 0
+    seen = set()
+    for path, category in list_dataset_images(dataset_path):
+        entry = files.get(path)
+        try:
+            stat = os.stat(train_path / path)
+            if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                seen.add(path)
+                unchanged += 1
+                continue
+            if entry is not None:
+                with open(train_path / path, "rb") as f:
+                    if content_hash(f.read()) == entry["hash"]:  # Fichier touché mais contenu identique
+                        seen.add(path)
+                        entry["mtime"], unchanged = stat.st_mtime_ns, unchanged + 1
+                        continue
+        except FileNotFoundError:  # Supprimé depuis le listage du dataset : traité comme une image disparue
+            continue
+        seen.add(path)
+        changed.append((path, category))
+
+    removed = [path for path in files if path not in seen]
+    for path in removed:
+        deleted[files.pop(path)["row"]] = True
+
+    counts = {"added": 0, "modified": 0, "removed": len(removed), "unchanged": unchanged}
+    updates, additions, new_items, new_thumbnails = {}, [], [], []
+    if changed:
+        encoders = encoders or {model: make_encoder(model, batch_size, device, clip_model) for model in models}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            embeddings, positions, records, thumbnails = embed_items(encoders, changed, train_path, batch_size,
+                                                                     cache, pool, thumbnail_size)
+        succeeded = set()
+        for j, (position, record) in enumerate(zip(positions, records)):
+            path, category = changed[position]
+            row_embeddings = {model: embeddings[model][j] for model in models}
+            thumbnail = thumbnails[j] if thumbnails is not None else None
+            succeeded.add(path)
+            if path in files:  # Image modifiée : ré-encodée sur sa ligne
+                updates[files[path]["row"]] = (row_embeddings, thumbnail)
+                counts["modified"] += 1
+            else:  # Nouvelle image : ajoutée en fin de collection
+                files[path] = {"row": num_rows + len(additions)}
+                additions.append(row_embeddings)
+                new_items.append((path, category))
+                new_thumbnails.append(thumbnail)
+                counts["added"] += 1
+            files[path].update(record)
+        for path, _ in changed:  # Image modifiée devenue illisible : retirée, réessayée au prochain passage
+            if path in files and path not in succeeded:
+                deleted[files.pop(path)["row"]] = True
+                counts["removed"] += 1
+
+    for model in models:
+        # Mise à jour de la collection : lignes modifiées sur place, puis ajout des nouvelles lignes
+        has_atlas = model in thumbnail_sizes
+        if updates:
+            stored = np.load(paths[model]["embeddings"], mmap_mode="r+")
+            atlas = np.load(paths[model]["thumbnails"], mmap_mode="r+") if has_atlas else None
+            for row, (row_embeddings, thumbnail) in updates.items():
+                stored[row] = row_embeddings[model]
+                if atlas is not None:
+                    atlas[row] = thumbnail
+            stored.flush()
+            if atlas is not None:
+                atlas.flush()
+            del stored, atlas
+        if additions:
+            append_rows(paths[model], num_rows, deleted, np.array([row[model] for row in additions]), new_items,
+                        np.array(new_thumbnails) if has_atlas else None)
+        else:
+            save_npy(paths[model]["deleted"], deleted)
+        if updates or additions:  # Codes binaires des seules lignes modifiées et ajoutées
+            binary_codes.update_codes(paths[model]["codes"], paths[model]["embeddings"],
+                                      list(updates) + list(range(num_rows, num_rows + len(additions))))
+    for model in models:  # En dernier : une mise à jour interrompue est simplement rejouée
+        save_file_manifest(output_path / ".index" / model, files)
+    logging.info(f"Mise à jour incrémentale ({'+'.join(models)}) : {counts}.")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexation hors ligne du dataset Tiny ImageNet.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Calcule (ou reprend) l'indexation et assemble les fichiers")
+    build_parser.add_argument("--model", nargs="+", choices=ENCODERS, default=["mobilenet"],
+                              help="Modèle(s) indexé(s) ; plusieurs modèles partagent la lecture et le décodage")
+    build_parser.add_argument("--shard-size", type=int, default=4096, help="Nombre d'images par shard")
+    build_parser.add_argument("--restart", action="store_true", help="Ignorer les shards déjà calculés")
+    build_parser.add_argument("--dtype", choices=EMBEDDING_DTYPES, default="float32",
+                              help="Type de stockage des embeddings assemblés")
+    build_parser.add_argument("--thumbnails", action="store_true",
+                              help="Produire l'atlas de vignettes lu par les pages de résultats")
+    build_parser.add_argument("--thumbnail-size", type=int, default=THUMBNAIL_SIZE[0],
+                              help="Côté (en pixels) des vignettes carrées de l'atlas")
+    build_parser.add_argument("--pca-dim", type=int, default=None,
+                              help="Dimension de la réduction (ACP) apprise sur la collection MobileNetV3 (voir "
+                                   "src.reduction)")
+    build_parser.add_argument("--whiten", action="store_true", help="Blanchiment des composantes de la réduction")
+    build_parser.add_argument("--code-bits", type=int, default=None,
+                              help="Nombre de bits des codes binaires appris sur chaque collection (voir "
+                                   "src.binary_codes)")
+    build_parser.add_argument("--code-method", choices=binary_codes.METHODS, default="itq",
+                              help="Apprentissage des codes binaires")
+
+    update_parser = subparsers.add_parser("update", help="Ré-indexation incrémentale d'une collection existante")
+    update_parser.add_argument("--model", nargs="+", choices=ENCODERS, default=None,
+                               help="Modèle(s) mis à jour (par défaut, toutes les collections construites) ; les "
+                                    "collections construites ensemble doivent être mises à jour ensemble")
+    for sub_parser in (build_parser, update_parser):
+        sub_parser.add_argument("--dataset", default=RESSOURCES_PATH / "tiny-imagenet-200",
+                                help="Dossier tiny-imagenet-200 local")
+        sub_parser.add_argument("--output", default=RESSOURCES_PATH, help="Dossier de sortie des fichiers .npy")
+        sub_parser.add_argument("--clip-model", default="ViT-B/32",
+                                help="Nom du modèle CLIP ou chemin vers un point de contrôle local")
+        sub_parser.add_argument("--batch-size", type=int, default=32, help="Nombre d'images par passe du modèle")
+        sub_parser.add_argument("--workers", type=int, default=4, help="Threads de lecture et de décodage")
+        sub_parser.add_argument("--device", default=None, help="'cuda' ou 'cpu' (déduit automatiquement par défaut)")
+        sub_parser.add_argument("--no-cache", action="store_true", help="Ne pas utiliser le cache disque")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    cache = None if args.no_cache else DiskCache()
+    if args.command == "build":
+        collections = build_indexes(args.dataset, args.output, models=args.model, shard_size=args.shard_size,
+                                    batch_size=args.batch_size, workers=args.workers, cache=cache,
+                                    restart=args.restart, device=args.device, clip_model=args.clip_model,
+                                    dtype=args.dtype,
+                                    thumbnail_size=(args.thumbnail_size,) * 2 if args.thumbnails else None,
+                                    pca_dim=args.pca_dim, whiten=args.whiten, code_bits=args.code_bits,
+                                    code_method=args.code_method)
+        for model, paths in collections.items():
+            for name, path in paths.items():
+                print(f"{model} {name} : {path}")
+    else:
+        counts = update_indexes(args.dataset, args.output, models=args.model, batch_size=args.batch_size,
+                                workers=args.workers, cache=cache, device=args.device, clip_model=args.clip_model)
+        print(", ".join(f"{name} : {count}" for name, count in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+""" Module d'ingestion du dataset Open Images. Usage : python -m src.ingest --source <dossier|URL> [options]
+
+Ce module construit les fichiers chargés par les modules de recherche pour Open Images (mobilenet_embeddings.npy,
+clip_embeddings.npy et image_urls.json), à partir d'une source d'images interchangeable :
+
+    - Un dossier local (copie du bucket), dont les images sont listées dans un ordre déterministe.
+    - Un serveur HTTP (le bucket S3, ou un serveur local qui le remplace), accompagné de la liste des clés à ingérer
+    (fichier texte, une clé par ligne, ou un image_urls.json existant pour conserver la numérotation actuelle).
+
+Les images sont téléchargées et décodées par un pool de threads, avec un nombre borné de requêtes en vol et des
+connexions HTTP réutilisées (requests.Session). Le pool continue de télécharger pendant que le modèle calcule les
+embeddings du lot précédent : la latence réseau se superpose à l'inférence au lieu de s'y ajouter. Chaque image n'est
+décodée qu'une fois, pour tous les modèles, et les embeddings sont écrits au fil de l'eau dans des fichiers projetés
+en mémoire (voir EmbeddingWriter). La table identifiant -> clé (image_urls.json) est écrite en dernier. """
+
+import argparse, json, logging, os, time, numpy as np, requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+from urllib3.util.retry import Retry
+from src.cache import DiskCache, atomic_write_bytes, cache_key
+from src.image_preprocessing import ALLOWED_EXTENSIONS
+from src.index import ENCODERS, EMBEDDING_DTYPES, EmbeddingWriter, decode_image, make_encoder
+from src import binary_codes
+from src.reduction import fit_collection
+
+RESSOURCES_PATH = Path(__file__).parent.parent / "ressources" / "open-images"
+
+# Fichier d'embeddings produit pour chaque modèle, tel qu'attendu par similarity_search et clip_similarity_search
+OUTPUT_FILES = {
+    "mobilenet": "mobilenet_embeddings.npy",
+    "clip": "clip_embeddings.npy",
+}
+
+# Fichier de la réduction de dimension des embeddings MobileNetV3 (voir src.reduction), lu par similarity_search
+REDUCTION_FILE = "mobilenet_pca.faiss"
+
+# Fichier des codes binaires de chaque modèle (voir src.binary_codes)
+CODES_FILES = {
+    "mobilenet": "mobilenet_codes.npz",
+    "clip": "clip_codes.npz",
+}
+
+# Délai maximal (en secondes) d'une requête HTTP, et nombre de nouvelles tentatives sur les erreurs serveur
+HTTP_TIMEOUT = 10
+HTTP_RETRIES = 3
+
+
+class LocalBlobSource:
+    """ Source d'images : un dossier local, dont les clés sont les chemins relatifs des images. """
+
+    def __init__(self, directory: str | os.PathLike, keys: list[str] = None):
+        """ :param directory: Dossier racine des images.
+        :param keys: Clés des images à ingérer ; par défaut, toutes les images du dossier. """
+
+        self.directory = Path(directory)
+        self.key_list = list(keys) if keys is not None else None
+
+    def keys(self) -> list[str]:
+        """ Liste les clés des images à ingérer (par défaut celles du dossier, sous-dossiers compris, triées). """
+
+        if self.key_list is not None:
+            return self.key_list
+        return sorted(path.relative_to(self.directory).as_posix() for path in self.directory.rglob("*")
+                      if path.is_file() and path.suffix.lower() in ALLOWED_EXTENSIONS)
+
+    def fetch(self, key: str) -> bytes:
+        """ Lit les octets bruts d'une image. """
+
+        with open(self.directory / key, "rb") as f:
+            return f.read()
+
+
+class HttpBlobSource:
+    """ Source d'images : un serveur HTTP (bucket S3 public ou serveur local), avec une liste de clés connue. """
+
+    def __init__(self, base_url: str, keys: list[str], pool_size: int = 16, timeout: float = HTTP_TIMEOUT):
+        """ Prépare une session HTTP dont les connexions sont réutilisées d'une requête à l'autre.
+        :param base_url: URL de base ; l'URL d'une image est base_url suivie de sa clé.
+        :param keys: Clés des images à ingérer.
+        :param pool_size: Nombre maximal de connexions conservées (au moins le nombre de threads de téléchargement).
+        :param timeout: Délai maximal d'une requête, en secondes. """
+
+        self.base_url = base_url if base_url.endswith("/") else base_url + "/"
+        self.key_list = list(keys)
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=HTTP_RETRIES, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def keys(self) -> list[str]:
+        """ Retourne les clés des images à ingérer. """
+
+        return self.key_list
+
+    def fetch(self, key: str) -> bytes:
+        """ Télécharge les octets bruts d'une image.
+        :raises requests.HTTPError: Si le serveur renvoie une erreur. """
+
+        response = self.session.get(self.base_url + key, timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+
+def load_keys(keys_file: str | os.PathLike) -> list[str]:
+    """ Charge la liste des clés à ingérer.
+    :param keys_file: Fichier texte (une clé par ligne) ou table identifiant -> clé au format JSON (image_urls.json),
+    dont l'ordre des identifiants est conservé.
+    :return: Liste des clés. """
+
+    with open(keys_file) as f:
+        if str(keys_file).endswith(".json"):
+            mapping = json.load(f)
+            return [mapping[index] for index in sorted(mapping, key=int)]
+        return [line.strip() for line in f if line.strip()]
+
+
+def open_source(source: str, keys_file: str | os.PathLike = None, pool_size: int = 16):
+    """ Construit la source d'images correspondant à un dossier local ou à une URL.
+    :param source: Dossier local, ou URL de base (http:// ou https://).
+    :param keys_file: Liste des clés (voir load_keys), obligatoire pour une source HTTP.
+    :param pool_size: Nombre maximal de connexions HTTP conservées.
+    :return: Source d'images (LocalBlobSource ou HttpBlobSource).
+    :raises ValueError: Si la liste des clés d'une source HTTP n'est pas fournie. """
+
+    if source.startswith(("http://", "https://")):
+        if keys_file is None:
+            raise ValueError("Une source HTTP ne peut pas être listée : fournir la liste des clés (--keys).")
+        return HttpBlobSource(source, load_keys(keys_file), pool_size=pool_size)
+    return LocalBlobSource(source, load_keys(keys_file) if keys_file is not None else None)
+
+
+def fetch_stream(source, keys: list[str], encoders: dict, cache: DiskCache = None, workers: int = 16,
+                 max_in_flight: int = None):
+    """ Télécharge et décode les images dans un pool de threads, en conservant l'ordre des clés.
+    Au plus max_in_flight images sont en cours de traitement ou en attente : la mémoire reste bornée, et le pool
+    continue de travailler pendant que l'appelant calcule les embeddings.
+    :param source: Source d'images (voir open_source).
+    :param keys: Clés des images.
+    :param encoders: Dictionnaire modèle -> encodeur.
+    :param cache: Cache disque des embeddings (optionnel) ; une image dont tous les embeddings sont en cache n'est
+    pas décodée.
+    :param workers: Nombre de threads de téléchargement et de décodage.
+    :param max_in_flight: Nombre maximal d'images en vol (par défaut 4 fois le nombre de threads).
+    :return: Générateur de tuples (clé, embeddings en cache par modèle, clés de cache des modèles manquants, image
+    décodée ou None). Les images en erreur sont signalées puis omises. """
+
+    input_size = tuple(max(encoder.input_size[i] for encoder in encoders.values()) for i in range(2))
+
+    def fetch(key):
+        try:
+            data = source.fetch(key)
+            cached, missing = {}, {}
+            for name, encoder in encoders.items():
+                entry = cache_key(data, "features", encoder.cache_config) if cache is not None else None
+                embedding = cache.get(entry) if entry is not None else None
+                if embedding is not None:
+                    cached[name] = embedding
+                else:
+                    missing[name] = entry
+            return key, cached, missing, decode_image(data, input_size) if missing else None
+        except Exception as e:
+            logging.error(f"Erreur avec {key}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending, remaining = deque(), iter(keys)
+        for key in remaining:
+            pending.append(pool.submit(fetch, key))
+            if len(pending) >= (max_in_flight or 4 * workers):
+                break
+        while pending:
+            result = pending.popleft().result()
+            for key in remaining:  # Remplace l'image consommée par la suivante
+                pending.append(pool.submit(fetch, key))
+                break
+            if result is not None:
+                yield result
+
+
+def ingest(source, output_path: str | os.PathLike = RESSOURCES_PATH, models=("mobilenet", "clip"),
+           batch_size: int = 32, workers: int = 16, cache: DiskCache = None, device: str = None,
+           clip_model: str = "ViT-B/32", encoders: dict = None, dtype: str = "float32", pca_dim: int = None,
+           whiten: bool = False, code_bits: int = None, code_method: str = "itq") -> dict:
+    """ Ingère les images d'une source : calcule leurs embeddings pour chaque modèle et écrit les fichiers de la
+    collection Open Images, avec des identifiants identiques pour tous les modèles.
+    :param source: Source d'images (voir open_source).
+    :param output_path: Dossier de sortie.
+    :param models: Modèles utilisés, parmi les clés de OUTPUT_FILES.
+    :param batch_size: Nombre d'images par passe du modèle.
+    :param workers: Nombre de threads de téléchargement et de décodage.
+    :param cache: Cache disque des embeddings (optionnel).
+    :param device: 'cuda' ou 'cpu'. Si None, l'appareil est déduit automatiquement.
+    :param clip_model: Nom du modèle CLIP ou chemin vers un point de contrôle local.
+    :param encoders: Dictionnaire modèle -> encodeur déjà construit (par défaut, voir make_encoder).
+    :param dtype: Type de stockage des embeddings, parmi EMBEDDING_DTYPES.
+    :param pca_dim: Dimension de la réduction apprise sur la collection MobileNetV3 (voir src.reduction) ; sans
+    réduction si None.
+    :param whiten: Blanchiment des composantes de la réduction.
+    :param code_bits: Nombre de bits des codes binaires appris sur chaque collection (voir src.binary_codes) ; si None,
+    les codes existants sont ré-encodés avec leur projection.
+    :param code_method: Méthode d'apprentissage des codes binaires, parmi binary_codes.METHODS.
+    :return: Chemins des fichiers produits. """
+
+    output_path = Path(output_path)
+    output_path.mkdir(parents=True, exist_ok=True)
+    models = list(dict.fromkeys(models))
+    encoders = encoders or {model: make_encoder(model, batch_size, device, clip_model) for model in models}
+    keys = source.keys()
+    paths = {model: output_path / OUTPUT_FILES[model] for model in models}
+    writers = {model: EmbeddingWriter({"embeddings": paths[model]}, len(keys), encoders[model].dim, dtype)
+               for model in models}
+    image_keys = []
+    start_time = time.time()
+
+    def flush(batch):
+        """ Calcule les embeddings manquants d'un lot et l'écrit à la suite de chaque collection. """
+        embeddings = {model: np.empty((len(batch), encoders[model].dim), dtype=np.float32) for model in models}
+        for model in models:
+            if any(model in missing for _, _, missing, _ in batch):
+                batch_embeddings = encoders[model].encode(len(batch))  # Positions non remplies ignorées ci-dessous
+            for slot, (_, cached, missing, _) in enumerate(batch):
+                if model in missing:
+                    embeddings[model][slot] = batch_embeddings[slot]
+                    if missing[model] is not None:
+                        cache.put(missing[model], batch_embeddings[slot])
+                else:
+                    embeddings[model][slot] = cached[model]
+        for model in models:
+            writers[model].write(embeddings[model])
+        image_keys.extend(key for key, _, _, _ in batch)
+
+    try:
+        batch = []
+        for key, cached, missing, image in tqdm(fetch_stream(source, keys, encoders, cache, workers),
+                                                total=len(keys), desc="Ingestion", unit="image"):
+            try:
+                for model in missing:
+                    encoders[model].put(len(batch), image)
+            except Exception as e:
+                logging.error(f"Erreur avec {key}: {e}")
+                continue
+            batch.append((key, cached, missing, image))
+            if len(batch) == batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        for writer in writers.values():
+            if writer.position < writer.num_rows:  # Images en erreur : fichiers ramenés au nombre de lignes écrites
+                writer.shrink()
+            writer.close()
+    except BaseException:
+        for writer in writers.values():
+            writer.abort()
+        raise
+
+    # En dernier : la table identifiant -> clé ne référence que des lignes déjà écrites
+    urls_path = output_path / "image_urls.json"
+    atomic_write_bytes(urls_path, json.dumps({str(row): key for row, key in enumerate(image_keys)}).encode())
+    logging.info(f"{len(image_keys)} images ingérées sur {len(keys)} en {time.time() - start_time:.2f} secondes.")
+    if "mobilenet" in models:  # Réduction apprise sur la collection précédente : remplacée, ou supprimée
+        (output_path / REDUCTION_FILE).unlink(missing_ok=True)
+    if pca_dim and "mobilenet" in models:  # Seule la recherche CBIR passe par un index FAISS
+        paths["reduction"] = fit_collection(paths["mobilenet"], output_path / REDUCTION_FILE, pca_dim, whiten)
+    for model in models:
+        codes_file = output_path / CODES_FILES[model]
+        if code_bits:
+            paths[f"{model}_codes"] = binary_codes.fit_collection(paths[model], codes_file, code_bits, code_method)
+        elif binary_codes.refresh_codes(codes_file, paths[model]) is not None:
+            paths[f"{model}_codes"] = codes_file
+    return {**paths, "image_urls": urls_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion du dataset Open Images depuis un dossier ou un serveur HTTP.")
+    parser.add_argument("--source", required=True, help="Dossier local ou URL de base du bucket (http:// ou https://)")
+    parser.add_argument("--keys", default=None,
+                        help="Liste des clés : fichier texte (une par ligne) ou image_urls.json existant")
+    parser.add_argument("--output", default=RESSOURCES_PATH, help="Dossier de sortie des fichiers")
+    parser.add_argument("--model", nargs="+", choices=ENCODERS, default=["mobilenet", "clip"])
+    parser.add_argument("--clip-model", default="ViT-B/32",
+                        help="Nom du modèle CLIP ou chemin vers un point de contrôle local")
+    parser.add_argument("--batch-size", type=int, default=32, help="Nombre d'images par passe du modèle")
+    parser.add_argument("--workers", type=int, default=16, help="Threads de téléchargement et de décodage")
+    parser.add_argument("--device", default=None, help="'cuda' ou 'cpu' (déduit automatiquement par défaut)")
+    parser.add_argument("--no-cache", action="store_true", help="Ne pas utiliser le cache disque")
+    parser.add_argument("--dtype", choices=EMBEDDING_DTYPES, default="float32", help="Type de stockage des embeddings")
+    parser.add_argument("--pca-dim", type=int, default=None,
+                        help="Dimension de la réduction (ACP) apprise sur la collection MobileNetV3 (voir "
+                             "src.reduction)")
+    parser.add_argument("--whiten", action="store_true", help="Blanchiment des composantes de la réduction")
+    parser.add_argument("--code-bits", type=int, default=None,
+                        help="Nombre de bits des codes binaires appris sur chaque collection (voir src.binary_codes)")
+    parser.add_argument("--code-method", choices=binary_codes.METHODS, default="itq",
+                        help="Apprentissage des codes binaires")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    source = open_source(args.source, args.keys, pool_size=args.workers)
+    paths = ingest(source, args.output, models=args.model, batch_size=args.batch_size, workers=args.workers,
+                   cache=None if args.no_cache else DiskCache(), device=args.device, clip_model=args.clip_model,
+                   dtype=args.dtype, pca_dim=args.pca_dim, whiten=args.whiten, code_bits=args.code_bits,
+                   code_method=args.code_method)
+    for name, path in paths.items():
+        print(f"{name} : {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+""" Module de mesure des étapes d'une recherche, exportées au format texte de Prometheus.
+
+Lorsqu'une recherche est lente, il faut savoir si le temps est passé dans le prétraitement, la construction du modèle,
+la passe du modèle, la recherche FAISS, la résolution des chemins ou le téléchargement des vignettes. Ce module fournit :
+
+    - span(étape) : bloc chronométré. Sa durée alimente l'histogramme pixmatcher_stage_seconds{stage=...}, et une
+    exception levée dans le bloc incrémente pixmatcher_errors_total{stage=...}.
+    - request(type) : bloc englobant une requête (page de recherche, requête du service). Sa durée alimente
+    pixmatcher_request_seconds ; les durées des étapes exécutées dans le même thread sont regroupées et, si
+    PIXMATCHER_METRICS_LOG est définie, journalisées en une ligne JSON par requête.
+    - count et observe_size : compteurs (accès aux caches, erreurs) et histogrammes de tailles (lots).
+    - render : export au format texte de Prometheus, servi par GET /metrics (start_metrics_server, et route /metrics
+    du service de recherche).
+
+Les mesures ne sont actives que si la variable d'environnement PIXMATCHER_METRICS est définie (ou après enable()).
+Désactivées, span et request retournent un gestionnaire de contexte vide partagé : le coût se limite à un test. """
+
+import contextlib, contextvars, json, logging, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Activation des mesures, et journalisation JSON de chaque requête
+enabled = os.environ.get("PIXMATCHER_METRICS", "") not in ("", "0")
+log_requests = os.environ.get("PIXMATCHER_METRICS_LOG", "") not in ("", "0")
+
+# Port local de l'export /metrics des pages Streamlit (aucun export si absent)
+METRICS_PORT = int(os.environ.get("PIXMATCHER_METRICS_PORT", 0))
+
+# Bornes (en secondes) des histogrammes de durée, et bornes des histogrammes de taille de lot
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# Description des métriques, reprise dans l'export
+METRICS_HELP = {
+    "pixmatcher_stage_seconds": "Durée des étapes d'une recherche",
+    "pixmatcher_request_seconds": "Durée totale des requêtes",
+    "pixmatcher_requests_total": "Nombre de requêtes",
+    "pixmatcher_errors_total": "Nombre d'erreurs, par étape",
+    "pixmatcher_cache_total": "Accès aux caches, par résultat (hit ou miss)",
+    "pixmatcher_batch_size": "Taille des lots traités",
+}
+
+# Exceptions de contrôle de Streamlit (st.rerun, st.stop), qui interrompent une page sans erreur : reconnues par leur
+# nom, sans importer Streamlit
+CONTROL_FLOW_EXCEPTIONS = ("RerunException", "StopException")
+
+# Trace de la requête en cours dans le thread (durées de ses étapes)
+current_request = contextvars.ContextVar("pixmatcher_request", default=None)
+
+# Gestionnaire de contexte vide, retourné lorsque les mesures sont désactivées
+NULL_CONTEXT = contextlib.nullcontext()
+
+
+class Histogram:
+    """ Histogramme cumulatif au sens de Prometheus (nombre d'observations inférieures ou égales à chaque borne). """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """ Ensemble des compteurs et histogrammes d'un processus, partagé par tous les threads. """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets: tuple = DURATION_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def render(self) -> str:
+        """ Exporte les métriques au format texte de Prometheus (version 0.0.4). """
+
+        def format_labels(labels, extra=()):
+            pairs = [f'{name}="{str(value)}"' for name, value in (*labels, *extra)]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines, declared = [], set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {METRICS_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                declare(name, "counter")
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                declare(name, "histogram")
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Métriques du processus
+registry = Registry()
+
+
+def is_error(exc_type) -> bool:
+    """ Indique si un bloc s'est terminé par une erreur (exception autre qu'un contrôle de Streamlit). """
+
+    return exc_type is not None and exc_type.__name__ not in CONTROL_FLOW_EXCEPTIONS
+
+
+class Span:
+    """ Bloc chronométré (voir span). """
+
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        registry.observe("pixmatcher_stage_seconds", duration, stage=self.stage)
+        if is_error(exc_type):
+            registry.inc("pixmatcher_errors_total", stage=self.stage)
+        trace = current_request.get()
+        if trace is not None:
+            stages = trace["stages_ms"]
+            stages[self.stage] = stages.get(self.stage, 0) + duration * 1000
+        return False
+
+
+class Request:
+    """ Bloc englobant une requête (voir request). """
+
+    __slots__ = ("kind", "trace", "token", "start")
+
+    def __init__(self, kind: str):
+        self.kind = kind
+
+    def __enter__(self) -> dict:
+        self.trace = {"request": self.kind, "stages_ms": {}}
+        self.token = current_request.set(self.trace)
+        self.start = time.perf_counter()
+        return self.trace
+
+    def __exit__(self, exc_type, exc, traceback):
+        duration = time.perf_counter() - self.start
+        current_request.reset(self.token)
+        registry.observe("pixmatcher_request_seconds", duration, request=self.kind)
+        registry.inc("pixmatcher_requests_total", request=self.kind)
+        self.trace["total_ms"] = duration * 1000
+        if is_error(exc_type):
+            registry.inc("pixmatcher_errors_total", stage="request", request=self.kind)
+            self.trace["error"] = exc_type.__name__
+        if log_requests:
+            logging.info(json.dumps(self.trace))
+        return False
+
+
+def span(stage: str):
+    """ Chronomètre un bloc : with metrics.span("faiss_search"): ...
+    :param stage: Nom de l'étape (étiquette stage des métriques).
+    :return: Gestionnaire de contexte (vide si les mesures sont désactivées). """
+
+    return Span(stage) if enabled else NULL_CONTEXT
+
+
+def request(kind: str):
+    """ Délimite une requête : with metrics.request("cbir") as trace: ...
+    :param kind: Type de requête (étiquette request des métriques).
+    :return: Gestionnaire de contexte, qui fournit la trace de la requête (None si les mesures sont désactivées). """
+
+    return Request(kind) if enabled else NULL_CONTEXT
+
+
+def count(name: str, value: float = 1, **labels):
+    """ Incrémente un compteur (par exemple pixmatcher_cache_total, cache="features", result="hit"). """
+
+    if enabled:
+        registry.inc(name, value, **labels)
+
+
+def observe_size(name: str, value: float, **labels):
+    """ Ajoute une observation à un histogramme de tailles (par exemple pixmatcher_batch_size). """
+
+    if enabled:
+        registry.observe(name, value, SIZE_BUCKETS, **labels)
+
+
+def enable(requests_log: bool = False):
+    """ Active les mesures (et la journalisation JSON des requêtes si demandé), sans variable d'environnement. """
+
+    global enabled, log_requests
+    enabled, log_requests = True, requests_log
+
+
+def disable():
+    """ Désactive les mesures. """
+
+    global enabled, log_requests
+    enabled, log_requests = False, False
+
+
+def send_metrics(handler: BaseHTTPRequestHandler):
+    """ Répond à une requête HTTP par l'export des métriques (route /metrics d'un serveur de la bibliothèque
+    standard). """
+
+    body = registry.render().encode()
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Export des métriques : GET /metrics. """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        send_metrics(self)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+# Serveur d'export des pages Streamlit, démarré une seule fois par processus
+metrics_server = None
+server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer | None:
+    """ Démarre (une seule fois par processus) le serveur local d'export des métriques, dans un thread.
+    :param port: Port d'écoute (0 : aucun export).
+    :param host: Adresse d'écoute (locale par défaut).
+    :return: Serveur démarré, ou None si l'export est désactivé ou le port indisponible. """
+
+    global metrics_server
+    with server_lock:
+        if metrics_server is None and port:
+            try:
+                metrics_server = ThreadingHTTPServer((host, port), MetricsHandler)
+            except OSError as e:  # Port déjà pris, par exemple par un autre processus Streamlit
+                logging.warning(f"Export des métriques indisponible sur le port {port} : {e}")
+                return None
+            metrics_server.daemon_threads = True
+            threading.Thread(target=metrics_server.serve_forever, name="metrics", daemon=True).start()
+    return metrics_server
@@ -0,0 +1,143 @@
+""" Module de pagination des résultats de recherche.
+
+Les pages de recherche affichent les résultats par pages (bouton « Load more »). Pour que parcourir les pages suivantes
+ne coûte ni une nouvelle inférence du modèle, ni un nouveau parcours de l'index :
+
+    - La requête est encodée une seule fois. La recherche est ensuite confiée à un curseur (ResultCursor), sous forme
+    d'une fonction k -> k meilleurs résultats qui réutilise le vecteur de la requête.
+    - Le curseur récupère d'emblée plusieurs pages de candidats (PREFETCH_PAGES), et sert les pages suivantes depuis
+    cette liste. La recherche n'est relancée, sur un nombre de candidats doublé, que lorsque la liste est épuisée.
+    - Les curseurs sont conservés dans un cache partagé (CursorCache), identifiés par un jeton aléatoire stocké dans la
+    session Streamlit de l'utilisateur. Un curseur inutilisé pendant CURSOR_TTL secondes est évincé, et leur nombre
+    est plafonné : la mémoire occupée reste bornée quel que soit le nombre de sessions. """
+
+import threading, time, uuid
+
+# Nombre de pages de candidats récupérées à l'ouverture d'un curseur
+PREFETCH_PAGES = 5
+
+# Durée de vie (en secondes) d'un curseur inutilisé, et nombre maximal de curseurs conservés
+CURSOR_TTL = 600
+MAX_CURSORS = 256
+
+
+class ResultCursor:
+    """ Curseur sur les résultats d'une recherche, servis par pages depuis une liste de candidats. """
+
+    def __init__(self, search, page_size: int, prefetch_pages: int = PREFETCH_PAGES):
+        """ Lance la recherche initiale.
+        :param search: Fonction k -> liste des k meilleurs résultats (moins si la collection est plus petite).
+        :param page_size: Nombre de résultats par page.
+        :param prefetch_pages: Nombre de pages de candidats récupérées d'emblée. """
+
+        self.search = search
+        self.page_size = page_size
+        self.searches = 0
+        self.requested = 0
+        self.candidates = []
+        self.widen(page_size * prefetch_pages)
+
+    @property
+    def exhausted(self) -> bool:
+        """ True si la dernière recherche a retourné tous les résultats de la collection. """
+
+        return len(self.candidates) < self.requested
+
+    def widen(self, count: int):
+        """ Relance la recherche pour obtenir au moins count candidats.
+        :param count: Nombre minimal de candidats souhaité. """
+
+        self.requested = max(count, 2 * self.requested)  # Doublement : peu de recherches, même en parcourant loin
+        self.candidates = list(self.search(self.requested))
+        self.searches += 1
+
+    def page(self, number: int) -> list:
+        """ Retourne une page de résultats, en élargissant la recherche si la liste de candidats est épuisée.
+        :param number: Numéro de la page (à partir de 0).
+        :return: Résultats de la page (liste vide au-delà du dernier résultat). """
+
+        end = (number + 1) * self.page_size
+        if end > len(self.candidates) and not self.exhausted:
+            self.widen(end)
+        return self.candidates[number * self.page_size:end]
+
+    def has_more(self, number: int) -> bool:
+        """ Indique s'il existe des résultats après une page donnée. """
+
+        return (number + 1) * self.page_size < len(self.candidates) or not self.exhausted
+
+
+class CursorCache:
+    """ Cache jeton -> curseur, à durée de vie glissante et taille plafonnée, partagé entre les sessions. """
+
+    def __init__(self, ttl: float = CURSOR_TTL, max_cursors: int = MAX_CURSORS, clock=time.monotonic):
+        """ :param ttl: Durée de vie (en secondes) d'un curseur inutilisé.
+        :param max_cursors: Nombre maximal de curseurs conservés (les moins récemment utilisés sont évincés).
+        :param clock: Horloge (secondes), remplaçable pour les tests. """
+
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self.clock = clock
+        self.cursors = {}  # Jeton -> (curseur, date d'expiration)
+        self.lock = threading.Lock()  # Streamlit exécute les pages de plusieurs utilisateurs dans des threads distincts
+
+    def __len__(self):
+        return len(self.cursors)
+
+    def evict(self):
+        """ Supprime les curseurs expirés, puis les moins récemment utilisés au-delà du plafond (verrou déjà pris). """
+
+        now = self.clock()
+        for token in [token for token, (_, expires) in self.cursors.items() if expires <= now]:
+            del self.cursors[token]
+        while len(self.cursors) > self.max_cursors:
+            del self.cursors[min(self.cursors, key=lambda token: self.cursors[token][1])]
+
+    def add(self, cursor: ResultCursor) -> str:
+        """ Ajoute un curseur au cache.
+        :return: Jeton du curseur. """
+
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.cursors[token] = (cursor, self.clock() + self.ttl)
+            self.evict()
+        return token
+
+    def get(self, token: str) -> ResultCursor | None:
+        """ Retourne un curseur et repousse son expiration.
+        :return: Le curseur, ou None s'il a expiré ou été évincé. """
+
+        with self.lock:
+            self.evict()
+            entry = self.cursors.get(token)
+            if entry is None:
+                return None
+            self.cursors[token] = (entry[0], self.clock() + self.ttl)
+            return entry[0]
+
+
+# Cache partagé par toutes les sessions du processus Streamlit
+cursors = CursorCache()
+
+
+def open_cursor(state, name: str, query_key: str, make_search, page_size: int,
+                cache: CursorCache = None) -> ResultCursor:
+    """ Retourne le curseur d'une requête pour une session, en le créant si la requête a changé ou s'il a expiré.
+    :param state: État de la session (st.session_state, ou tout dictionnaire).
+    :param name: Nom du curseur dans la session (un par page de recherche).
+    :param query_key: Identifiant de la requête (empreinte de l'image, texte, dataset...).
+    :param make_search: Fonction sans argument qui encode la requête et retourne la fonction de recherche k -> résultats
+    (appelée uniquement lorsqu'un nouveau curseur est nécessaire).
+    :param page_size: Nombre de résultats par page.
+    :param cache: Cache des curseurs (par défaut, le cache partagé).
+    :return: Curseur de la requête. """
+
+    cache = cache or cursors
+    saved = state.get(name)
+    if saved is not None and saved["query"] == query_key:
+        cursor = cache.get(saved["token"])
+        if cursor is not None:
+            return cursor
+    cursor = ResultCursor(make_search(), page_size)
+    state[name] = {"query": query_key, "token": cache.add(cursor), "pages": 1}
+    return cursor
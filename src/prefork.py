@@ -0,0 +1,174 @@
+""" Lancement du service de recherche en plusieurs processus. Usage : python -m src.service --processes N [options]
+
+Chaque processus qui importe similarity_search construit ses propres copies des embeddings et des index FAISS : lancer
+N services indépendants multiplie la mémoire par N. Ce module charge les modèles et les index une seule fois, dans le
+processus parent, puis crée les processus de service par fork :
+
+    - Les pages mémoire du parent (embeddings, index, poids des modèles) sont partagées par les processus fils tant
+    qu'aucun ne les modifie (copie sur écriture). Les index ne sont que lus pendant la recherche.
+    - Avant le fork, gc.freeze() place les objets déjà créés hors de portée du ramasse-miettes : ses passages dans les
+    fils n'écrivent plus dans leurs en-têtes, ce qui provoquerait la copie des pages qui les contiennent.
+    - Le socket d'écoute est ouvert par le parent et hérité par les fils, qui acceptent les connexions à tour de rôle.
+    Chaque fils démarre ses propres micro-batchers (fork ne duplique pas les threads).
+    - Les mesures (src.metrics) sont propres à chaque processus : la route /metrics du socket partagé ne renverrait
+    que celles du fils qui accepte la connexion. Chaque fils exporte donc les siennes sur son propre port,
+    PIXMATCHER_METRICS_PORT + numéro du fils (0 à N - 1), à déclarer comme autant de cibles Prometheus.
+    - Le parent surveille les fils et journalise périodiquement leur mémoire propre (USS) : ajouter un processus ne
+    coûte que son tas privé, pas une copie de la collection. Un fils arrêté est remplacé ; s'il s'arrête peu après son
+    démarrage, le remplacement est différé de plus en plus longtemps (un fils qui échoue au démarrage échouerait
+    aussitôt de nouveau).
+
+CUDA n'est pas utilisable dans un processus créé par fork une fois initialisé dans le parent : le service
+multiprocessus fonctionne sur CPU (--device cpu, et CUDA_VISIBLE_DEVICES= pour CLIP, qui choisit CUDA s'il est
+disponible). """
+
+import gc, logging, os, signal, time, torch
+from src import metrics
+from src.service import MAX_BATCH_SIZE, MAX_WAIT, SearchServer, memory_usage
+
+# Intervalle (en secondes) entre deux rapports de mémoire des processus fils
+REPORT_INTERVAL = 60
+
+# Durée de vie (en secondes) en deçà de laquelle l'arrêt d'un fils est un échec au démarrage, et délais (en secondes)
+# du premier remplacement différé et du plus long : doublé à chaque échec consécutif
+MIN_UPTIME = 10
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+
+
+class PreforkServer:
+    """ Service de recherche réparti sur plusieurs processus fils, qui partagent les index chargés par le parent. """
+
+    def __init__(self, address: tuple[str, int], backends: dict, processes: int = 2,
+                 max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_WAIT,
+                 metrics_port: int = metrics.METRICS_PORT):
+        """ Ouvre le socket d'écoute dans le processus parent.
+        :param address: Adresse d'écoute (hôte, port).
+        :param backends: Backends déjà chargés (voir SearchServer), partagés par les fils.
+        :param processes: Nombre de processus de service.
+        :param max_batch_size: Voir SearchServer.
+        :param max_wait: Voir SearchServer.
+        :param metrics_port: Port d'export des mesures du premier fils, les suivants à la suite (0 : aucun export). """
+
+        self.server = SearchServer(address, backends, max_batch_size, max_wait, start_batchers=False)
+        self.server.metrics_route = False  # Mesures exportées par chaque fils sur son propre port
+        self.processes = processes
+        self.metrics_port = metrics_port
+        self.pids = []
+        self.slots = {}  # pid -> numéro du fils (0 à processes - 1), repris par son remplaçant
+        self.started = {}  # pid -> instant du démarrage
+        self.failures = 0  # Échecs au démarrage consécutifs
+        self.restarts = []  # Tuples (instant, numéro du fils) des remplacements différés
+
+    @property
+    def server_port(self) -> int:
+        return self.server.server_port
+
+    def serve_child(self, slot: int = 0):
+        """ Boucle d'un processus fils : ne se termine que par un signal.
+        :param slot: Numéro du fils (port d'export de ses mesures). """
+
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C est traité par le parent, qui arrête les fils
+        # Sans quoi chaque fils lancerait autant de threads de calcul que de cœurs
+        torch.set_num_threads(max(1, (os.cpu_count() or 1) // self.processes))
+        if self.metrics_port:
+            metrics.start_metrics_server(self.metrics_port + slot)
+        self.server.start_batchers()
+        self.server.serve_forever()
+
+    def fork_child(self, slot: int = 0) -> int:
+        """ Crée un processus fils de service.
+        :param slot: Numéro du fils (voir serve_child).
+        :return: Identifiant du processus fils. """
+
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self.serve_child(slot)
+                status = 0
+            except Exception:
+                logging.exception("Erreur du processus de service")
+            finally:
+                os._exit(status)  # Le statut non nul signale l'échec au parent
+        self.pids.append(pid)
+        self.slots[pid] = slot
+        self.started[pid] = time.monotonic()
+        return pid
+
+    def start(self) -> list[int]:
+        """ Crée les processus fils.
+        :return: Identifiants des processus fils.
+        :raises RuntimeError: Si CUDA est initialisé dans le parent (inutilisable dans les fils). """
+
+        if torch.cuda.is_initialized():
+            raise RuntimeError("Modèles chargés sur CUDA : inutilisable dans les processus fils. Lancer le service "
+                               "multiprocessus sur CPU (--device cpu, CUDA_VISIBLE_DEVICES= pour CLIP).")
+        if metrics.enabled and not self.metrics_port:
+            logging.warning("Mesures non exportées : PIXMATCHER_METRICS_PORT requis avec plusieurs processus.")
+        gc.collect()
+        gc.freeze()  # Les objets chargés par le parent ne sont plus parcourus (ni modifiés) par le ramasse-miettes
+        for slot in range(self.processes):
+            self.fork_child(slot)
+        return self.pids
+
+    def memory_report(self) -> dict:
+        """ Mesure la mémoire de chaque processus fils (voir memory_usage).
+        :return: Dictionnaire pid -> mémoire (rss, pss, uss). """
+
+        return {pid: memory_usage(pid) for pid in self.pids}
+
+    def restart_delay(self, pid: int) -> float:
+        """ Enregistre l'arrêt d'un fils et calcule le délai avant son remplacement.
+        :param pid: Identifiant du processus arrêté.
+        :return: Délai (en secondes) : nul après un fonctionnement normal, doublé à chaque échec au démarrage
+        consécutif. """
+
+        self.pids.remove(pid)
+        self.slots.pop(pid)
+        if time.monotonic() - self.started.pop(pid) >= MIN_UPTIME:
+            self.failures = 0
+            return 0
+        self.failures += 1
+        return min(RESTART_DELAY * 2 ** (self.failures - 1), MAX_RESTART_DELAY)
+
+    def monitor(self, report_interval: float = REPORT_INTERVAL):
+        """ Attend la fin des processus fils en journalisant leur mémoire ; un fils qui s'arrête est remplacé. """
+
+        next_report = time.monotonic() + report_interval
+        while self.pids or self.restarts:
+            pid, status = os.waitpid(-1, os.WNOHANG) if self.pids else (0, 0)
+            if pid in self.pids:
+                slot = self.slots[pid]
+                delay = self.restart_delay(pid)
+                logging.warning(f"Processus {pid} arrêté (code {os.waitstatus_to_exitcode(status)}), "
+                                f"remplacé dans {delay:.0f} s.")
+                self.restarts.append((time.monotonic() + delay, slot))
+            for restart in [restart for restart in self.restarts if restart[0] <= time.monotonic()]:
+                self.restarts.remove(restart)
+                self.fork_child(restart[1])
+            if time.monotonic() >= next_report:
+                for child, memory in self.memory_report().items():
+                    if memory:
+                        logging.info(f"Processus {child} : USS {memory['uss'] / 1024 ** 2:.0f} Mo, "
+                                     f"PSS {memory['pss'] / 1024 ** 2:.0f} Mo, RSS {memory['rss'] / 1024 ** 2:.0f} Mo")
+                next_report = time.monotonic() + report_interval
+            time.sleep(0.5)
+
+    def stop(self):
+        """ Arrête les processus fils et ferme le socket d'écoute. """
+
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = []
+        self.restarts = []
+        self.server.socket.close()
@@ -0,0 +1,229 @@
+""" Module de profilage d'une requête. Usage : python -m src.profiling --image <image> | --text <requête> [options]
+
+Les métriques (src.metrics) indiquent quelle étape est lente ; pour comprendre pourquoi, ce module profile une seule
+requête, sans profiler tout le serveur ni modifier le code :
+
+    - Le chemin Python de la requête est profilé par pyinstrument s'il est installé (rapport HTML), sinon par cProfile
+    (fichier .prof, lisible par pstats ou snakeviz, et résumé texte des fonctions les plus coûteuses). La partie traitée
+    par le thread d'un micro-batcher du service a son propre profil (python-<thread>).
+    - La passe du modèle (FeatureExtractor ou text_to_vector) est tracée par torch.profiler : trace Chrome
+    (chrome://tracing ou Perfetto) et tableau des opérateurs les plus coûteux.
+    - Chaque recherche (index FAISS ou produit matriciel CLIP) est chronométrée, avec la description de l'index.
+
+Les résultats sont écrits dans un dossier daté, sous PIXMATCHER_PROFILE_DIR (par défaut profiles/). Le profilage est
+demandé par requête (paramètre profile=1 du service ou de l'URL des pages Streamlit), ou pour toutes les requêtes avec
+la variable d'environnement PIXMATCHER_PROFILE. Les hooks placés dans les modules de recherche sont sans effet hors
+d'une requête profilée. """
+
+import argparse, contextlib, contextvars, cProfile, io, json, logging, os, pstats, re, threading, time, torch
+from datetime import datetime
+from pathlib import Path
+
+try:  # Profileur statistique, optionnel
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+
+# Dossier des profils, et profilage de toutes les requêtes
+PROFILE_DIR = Path(os.environ.get("PIXMATCHER_PROFILE_DIR", "profiles"))
+PROFILE_ALL = os.environ.get("PIXMATCHER_PROFILE", "") not in ("", "0")
+
+# Nombre de lignes des résumés texte (fonctions Python, opérateurs PyTorch)
+SUMMARY_ROWS = 40
+
+# Profil de la requête en cours dans le thread
+current_profile = contextvars.ContextVar("pixmatcher_profile", default=None)
+
+# Un seul profil à la fois : les profileurs Python ne s'imbriquent pas
+profile_lock = threading.Lock()
+
+# Gestionnaire de contexte vide, retourné hors d'une requête profilée
+NULL_CONTEXT = contextlib.nullcontext()
+
+
+class QueryProfile:
+    """ Profil d'une requête : profileur Python, traces du modèle et chronométrage des recherches. """
+
+    def __init__(self, name: str, directory: Path = None):
+        """ :param name: Nom de la requête (utilisé dans le nom du dossier).
+        :param directory: Dossier parent des profils (par défaut PROFILE_DIR). """
+
+        slug = re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "query"
+        self.path = Path(directory or PROFILE_DIR) / f"{datetime.now():%Y%m%d-%H%M%S-%f}-{slug}"
+        self.searches = []
+        self.models = []
+
+    def __enter__(self):
+        try:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self.start = time.perf_counter()
+            self.profiler = start_python_profiler()
+        except BaseException:  # Profil abandonné : sans quoi plus aucune requête ne pourrait être profilée
+            profile_lock.release()
+            raise
+        self.token = current_profile.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            self.write(exc_type, exc)
+        finally:
+            current_profile.reset(self.token)
+            profile_lock.release()
+        logging.info(f"Profil de la requête écrit dans {self.path}")
+        return False
+
+    def write(self, exc_type, exc):
+        """ Arrête le profileur Python et écrit les résultats du profil. """
+
+        write_python_profile(self.profiler, self.path / "python")
+        summary = {"total_ms": (time.perf_counter() - self.start) * 1000, "models": self.models,
+                   "searches": self.searches, "torch_threads": torch.get_num_threads()}
+        try:
+            import faiss
+            summary["faiss_threads"] = faiss.omp_get_max_threads()
+        except ImportError:
+            pass
+        if exc_type is not None:
+            summary["error"] = f"{exc_type.__name__}: {exc}"
+        (self.path / "summary.json").write_text(json.dumps(summary, indent=2))
+
+    @contextlib.contextmanager
+    def thread(self, name: str):
+        """ Profile le chemin Python d'une partie de la requête traitée dans un autre thread (par exemple le lot d'un
+        micro-batcher) : les profileurs Python ne suivent que le thread qui les démarre.
+        :param name: Nom du thread (résultats dans python-<name>). """
+
+        profiler = start_python_profiler()
+        try:
+            yield
+        finally:
+            write_python_profile(profiler, self.path / f"python-{name}")
+
+    @contextlib.contextmanager
+    def model(self, name: str):
+        """ Trace la passe d'un modèle avec torch.profiler (trace Chrome et tableau des opérateurs). """
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        index = len(self.models)
+        start = time.perf_counter()
+        with torch.profiler.profile(activities=activities, record_shapes=True) as profiler:
+            yield
+        elapsed = (time.perf_counter() - start) * 1000
+        profiler.export_chrome_trace(str(self.path / f"torch-{index}-{name}.json"))
+        table = profiler.key_averages().table(sort_by="self_cpu_time_total", row_limit=SUMMARY_ROWS)
+        (self.path / f"torch-{index}-{name}.txt").write_text(table)
+        self.models.append({"name": name, "ms": elapsed})
+
+    @contextlib.contextmanager
+    def search(self, name: str, index):
+        """ Chronomètre une recherche et décrit l'index interrogé (index FAISS ou matrice d'embeddings). """
+
+        start = time.perf_counter()
+        yield
+        elapsed = (time.perf_counter() - start) * 1000
+        if hasattr(index, "ntotal"):  # Index FAISS
+            description = {"index": type(index).__name__, "ntotal": int(index.ntotal), "d": int(index.d)}
+        else:  # Matrice d'embeddings (recherche CLIP par produit matriciel)
+            description = {"index": f"{type(index).__name__}[{index.dtype}]", "ntotal": int(index.shape[0]),
+                           "d": int(index.shape[1])}
+        self.searches.append({"name": name, "ms": elapsed, **description})
+
+
+def start_python_profiler():
+    """ Démarre un profileur Python (pyinstrument s'il est installé, sinon cProfile) dans le thread courant. """
+
+    if Profiler is not None:
+        profiler = Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def write_python_profile(profiler, path: Path):
+    """ Arrête un profileur Python et écrit ses résultats.
+    :param profiler: Profileur démarré par start_python_profiler.
+    :param path: Chemin des résultats, sans extension (.html pour pyinstrument, .prof et .txt pour cProfile). """
+
+    if Profiler is not None:
+        profiler.stop()
+        path.with_suffix(".html").write_text(profiler.output_html())
+    else:
+        profiler.disable()
+        profiler.dump_stats(path.with_suffix(".prof"))
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_ROWS)
+        path.with_suffix(".txt").write_text(summary.getvalue())
+
+
+def profile(name: str, enabled: bool = False, directory: Path = None):
+    """ Profile une requête : with profiling.profile("cbir", enabled=flag): ...
+    :param name: Nom de la requête.
+    :param enabled: Profilage demandé pour cette requête (toujours actif si PIXMATCHER_PROFILE est définie).
+    :param directory: Dossier parent des profils (par défaut PROFILE_DIR).
+    :return: Gestionnaire de contexte, qui fournit le profil (None si la requête n'est pas profilée, ou si un autre
+    profil est en cours). """
+
+    if not (enabled or PROFILE_ALL):
+        return NULL_CONTEXT
+    if not profile_lock.acquire(blocking=False):  # Libéré à la fin du profil
+        logging.warning("Un profil est déjà en cours : requête non profilée.")
+        return NULL_CONTEXT
+    return QueryProfile(name, directory)
+
+
+def model_profile(name: str):
+    """ Hook de la passe d'un modèle : trace torch.profiler dans une requête profilée, sans effet sinon. """
+
+    query_profile = current_profile.get()
+    return query_profile.model(name) if query_profile is not None else NULL_CONTEXT
+
+
+def thread_profile(name: str):
+    """ Hook d'un thread qui traite une partie de la requête : profileur Python dans une requête profilée, sans effet
+    sinon. """
+
+    query_profile = current_profile.get()
+    return query_profile.thread(name) if query_profile is not None else NULL_CONTEXT
+
+
+def search_profile(name: str, index):
+    """ Hook d'une recherche : chronométrage dans une requête profilée, sans effet sinon. """
+
+    query_profile = current_profile.get()
+    return query_profile.search(name, index) if query_profile is not None else NULL_CONTEXT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profilage d'une requête CBIR (image) ou TBIR (texte).")
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument("--image", help="Image requête (recherche CBIR)")
+    query.add_argument("--text", help="Requête textuelle (recherche TBIR)")
+    parser.add_argument("--dataset", choices=("open-images", "tiny-imagenet"), default="tiny-imagenet",
+                        help="Dataset interrogé")
+    parser.add_argument("-k", type=int, default=10, help="Nombre de résultats")
+    parser.add_argument("--output", default=None, help="Dossier des profils (par défaut PIXMATCHER_PROFILE_DIR)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    prefix = "oi" if args.dataset == "open-images" else "ti"
+    if args.image:  # Modèle et index chargés hors du profil, comme dans un serveur déjà démarré
+        from src import similarity_search
+        from src.feature_extractor import FeatureExtractor
+        extractor = FeatureExtractor()
+        search = getattr(similarity_search, f"{prefix}_find_top_similar_images")
+        with profile("cbir", enabled=True, directory=args.output) as query_profile:
+            search(extractor.extract_features(args.image), args.k)
+    else:
+        from src import clip_similarity_search
+        with profile("tbir", enabled=True, directory=args.output) as query_profile:
+            getattr(clip_similarity_search, f"{prefix}_find_similar_images")(args.text, args.k)
+    print(query_profile.path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+""" Module de projection 2D des collections d'embeddings. Usage : python -m src.projection --collection <nom> [options]
+
+La page Visualization affiche chaque collection sous forme de nuage de points. Ces coordonnées sont calculées hors ligne
+par ce module, puis stockées à côté de la collection : la page se contente de lire un fichier, sans aucun calcul au
+moment de la requête. Le calcul se déroule ainsi :
+
+    - Un échantillon stratifié (proportionnel à la taille de chaque catégorie, au moins une image par catégorie) est
+    tiré parmi les lignes non supprimées de la collection.
+    - Une ACP, ajustée sur l'échantillon, réduit tous les embeddings à quelques dizaines de dimensions (par blocs, la
+    collection pouvant être projetée en mémoire).
+    - t-SNE place l'échantillon en 2D. Son coût est quadratique (ou en n log n), d'où l'échantillonnage.
+    - Les autres lignes sont placées à la moyenne des coordonnées de leurs plus proches voisins de l'échantillon (dans
+    l'espace réduit par l'ACP), pondérée par l'inverse de la distance.
+
+Le fichier produit (archive .npz) contient les coordonnées, les numéros de ligne et les catégories des points, dans un
+ordre aléatoire : n'importe quel préfixe est un sous-échantillon uniforme de la collection, ce qui permet à la page de
+n'afficher que les N premiers points (niveau de détail) sans autre traitement. """
+
+import argparse, logging, faiss, numpy as np
+from pathlib import Path
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+from src import index, ingest
+from src.index import COPY_CHUNK_ROWS, OUTPUT_PREFIXES, collection_paths, save_npz
+
+# Nombre de points placés par t-SNE, puis dimension de l'espace réduit par l'ACP
+SAMPLE_SIZE = 10000
+PCA_DIM = 50
+
+# Nombre de voisins de l'échantillon utilisés pour placer les autres points
+NEIGHBORS = 10
+
+# Perplexité de t-SNE (plafonnée pour les petits échantillons)
+PERPLEXITY = 30
+
+# Collections projetables : nom -> (dataset, modèle)
+COLLECTIONS = {
+    "tiny-imagenet-mobilenet": ("tiny-imagenet", "mobilenet"),
+    "tiny-imagenet-clip": ("tiny-imagenet", "clip"),
+    "open-images-mobilenet": ("open-images", "mobilenet"),
+    "open-images-clip": ("open-images", "clip"),
+}
+
+
+def collection_files(name: str) -> dict:
+    """ Retourne les chemins des fichiers d'une collection connue de la page Visualization.
+    :param name: Nom de la collection (voir COLLECTIONS).
+    :return: Dictionnaire nom -> chemin (embeddings, catégories et lignes supprimées, ou None s'ils n'existent pas pour
+    cette collection, fichier de projection, réduction de dimension (None pour une collection CLIP d'Open Images) et
+    codes binaires). """
+
+    dataset, model = COLLECTIONS[name]
+    if dataset == "tiny-imagenet":
+        prefix = OUTPUT_PREFIXES[model]
+        paths = collection_paths(index.RESSOURCES_PATH, prefix)
+        return {"embeddings": paths["embeddings"], "categories": paths["categories"], "deleted": paths["deleted"],
+                "projection": index.RESSOURCES_PATH / f"{prefix}_Projection.npz", "reduction": paths["reduction"],
+                "codes": paths["codes"]}
+    return {"embeddings": ingest.RESSOURCES_PATH / ingest.OUTPUT_FILES[model], "categories": None, "deleted": None,
+            "projection": ingest.RESSOURCES_PATH / f"{model}_projection.npz",
+            "reduction": ingest.RESSOURCES_PATH / ingest.REDUCTION_FILE if model == "mobilenet" else None,
+            "codes": ingest.RESSOURCES_PATH / ingest.CODES_FILES[model]}
+
+
+def stratified_sample(rows: np.ndarray, categories: np.ndarray | None, size: int,
+                      rng: np.random.Generator) -> np.ndarray:
+    """ Tire un échantillon de lignes dont la répartition par catégorie suit celle de la collection.
+    :param rows: Lignes candidates.
+    :param categories: Catégorie de chaque ligne candidate (None : tirage uniforme).
+    :param size: Taille visée de l'échantillon (toutes les lignes si elle est dépassée).
+    :param rng: Générateur aléatoire.
+    :return: Lignes tirées, triées. Chaque catégorie y figure au moins une fois. """
+
+    if size >= len(rows):
+        return np.sort(rows)
+    if categories is None:
+        return np.sort(rng.choice(rows, size, replace=False))
+
+    sample = []
+    labels, inverse, counts = np.unique(categories, return_inverse=True, return_counts=True)
+    for label_index, count in enumerate(counts):
+        members = rows[inverse == label_index]
+        quota = min(count, max(1, round(size * count / len(rows))))
+        sample.append(rng.choice(members, quota, replace=False))
+    return np.sort(np.concatenate(sample))
+
+
+def reduce_embeddings(embeddings: np.ndarray, rows: np.ndarray, pca: PCA) -> np.ndarray:
+    """ Projette des lignes d'embeddings dans l'espace réduit par l'ACP, par blocs de COPY_CHUNK_ROWS lignes.
+    :param embeddings: Embeddings de la collection (éventuellement projetés en mémoire, en float16).
+    :param rows: Lignes à projeter.
+    :param pca: ACP ajustée.
+    :return: Tableau float32 (len(rows), pca.n_components_). """
+
+    reduced = np.empty((len(rows), pca.n_components_), dtype=np.float32)
+    for start in range(0, len(rows), COPY_CHUNK_ROWS):
+        chunk = np.asarray(embeddings[rows[start:start + COPY_CHUNK_ROWS]], dtype=np.float32)
+        reduced[start:start + len(chunk)] = pca.transform(chunk)
+    return reduced
+
+
+def project(embeddings: np.ndarray, categories: np.ndarray = None, deleted: np.ndarray = None,
+            sample_size: int = SAMPLE_SIZE, pca_dim: int = PCA_DIM, neighbors: int = NEIGHBORS,
+            perplexity: float = PERPLEXITY, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """ Calcule les coordonnées 2D des lignes non supprimées d'une collection.
+    :param embeddings: Embeddings de la collection.
+    :param categories: Catégorie de chaque ligne, pour la stratification de l'échantillon (optionnel).
+    :param deleted: Masque des lignes supprimées (optionnel).
+    :param sample_size: Nombre de points placés par t-SNE.
+    :param pca_dim: Dimension de l'espace réduit par l'ACP.
+    :param neighbors: Nombre de voisins utilisés pour placer les points hors échantillon.
+    :param perplexity: Perplexité de t-SNE.
+    :param seed: Graine aléatoire (résultat reproductible).
+    :return: Tuple (lignes projetées, coordonnées float32 (len(lignes), 2)).
+    :raises ValueError: Si la collection ne contient aucune ligne. """
+
+    num_rows = len(deleted) if deleted is not None else len(embeddings)
+    rows = np.arange(num_rows) if deleted is None else np.flatnonzero(~deleted)
+    if len(rows) == 0:
+        raise ValueError("La collection ne contient aucune ligne à projeter")
+    rng = np.random.default_rng(seed)
+
+    sample = stratified_sample(rows, None if categories is None else categories[rows], sample_size, rng)
+    sample_embeddings = np.asarray(embeddings[sample], dtype=np.float32)
+    pca = PCA(n_components=min(pca_dim, *sample_embeddings.shape), random_state=seed).fit(sample_embeddings)
+    sample_reduced = pca.transform(sample_embeddings).astype(np.float32)
+
+    if len(sample) > 1:
+        tsne = TSNE(n_components=2, perplexity=min(perplexity, (len(sample) - 1) / 3), init="pca",
+                    random_state=seed)
+        sample_coordinates = tsne.fit_transform(sample_reduced).astype(np.float32)
+    else:
+        sample_coordinates = np.zeros((1, 2), dtype=np.float32)
+
+    coordinates = np.empty((len(rows), 2), dtype=np.float32)
+    in_sample = np.isin(rows, sample)
+    coordinates[in_sample] = sample_coordinates  # rows et sample sont triés : même ordre
+    others = rows[~in_sample]
+    if len(others):
+        sample_index = faiss.IndexFlatL2(sample_reduced.shape[1])
+        sample_index.add(sample_reduced)
+        k = min(neighbors, len(sample))
+        placed = np.empty((len(others), 2), dtype=np.float32)
+        for start in range(0, len(others), COPY_CHUNK_ROWS):
+            reduced = reduce_embeddings(embeddings, others[start:start + COPY_CHUNK_ROWS], pca)
+            distances, indices = sample_index.search(reduced, k)
+            weights = 1 / (np.sqrt(np.maximum(distances, 0)) + 1e-6)
+            weights /= weights.sum(axis=1, keepdims=True)
+            placed[start:start + len(reduced)] = np.einsum("nk,nkd->nd", weights, sample_coordinates[indices])
+        coordinates[~in_sample] = placed
+    return rows, coordinates
+
+
+def save_projection(path: str | Path, rows: np.ndarray, coordinates: np.ndarray, categories: np.ndarray = None,
+                    seed: int = 0):
+    """ Écrit une projection de façon atomique, dans un ordre aléatoire (tout préfixe est un sous-échantillon uniforme).
+    :param path: Fichier .npz de sortie.
+    :param rows: Lignes projetées.
+    :param coordinates: Coordonnées 2D des lignes.
+    :param categories: Catégorie de chaque ligne de la collection (optionnel).
+    :param seed: Graine de l'ordre aléatoire. """
+
+    order = np.random.default_rng(seed).permutation(len(rows))
+    labels = categories[rows[order]] if categories is not None else np.array([], dtype=str)
+    save_npz(path, rows=rows[order].astype(np.int64), coordinates=coordinates[order], categories=labels)
+
+
+def load_projection(path: str | Path, max_points: int = None) -> dict:
+    """ Lit une projection écrite par save_projection.
+    :param path: Fichier .npz de la projection.
+    :param max_points: Nombre maximal de points retournés (les premiers, soit un sous-échantillon uniforme).
+    :return: Dictionnaire rows, coordinates, categories (None si la collection n'a pas de catégories), total. """
+
+    with np.load(path, allow_pickle=False) as archive:
+        rows, coordinates, categories = archive["rows"], archive["coordinates"], archive["categories"]
+    total = len(rows)
+    if max_points is not None:
+        rows, coordinates, categories = rows[:max_points], coordinates[:max_points], categories[:max_points]
+    return {"rows": rows, "coordinates": coordinates, "categories": categories if len(categories) else None,
+            "total": total}
+
+
+def project_collection(name: str, sample_size: int = SAMPLE_SIZE, pca_dim: int = PCA_DIM,
+                       neighbors: int = NEIGHBORS, seed: int = 0) -> Path:
+    """ Calcule et écrit la projection d'une collection (voir COLLECTIONS).
+    :return: Chemin du fichier de projection. """
+
+    files = collection_files(name)
+    embeddings = np.load(files["embeddings"], mmap_mode="r")
+    categories = np.load(files["categories"]) if files["categories"] is not None else None
+    deleted = None
+    if files["deleted"] is not None and files["deleted"].exists():
+        deleted = np.load(files["deleted"])
+    elif categories is not None:
+        deleted = np.zeros(len(categories), dtype=bool)  # Lignes au-delà : mise à jour incrémentale interrompue
+    rows, coordinates = project(embeddings, categories, deleted, sample_size, pca_dim, neighbors, seed=seed)
+    save_projection(files["projection"], rows, coordinates, categories, seed)
+    logging.info(f"Projection de {name} : {len(rows)} points, écrite dans {files['projection']}.")
+    return files["projection"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Projection 2D des collections pour la page Visualization.")
+    parser.add_argument("--collection", nargs="+", choices=COLLECTIONS, default=list(COLLECTIONS),
+                        help="Collection(s) à projeter (par défaut, toutes celles dont les embeddings existent)")
+    parser.add_argument("--sample-size", type=int, default=SAMPLE_SIZE, help="Nombre de points placés par t-SNE")
+    parser.add_argument("--pca-dim", type=int, default=PCA_DIM, help="Dimension de l'espace réduit par l'ACP")
+    parser.add_argument("--neighbors", type=int, default=NEIGHBORS,
+                        help="Voisins utilisés pour placer les points hors échantillon")
+    parser.add_argument("--seed", type=int, default=0, help="Graine aléatoire")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    for name in args.collection:
+        if not collection_files(name)["embeddings"].exists():
+            logging.warning(f"Embeddings de {name} introuvables, collection ignorée.")
+            continue
+        print(f"{name} : {project_collection(name, args.sample_size, args.pca_dim, args.neighbors, args.seed)}")
+
+
+if __name__ == "__main__":
+    main()
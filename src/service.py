@@ -0,0 +1,466 @@
+""" Service HTTP de recherche. Usage : python -m src.service [--port 8000] [options]
+
+Ce module expose la recherche CBIR et TBIR à d'autres programmes que la page Streamlit, via un serveur HTTP de la
+bibliothèque standard :
+
+    - POST /search/image?dataset=open-images&k=12 : le corps de la requête contient l'image (octets bruts).
+    - POST /search/text : le corps est un objet JSON {"query": "...", "dataset": "tiny-imagenet", "k": 10}.
+    - GET /health : état du service, mémoire du processus et nombre de lots traités.
+    - GET /metrics : durées des étapes, tailles des lots et erreurs, au format texte de Prometheus (voir src.metrics,
+    actif si PIXMATCHER_METRICS est définie). Avec plusieurs processus, sur le port propre à chacun (voir src.prefork).
+
+Avec le paramètre profile=1 (ou "profile": true dans le corps JSON d'une recherche textuelle), la requête est profilée
+(voir src.profiling) et le dossier du profil est renvoyé dans la réponse ({"results": ..., "profile": "..."}).
+
+Les résultats sont renvoyés en JSON ({"results": [{"id": ..., "distance": ..., "path": ...}, ...]}).
+
+Chaque requête est traitée dans son propre thread, mais l'inférence n'y est pas faite : le prétraitement (décodage de
+l'image, validation du texte) y a lieu, puis la requête est confiée à un micro-batcher (MicroBatcher). Celui-ci attend
+quelques millisecondes les requêtes concurrentes et les traite ensemble : une seule passe du modèle pour tout le lot,
+puis une seule recherche dans l'index par dataset. Sous charge, le coût fixe d'une passe est partagé entre les requêtes
+au lieu d'être payé par chacune. Le modèle n'est appelé que depuis le thread du micro-batcher, y compris pour une
+requête profilée : elle y forme un lot à elle seule, pour que le profil ne mesure qu'elle.
+
+La page Streamlit devient un client du service lorsque la variable d'environnement PIXMATCHER_SEARCH_URL est définie
+(voir SearchClient). """
+
+import argparse, contextvars, json, logging, os, queue, threading, time, requests, numpy as np
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from src import metrics, profiling
+
+# Nombre maximal de requêtes par lot, et attente maximale (en secondes) des requêtes concurrentes
+MAX_BATCH_SIZE = 32
+MAX_WAIT = 0.005
+
+# Nombre de résultats par défaut et maximal d'une requête
+DEFAULT_K = 10
+MAX_K = 1000
+
+# Attente maximale (en secondes) du résultat d'une requête confiée au micro-batcher
+REQUEST_TIMEOUT = float(os.environ.get("PIXMATCHER_REQUEST_TIMEOUT", 60))
+
+# Taille maximale (en octets) du corps d'une requête
+MAX_BODY_BYTES = 20 * 1024 ** 2
+
+# Datasets interrogeables
+DATASETS = ("open-images", "tiny-imagenet")
+
+# Valeurs du paramètre profile qui demandent le profilage d'une requête
+PROFILE_FLAGS = ("1", "true", True, 1)
+
+# URL du service utilisée par les pages Streamlit (recherche dans le processus Streamlit si absente)
+SEARCH_URL = os.environ.get("PIXMATCHER_SEARCH_URL")
+
+
+def memory_usage(pid="self") -> dict:
+    """ Mesure la mémoire d'un processus (Linux, d'après /proc/<pid>/smaps_rollup).
+    :param pid: Identifiant du processus (par défaut, le processus courant).
+    :return: Dictionnaire rss, pss et uss (mémoire propre au processus, non partagée), en octets ; vide si la mesure
+    n'est pas disponible. """
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {line.split(":")[0]: int(line.split()[1]) * 1024 for line in f if line.split()[-1:] == ["kB"]}
+    except OSError:  # Autre système que Linux, ou processus terminé
+        return {}
+    return {"rss": fields.get("Rss", 0), "pss": fields.get("Pss", 0),
+            "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)}
+
+
+class MicroBatcher:
+    """ Regroupe les requêtes concurrentes en lots, traités par un thread dédié. """
+
+    def __init__(self, process_batch, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_WAIT,
+                 name: str = "batcher"):
+        """ Démarre le thread de traitement.
+        :param process_batch: Fonction liste de requêtes -> liste des résultats, dans le même ordre.
+        :param max_batch_size: Nombre maximal de requêtes par lot.
+        :param max_wait: Attente maximale (en secondes) des requêtes suivantes, après l'arrivée de la première.
+        :param name: Nom du thread. """
+
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.pending = None  # Requête seule reçue pendant la constitution d'un lot : traitée au lot suivant
+        self.batches = 0
+        self.items = 0
+        self.thread = threading.Thread(target=self.run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item, solo: bool = False) -> Future:
+        """ Confie une requête au micro-batcher.
+        :param item: Requête (transmise telle quelle à process_batch).
+        :param solo: Si True, la requête forme un lot à elle seule, traité dans une copie du contexte (contextvars) de
+        l'appelant : les hooks de profilage (src.profiling) y retrouvent le profil de la requête.
+        :return: Future du résultat de la requête. """
+
+        future = Future()
+        self.queue.put((item, future, contextvars.copy_context() if solo else None))
+        return future
+
+    def collect(self) -> list:
+        """ Attend une première requête, puis les suivantes pendant au plus max_wait secondes.
+        :return: Liste de tuples (requête, future, contexte), ou None à l'arrêt du micro-batcher. """
+
+        first, self.pending = self.pending or self.queue.get(), None
+        if first is None:
+            return None
+        batch = [first]
+        if first[2] is not None:  # Requête seule
+            return batch
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                entry = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                self.queue.put(None)  # Arrêt traité après ce dernier lot
+                break
+            if entry[2] is not None:
+                self.pending = entry
+                break
+            batch.append(entry)
+        return batch
+
+    def run(self):
+        """ Boucle du thread de traitement. """
+
+        while (batch := self.collect()) is not None:
+            items = [item for item, _, _ in batch]
+            context = batch[0][2]
+            metrics.observe_size("pixmatcher_batch_size", len(items), stage=self.thread.name)
+            try:
+                results = self.process_batch(items) if context is None else context.run(self.process_solo, items)
+            except Exception as e:  # Erreur commune au lot : transmise à chaque requête
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self.batches += 1
+                self.items += len(batch)
+            if len(results) != len(batch):  # Sans quoi les requêtes sans résultat attendraient indéfiniment
+                error = RuntimeError(f"{len(results)} résultats pour un lot de {len(batch)} requêtes")
+                for _, future, _ in batch:
+                    future.set_exception(error)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def process_solo(self, items: list) -> list:
+        """ Traite une requête seule dans le contexte de l'appelant, sous le profileur Python si elle est profilée. """
+
+        with profiling.thread_profile(self.thread.name):
+            return self.process_batch(items)
+
+    def close(self):
+        """ Arrête le thread après les requêtes déjà reçues. """
+
+        self.queue.put(None)
+        self.thread.join()
+
+
+class ImageSearchBackend:
+    """ Recherche CBIR : MobileNetV3 (FeatureExtractor) et index FAISS (similarity_search). """
+
+    def __init__(self, device: str = None, backbone: str = None):
+        """ Charge le modèle et les index (import différé : les embeddings sont chargés à l'import du module).
+        :param backbone: Réseau TorchScript d'un bundle (voir src.bundle), à la place du modèle torchvision. """
+
+        from src.feature_extractor import FeatureExtractor
+        from src import similarity_search
+        self.extractor = FeatureExtractor(device=device, backbone=backbone)
+        self.search = {"open-images": similarity_search.oi_find_top_similar_images_batch,
+                       "tiny-imagenet": similarity_search.ti_find_top_similar_images_batch}
+        self.get_path = {"open-images": similarity_search.oi_get_image_path,
+                         "tiny-imagenet": similarity_search.ti_get_image_path}
+
+    def prepare(self, body: bytes):
+        """ Prétraite une image, dans le thread de la requête.
+        :raises ValueError: Si l'image est illisible ou dans un format non supporté. """
+
+        from src.image_preprocessing import InvalidImageFormatError, preprocess_image
+        try:
+            return preprocess_image(body, target_size=self.extractor.target_size, to_tensor=True)
+        except InvalidImageFormatError as e:
+            raise ValueError(str(e)) from e
+
+    def run_batch(self, queries: list) -> list:
+        """ Traite un lot de requêtes (image prétraitée, dataset, k) : une passe du modèle, une recherche par dataset. """
+
+        import torch
+        features = self.extractor.forward_batch(torch.stack([tensor for tensor, _, _ in queries]))
+        return search_by_dataset(queries, features, lambda dataset, vectors, k: [
+            [{"id": int(idx), "distance": float(distance), "path": str(self.get_path[dataset](idx))}
+             for idx, distance in results] for results in self.search[dataset](vectors, k)])
+
+
+class TextSearchBackend:
+    """ Recherche TBIR : CLIP (clip_similarity_search). """
+
+    def __init__(self):
+        """ Charge CLIP et les embeddings (import différé). """
+
+        from src import clip_similarity_search
+        self.module = clip_similarity_search
+        self.search = {"open-images": clip_similarity_search.oi_search_vectors,
+                       "tiny-imagenet": clip_similarity_search.ti_search_vectors}
+        self.get_path = {"open-images": clip_similarity_search.oi_get_image_path,
+                         "tiny-imagenet": clip_similarity_search.ti_get_image_path}
+
+    def prepare(self, query: str) -> str:
+        """ Valide une requête textuelle.
+        :raises ValueError: Si la requête est vide. """
+
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("Requête textuelle vide")
+        return query
+
+    def run_batch(self, queries: list) -> list:
+        """ Traite un lot de requêtes (texte, dataset, k) : une passe de CLIP, une recherche par dataset. """
+
+        vectors = self.module.text_to_vectors([text for text, _, _ in queries])
+        return search_by_dataset(queries, vectors, lambda dataset, group_vectors, k: [
+            [{"id": int(idx), "path": str(self.get_path[dataset](idx))} for idx in indices]
+            for indices in self.search[dataset](group_vectors, k)])
+
+
+def search_by_dataset(queries: list, vectors: np.ndarray, search) -> list:
+    """ Regroupe les requêtes d'un lot par dataset et lance une recherche par groupe, au k le plus grand du groupe.
+    :param queries: Liste de tuples (entrée, dataset, k).
+    :param vectors: Vecteurs des requêtes, dans le même ordre.
+    :param search: Fonction (dataset, vecteurs, k) -> liste des résultats de chaque vecteur.
+    :return: Résultats de chaque requête, tronqués à son propre k. """
+
+    results = [None] * len(queries)
+    for dataset in {dataset for _, dataset, _ in queries}:
+        positions = [i for i, (_, query_dataset, _) in enumerate(queries) if query_dataset == dataset]
+        group_results = search(dataset, vectors[positions], max(queries[i][2] for i in positions))
+        for i, result in zip(positions, group_results):
+            results[i] = result[:queries[i][2]]
+    return results
+
+
+class SearchServer(ThreadingHTTPServer):
+    """ Serveur HTTP multithread, associé à un micro-batcher par type de recherche. """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], backends: dict, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_wait: float = MAX_WAIT, start_batchers: bool = True):
+        """ :param address: Adresse d'écoute (hôte, port).
+        :param backends: Dictionnaire type ("image", "text") -> backend (prepare, run_batch).
+        :param max_batch_size: Nombre maximal de requêtes par lot.
+        :param max_wait: Attente maximale (en secondes) des requêtes concurrentes.
+        :param start_batchers: Si False, les threads des micro-batchers ne sont démarrés que par start_batchers (par
+        exemple dans les processus fils d'un serveur pré-forké : fork ne duplique pas les threads). """
+
+        super().__init__(address, SearchHandler)
+        self.backends = backends
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batchers = {}
+        self.metrics_route = True  # Route /metrics (désactivée dans les fils d'un serveur pré-forké, voir src.prefork)
+        if start_batchers:
+            self.start_batchers()
+
+    def start_batchers(self):
+        """ Démarre un micro-batcher par type de recherche. """
+
+        self.batchers = {kind: MicroBatcher(backend.run_batch, self.max_batch_size, self.max_wait,
+                                            name=f"batcher-{kind}") for kind, backend in self.backends.items()}
+
+    def server_close(self):
+        super().server_close()
+        for batcher in self.batchers.values():
+            batcher.close()
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """ Traitement des requêtes HTTP du service. """
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/metrics" and self.server.metrics_route:
+            return metrics.send_metrics(self)
+        if path == "/metrics":  # Mesures propres à chaque processus : une connexion n'atteint qu'un fils au hasard
+            return self.send_json(404, {"error": "Mesures exportées par chaque processus sur son propre port "
+                                                 "(PIXMATCHER_METRICS_PORT + numéro du processus)"})
+        if path != "/health":
+            return self.send_json(404, {"error": f"Route inconnue : {self.path}"})
+        self.send_json(200, {"status": "ok", "pid": os.getpid(), "memory": memory_usage(),
+                             "batches": {kind: {"batches": batcher.batches, "items": batcher.items}
+                                         for kind, batcher in self.server.batchers.items()}})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        kind = {"/search/image": "image", "/search/text": "text"}.get(url.path)
+        if kind is None or kind not in self.server.batchers:
+            return self.send_json(404, {"error": f"Route inconnue : {url.path}"})
+        with metrics.request(f"service-{kind}"):
+            self.handle_search(url, kind)
+
+    def handle_search(self, url, kind: str):
+        """ Traite une requête de recherche d'un type connu ("image" ou "text"). """
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:  # rfile.read(-1) attendrait la fermeture de la connexion par le client
+            return self.send_json(400, {"error": "En-tête Content-Length invalide"})
+        if length > MAX_BODY_BYTES:
+            return self.send_json(413, {"error": "Requête trop volumineuse"})
+        body = self.rfile.read(length)
+
+        try:
+            if kind == "image":
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                payload = body
+            else:
+                params = json.loads(body or b"{}")
+                if not isinstance(params, dict):
+                    raise ValueError("Le corps de la requête doit être un objet JSON")
+                payload = params.get("query")
+            dataset = params.get("dataset", DATASETS[0])
+            k = int(params.get("k", DEFAULT_K))
+            if dataset not in DATASETS:
+                raise ValueError(f"Dataset inconnu : {dataset} (attendu : {', '.join(DATASETS)})")
+            if not 0 < k <= MAX_K:
+                raise ValueError(f"k doit être compris entre 1 et {MAX_K}")
+        except (ValueError, TypeError) as e:  # json.JSONDecodeError dérive de ValueError ; TypeError : "k": null
+            metrics.count("pixmatcher_errors_total", stage="request_validation")
+            return self.send_json(400, {"error": str(e)})
+
+        with profiling.profile(f"service-{kind}", enabled=params.get("profile") in PROFILE_FLAGS) as query_profile:
+            try:
+                with metrics.span("prepare"):
+                    prepared = self.server.backends[kind].prepare(payload)  # Prétraitement dans le thread de la requête
+            except ValueError as e:
+                return self.send_json(400, {"error": str(e)})
+
+            try:
+                with metrics.span("batch_wait"):  # Attente du lot, passe du modèle et recherche
+                    # Requête profilée : lot à elle seule, que suivent les profileurs (voir src.profiling)
+                    future = self.server.batchers[kind].submit((prepared, dataset, k), solo=query_profile is not None)
+                    results = future.result(REQUEST_TIMEOUT)
+            except FutureTimeoutError:
+                logging.error(f"Aucun résultat après {REQUEST_TIMEOUT} s")
+                return self.send_json(504, {"error": "Délai de recherche dépassé"})
+            except Exception as e:
+                logging.exception("Erreur lors de la recherche")
+                return self.send_json(500, {"error": str(e)})
+        response = {"results": results}
+        if query_profile is not None:
+            response["profile"] = str(query_profile.path)
+        self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+
+class SearchClient:
+    """ Client du service de recherche, utilisé par les pages Streamlit. """
+
+    def __init__(self, base_url: str = SEARCH_URL, timeout: float = 30):
+        """ :param base_url: URL du service (par exemple http://127.0.0.1:8000).
+        :param timeout: Délai maximal (en secondes) d'une requête. """
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()  # Connexion réutilisée d'une recherche à l'autre
+
+    def search_image(self, data: bytes, dataset: str, k: int = DEFAULT_K) -> list[dict]:
+        """ Recherche les images les plus similaires à une image.
+        :return: Liste de résultats {"id", "distance", "path"}.
+        :raises requests.RequestException: En cas d'erreur réseau ou HTTP. """
+
+        with metrics.span("remote_search"):
+            response = self.session.post(f"{self.base_url}/search/image", params={"dataset": dataset, "k": k},
+                                         data=data, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["results"]
+
+    def search_text(self, query: str, dataset: str, k: int = DEFAULT_K) -> list[dict]:
+        """ Recherche les images les plus proches d'une requête textuelle.
+        :return: Liste de résultats {"id", "path"}.
+        :raises requests.RequestException: En cas d'erreur réseau ou HTTP. """
+
+        with metrics.span("remote_search"):
+            response = self.session.post(f"{self.base_url}/search/text",
+                                         json={"query": query, "dataset": dataset, "k": k}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["results"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Service HTTP de recherche CBIR / TBIR.")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute")
+    parser.add_argument("--port", type=int, default=8000, help="Port d'écoute")
+    parser.add_argument("--search", nargs="+", choices=("image", "text"), default=["image", "text"],
+                        help="Types de recherche servis (text nécessite CLIP)")
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE, help="Nombre maximal de requêtes par lot")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT * 1000,
+                        help="Attente maximale (en millisecondes) des requêtes concurrentes")
+    parser.add_argument("--device", default=None, help="'cuda' ou 'cpu' (déduit automatiquement par défaut)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="Processus de service, qui partagent les index chargés une seule fois (voir src.prefork)")
+    parser.add_argument("--bundle", default=None,
+                        help="Bundle de démarrage à froid (voir src.bundle), ou dossier des bundles (dernière version)")
+    args = parser.parse_args()
+    if args.processes > 1 and (args.device or "").startswith("cuda"):  # Vérifié avant le chargement des modèles
+        parser.error("--processes > 1 nécessite --device cpu : CUDA n'est pas utilisable dans les processus fils "
+                     "(voir src.prefork)")
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+    backends = {}
+    if args.bundle:  # Modèles exportés, index préconstruits et requête de préchauffage, sans accès au réseau
+        from src.bundle import load_bundle
+        backends = load_bundle(args.bundle, device=args.device, search=args.search)
+    else:
+        if "image" in args.search:
+            backends["image"] = ImageSearchBackend(device=args.device)
+        if "text" in args.search:
+            backends["text"] = TextSearchBackend()
+    if args.processes > 1:
+        from src.prefork import PreforkServer
+        prefork = PreforkServer((args.host, args.port), backends, args.processes, args.max_batch_size,
+                                args.max_wait_ms / 1000)
+        prefork.start()
+        logging.info(f"Service de recherche à l'écoute sur http://{args.host}:{prefork.server_port} "
+                     f"({args.processes} processus)")
+        try:
+            prefork.monitor()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            prefork.stop()
+        return
+
+    server = SearchServer((args.host, args.port), backends, args.max_batch_size, args.max_wait_ms / 1000)
+    logging.info(f"Service de recherche à l'écoute sur http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
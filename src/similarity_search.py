@@ -3,7 +3,9 @@
 Ce module implémente des fonctions permettant de :
 
     - Charger les embeddings et les catégories des datasets Tiny ImageNet et Open Images.
-    - Construire un index FAISS optimisé pour une recherche rapide de similarité basée sur des embeddings d'images.
+    - Construire un index FAISS optimisé pour une recherche rapide de similarité basée sur des embeddings d'images,
+    précédé de la réduction de dimension apprise sur la collection si elle existe (voir src.reduction), ou un index de
+    codes binaires si la collection en a (voir src.binary_codes).
     - Trouver les 5 catégories les plus proches d'une image donnée, en utilisant la distance cosine pour la comparaison
     des embeddings.
     - Trouver les k images les plus semblables à une image donnée, grâce à l'index FAISS.
@@ -16,24 +18,52 @@ en charge deux datasets : Open Images et Tiny ImageNet. """
 import numpy as np, os, faiss, json
 from pathlib import Path
 from scipy.spatial.distance import cosine
+from src import metrics, profiling
+from src.binary_codes import load_index
+from src.reduction import add_embeddings, make_index
+
+# Dossier des embeddings, catégories et tables des deux datasets (remplaçable, par exemple par des collections
+# synthétiques pour les benchmarks)
+RESSOURCES_PATH = Path(os.environ.get("PIXMATCHER_RESSOURCES_DIR",
+                                      Path(__file__).parent.parent / "ressources"))
 
 """ --------------------- Partie Open Image V7 ---------------------- """
 
 # Charger le mapping index -> nom d'image depuis le fichier JSON
-with open(Path(__file__).parent.parent / "ressources" / "open-images" / "image_urls.json", "r") as f:
+with open(RESSOURCES_PATH / "open-images" / "image_urls.json", "r") as f:
     image_urls = json.load(f)
 
 # Définir l'URL de base pour accéder aux images sur AWS
 base_url = "https://pixmatcher-images.s3.eu-west-3.amazonaws.com/"
 
-# Charger les embeddings CLIP pour Open Image V7 depuis un fichier .npy
-OI_EMBEDDINGS_PATH = (np.load(Path(__file__).parent.parent / "ressources" / "open-images" / "mobilenet_embeddings.npy")
-                      .astype('float32'))
-
-# Construire un index FAISS pour Open Image V7 basé sur les embeddings
-dimension = OI_EMBEDDINGS_PATH.shape[1]  # Extraire la dimension des vecteurs d'embedding
-oi_index = faiss.IndexFlatL2(dimension)  # Créer un index basé sur la distance L2 (euclidienne)
-oi_index.add(OI_EMBEDDINGS_PATH)  # Ajouter les embeddings à l'index FAISS
+# Index FAISS préconstruit par src.bundle (optionnel) : lu tel quel au lieu d'être reconstruit
+OI_INDEX_FILE = RESSOURCES_PATH / "open-images" / "mobilenet_index.faiss"
+# Réduction de dimension apprise par src.reduction (optionnelle), appliquée par l'index aux vecteurs et aux requêtes
+OI_REDUCTION_FILE = RESSOURCES_PATH / "open-images" / "mobilenet_pca.faiss"
+# Codes binaires appris par src.binary_codes (optionnels) : présélection par distance de Hamming, puis re-classement
+OI_CODES_FILE = RESSOURCES_PATH / "open-images" / "mobilenet_codes.npz"
+
+if OI_CODES_FILE.exists():
+    # Seuls les embeddings des candidats sont lus pour le re-classement : ils restent projetés en mémoire
+    OI_EMBEDDINGS_PATH = np.load(RESSOURCES_PATH / "open-images" / "mobilenet_embeddings.npy", mmap_mode="r")
+    oi_index = load_index(OI_CODES_FILE, OI_EMBEDDINGS_PATH)
+elif OI_INDEX_FILE.exists():
+    # Les embeddings ne sont que projetés en mémoire : l'index contient déjà ses propres vecteurs
+    OI_EMBEDDINGS_PATH = np.load(RESSOURCES_PATH / "open-images" / "mobilenet_embeddings.npy", mmap_mode="r")
+    oi_index = faiss.read_index(str(OI_INDEX_FILE))
+elif OI_REDUCTION_FILE.exists():
+    # Seul l'index réduit est gardé en mémoire : les embeddings complets restent projetés, ajoutés par blocs
+    OI_EMBEDDINGS_PATH = np.load(RESSOURCES_PATH / "open-images" / "mobilenet_embeddings.npy", mmap_mode="r")
+    oi_index = make_index(OI_EMBEDDINGS_PATH.shape[1], OI_REDUCTION_FILE)
+    add_embeddings(oi_index, OI_EMBEDDINGS_PATH)
+else:
+    # Charger les embeddings CLIP pour Open Image V7 depuis un fichier .npy
+    OI_EMBEDDINGS_PATH = np.load(RESSOURCES_PATH / "open-images" / "mobilenet_embeddings.npy").astype('float32')
+
+    # Construire un index FAISS pour Open Image V7 basé sur les embeddings
+    dimension = OI_EMBEDDINGS_PATH.shape[1]  # Extraire la dimension des vecteurs d'embedding
+    oi_index = faiss.IndexFlatL2(dimension)  # Créer un index basé sur la distance L2 (euclidienne)
+    oi_index.add(OI_EMBEDDINGS_PATH)  # Ajouter les embeddings à l'index FAISS
 
 
 def oi_find_top_similar_images(image_features: np.ndarray, k):
@@ -57,20 +87,35 @@ def oi_find_top_similar_images(image_features: np.ndarray, k):
     # en fonction de la distance L2 (Euclidienne). FAISS renvoie les distances et les indices des images semblables.
     # 'distances' contient les distances entre l'image donnée et chaque image trouvée,
     # et 'indices' contient les indices des images dans l'index FAISS.
-    distances, indices = oi_index.search(image_features, k)
+    with metrics.span("faiss_search"), profiling.search_profile("oi_find_top_similar_images", oi_index):
+        distances, indices = oi_index.search(image_features, k)
     # La liste contient des tuples (index de l'image, distance de similarité) pour les k images les plus proches.
     top_k_similar = [(idx, distances[0][i]) for i, idx in enumerate(indices[0])]
 
     return top_k_similar
 
 
+def oi_find_top_similar_images_batch(features: np.ndarray, k):
+    """ Trouve les k images les plus similaires dans Open Images pour plusieurs vecteurs, en une seule recherche FAISS.
+    :param features: Matrice (n, d) des vecteurs de caractéristiques
+    :return: Pour chaque vecteur, liste des indices des k images les plus similaires et leurs distances """
+
+    metrics.observe_size("pixmatcher_batch_size", len(features), stage="faiss_search")
+    with metrics.span("faiss_search"), profiling.search_profile("oi_find_top_similar_images_batch", oi_index):
+        distances, indices = oi_index.search(np.ascontiguousarray(features, dtype='float32'), k)
+    # FAISS complète par -1 lorsque k dépasse la taille de la collection
+    return [[(idx, row_distances[i]) for i, idx in enumerate(row_indices) if idx >= 0]
+            for row_distances, row_indices in zip(distances, indices)]
+
+
 def oi_get_image_path(index_image):
     """ Retrouve l'URL complète de l'image (d'Open Images) à partir de son index.
     :param index_image: Index de l'image dans les embeddings
     :return: URL complète de l'image """
 
     # Récupérer le nom du fichier correspondant à l'index dans le mapping
-    filename = image_urls.get(str(index_image))
+    with metrics.span("path_resolution"):
+        filename = image_urls.get(str(index_image))
 
     if filename:
         return base_url + filename
@@ -81,16 +126,46 @@ def oi_get_image_path(index_image):
 """ --------------------- Partie Tiny ImageNet ---------------------- """
 
 # Charger les embeddings et catégories Tiny ImageNet
-TINY_IMAGENET_PATH = Path(__file__).parent.parent / "ressources" / "tiny-imagenet" / "tiny-imagenet-200"
-TI_EMBEDDINGS_PATH = np.load(Path(__file__).parent.parent / "ressources" / "tiny-imagenet"
-                             / "Tiny_ImageNet_MobilNetV3_Embeddings.npy").astype('float32')
-TI_CATEGORIES_PATH = np.load(Path(__file__).parent.parent / "ressources" / "tiny-imagenet"
-                             / "Tiny_ImageNet_MobilNetV3_Categories.npy", allow_pickle=True)
+TINY_IMAGENET_PATH = RESSOURCES_PATH / "tiny-imagenet" / "tiny-imagenet-200"
+TI_EMBEDDINGS_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Embeddings.npy"
+TI_CATEGORIES_PATH = np.load(RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Categories.npy",
+                             allow_pickle=True)
+
+# Chemins relatifs des images et lignes supprimées, produits par src.index (absents des anciennes collections)
+TI_PATHS_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Paths.npy"
+TI_DELETED_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Deleted.npy"
+TI_THUMBNAILS_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Thumbnails.npy"
+# Index FAISS préconstruit par src.bundle (optionnel), lignes supprimées déjà exclues
+TI_INDEX_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Index.faiss"
+# Réduction de dimension apprise par src.reduction (optionnelle)
+TI_REDUCTION_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_PCA.faiss"
+# Codes binaires appris par src.binary_codes (optionnels)
+TI_CODES_FILE = RESSOURCES_PATH / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Codes.npz"
+# Embeddings projetés en mémoire si l'index n'en garde pas une copie complète (codes binaires, index préconstruit ou
+# réduit) : sinon, la matrice en float32 resterait en mémoire à côté de l'index
+if TI_CODES_FILE.exists() or TI_INDEX_FILE.exists() or TI_REDUCTION_FILE.exists():
+    TI_EMBEDDINGS_PATH = np.load(TI_EMBEDDINGS_FILE, mmap_mode="r")
+else:
+    TI_EMBEDDINGS_PATH = np.load(TI_EMBEDDINGS_FILE).astype('float32')
+TI_PATHS = np.load(TI_PATHS_FILE) if TI_PATHS_FILE.exists() else None
+# Atlas de vignettes (N, H, W, 3), projeté en mémoire : seules les lignes affichées sont lues sur disque
+TI_THUMBNAILS = np.load(TI_THUMBNAILS_FILE, mmap_mode="r") if TI_THUMBNAILS_FILE.exists() else None
+TI_DELETED = np.load(TI_DELETED_FILE) if TI_DELETED_FILE.exists() else np.zeros(len(TI_CATEGORIES_PATH), dtype=bool)
 
 # Construire l'index FAISS pour Tiny ImageNet basé sur les embeddings
 dimension = TI_EMBEDDINGS_PATH.shape[1]  # Taille des vecteurs d'embeddings
-ti_index = faiss.IndexFlatL2(dimension)  # Créer un index basé sur la distance L2
-ti_index.add(TI_EMBEDDINGS_PATH)  # Ajouter les embeddings à l'index FAISS
+TI_EMBEDDINGS_PATH = TI_EMBEDDINGS_PATH[:len(TI_DELETED)]  # Lignes au-delà : mise à jour incrémentale interrompue
+if TI_CODES_FILE.exists():
+    ti_index = load_index(TI_CODES_FILE, TI_EMBEDDINGS_PATH, deleted=TI_DELETED)
+elif TI_INDEX_FILE.exists():
+    ti_index = faiss.read_index(str(TI_INDEX_FILE))
+elif TI_DELETED.any():
+    # Les images supprimées par une ré-indexation incrémentale sont exclues, en conservant les numéros de ligne
+    ti_index = faiss.IndexIDMap(make_index(dimension, TI_REDUCTION_FILE))
+    add_embeddings(ti_index, TI_EMBEDDINGS_PATH, np.flatnonzero(~TI_DELETED))
+else:
+    ti_index = make_index(dimension, TI_REDUCTION_FILE)  # Créer un index basé sur la distance L2
+    add_embeddings(ti_index, TI_EMBEDDINGS_PATH)  # Ajouter les embeddings à l'index FAISS (par blocs)
 
 
 def ti_find_top5_categories(image_features: np.ndarray):
@@ -118,7 +193,9 @@ def ti_find_top5_categories(image_features: np.ndarray):
 
     # La distance cosine est utilisée ici pour mesurer la similarité entre les caractéristiques de l'image et les
     # embeddings Tiny ImageNet. Une distance plus faible indique une plus grande similarité entre l'image et l'embedding
-    distances = [cosine(image_features, emb) for emb in TI_EMBEDDINGS_PATH]
+    with metrics.span("category_search"), profiling.search_profile("ti_find_top5_categories", TI_EMBEDDINGS_PATH):
+        distances = [np.inf if deleted else cosine(image_features, emb)
+                     for emb, deleted in zip(TI_EMBEDDINGS_PATH, TI_DELETED)]
     top_5_indices = np.argsort(distances)[:5]  # Récupérer les indices des 5 catégories les plus proches
 
     # Extraire les labels des catégories correspondantes
@@ -148,7 +225,8 @@ def ti_find_top_similar_images(image_features: np.ndarray, k):
     # Lancer la recherche FAISS
     # Exécution de la recherche des k voisins les plus proches dans l'espace vectoriel des embeddings
     # à l'aide de l'index FAISS basé sur la distance euclidienne (L2).
-    distances, indices = ti_index.search(image_features, k)
+    with metrics.span("faiss_search"), profiling.search_profile("ti_find_top_similar_images", ti_index):
+        distances, indices = ti_index.search(image_features, k)
 
     # Créer une liste des k images les plus similaires avec leur distance
     # On associe chaque indice retourné par FAISS avec sa distance correspondante,
@@ -158,12 +236,35 @@ def ti_find_top_similar_images(image_features: np.ndarray, k):
     return top_k_similar
 
 
+def ti_find_top_similar_images_batch(features: np.ndarray, k):
+    """ Trouve les k images les plus similaires dans Tiny ImageNet pour plusieurs vecteurs, en une recherche FAISS.
+    :param features: Matrice (n, d) des vecteurs de caractéristiques
+    :return: Pour chaque vecteur, liste des indices des k images les plus similaires et leurs distances """
+
+    metrics.observe_size("pixmatcher_batch_size", len(features), stage="faiss_search")
+    with metrics.span("faiss_search"), profiling.search_profile("ti_find_top_similar_images_batch", ti_index):
+        distances, indices = ti_index.search(np.ascontiguousarray(features, dtype='float32'), k)
+    return [[(idx, row_distances[i]) for i, idx in enumerate(row_indices) if idx >= 0]
+            for row_distances, row_indices in zip(distances, indices)]
+
+
 def ti_get_image_path(index_image, base_path=TINY_IMAGENET_PATH):
     """ Retrouve le chemin de l'image à partir de son index.
     :param index_image: Index de l'image dans le fichier d'embeddings
     :param base_path: Chemin de base vers le dataset Tiny ImageNet
     :return: Chemin complet vers l'image """
 
+    with metrics.span("path_resolution"):
+        return ti_resolve_image_path(index_image, base_path)
+
+
+def ti_resolve_image_path(index_image, base_path=TINY_IMAGENET_PATH):
+    """ Construit le chemin de l'image à partir de son index (voir ti_get_image_path). """
+
+    # Collection produite par src.index : le chemin relatif de chaque ligne est enregistré
+    if TI_PATHS is not None:
+        return os.path.join(base_path, "train", TI_PATHS[index_image])
+
     # Identifier la classe et l'indice de l'image dans le dataset Tiny ImageNet
     class_id = TI_CATEGORIES_PATH[index_image]
     class_indices = np.where(TI_CATEGORIES_PATH == class_id)[0]
@@ -174,3 +275,13 @@ def ti_get_image_path(index_image, base_path=TINY_IMAGENET_PATH):
     image_path = os.path.join(base_path, "train", class_id, "images", image_name)
 
     return image_path
+
+
+def ti_get_thumbnail(index_image):
+    """ Retrouve la vignette d'une image dans l'atlas produit par src.index (option --thumbnails).
+    :param index_image: Index de l'image dans le fichier d'embeddings
+    :return: Tableau uint8 (H, W, 3), ou None si l'atlas n'a pas été produit """
+
+    if TI_THUMBNAILS is None:
+        return None
+    return np.asarray(TI_THUMBNAILS[index_image])
@@ -0,0 +1,98 @@
+""" Module de test unitaire pour la recherche par codes binaires du fichier binary_codes.py. """
+
+import unittest, tempfile, numpy as np
+from pathlib import Path
+from unittest.mock import patch
+from scipy.spatial.distance import cdist
+from src.binary_codes import (BinaryIndex, encode, encode_collection, fit_collection, load_index, refresh_codes,
+                              train_projection, update_codes)
+
+
+class TestBinaryCodes(unittest.TestCase):
+    def setUp(self):
+        """ Crée une collection de 20 groupes de 100 vecteurs positifs (dimension 64, comme des sorties de ReLU). """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        centers = np.abs(rng.normal(scale=3, size=(20, 64)))
+        self.vectors = (centers[np.repeat(np.arange(20), 100)] + np.abs(rng.normal(size=(2000, 64)))).astype(np.float32)
+        self.queries = self.vectors[::50] + rng.normal(scale=0.1, size=(40, 64)).astype(np.float32)
+
+    def tearDown(self):
+        """ Nettoie les fichiers temporaires. """
+        self.tmp_dir.cleanup()
+
+    def recall(self, indices: np.ndarray, metric: str, k: int = 10) -> float:
+        """ Proportion des k plus proches voisins exacts retrouvés. """
+        exact = np.argsort(cdist(self.queries, self.vectors, "sqeuclidean" if metric == "l2" else metric), axis=1)
+        return np.mean([len(set(row) & set(truth[:k])) / k for row, truth in zip(indices, exact)])
+
+    def test_train_projection(self):
+        """ Vérifie la taille des codes (8 bits par octet) et le refus des paramètres invalides. """
+        mean, projection = train_projection(self.vectors, bits=32)
+        self.assertEqual(projection.shape, (64, 32))
+        self.assertEqual(encode(self.vectors[:3], mean, projection).shape, (3, 4))
+        for bits, method in ((12, "itq"), (128, "itq"), (32, "lsh")):
+            with self.assertRaises(ValueError):
+                train_projection(self.vectors, bits=bits, method=method)
+        self.assertEqual(train_projection(self.vectors, bits=128, method="sign")[1].shape, (64, 128))
+
+    def test_search(self):
+        """ Vérifie que la présélection par distance de Hamming suivie du re-classement exact retrouve l'essentiel des
+        voisins exacts, avec les distances exactes, pour les deux distances et les deux méthodes. """
+        for method in ("itq", "sign"):
+            mean, projection = train_projection(self.vectors, bits=64, method=method)
+            codes = encode(self.vectors, mean, projection)
+            for metric in ("l2", "cosine"):
+                index = BinaryIndex(codes, mean, projection, self.vectors, metric=metric)
+                self.assertEqual((index.d, index.ntotal, index.code_size), (64, 2000, 8))
+                distances, indices = index.search(self.queries, 10)
+                self.assertGreaterEqual(self.recall(indices, metric), 0.9, f"{method}, {metric}")
+                self.assertTrue(np.all(np.diff(distances, axis=1) >= 0))
+                if metric == "l2":
+                    np.testing.assert_allclose(distances[0, 0], ((self.vectors[indices[0, 0]] - self.queries[0]) ** 2)
+                                               .sum(), rtol=1e-4)
+
+    def test_collection_files(self):
+        """ Vérifie l'enregistrement des codes, l'exclusion des lignes supprimées, l'encodage des lignes ajoutées
+        depuis l'apprentissage et le ré-encodage après modification de la collection. """
+        np.save(self.path / "embeddings.npy", self.vectors[:1500])
+        codes_file = fit_collection(self.path / "embeddings.npy", self.path / "codes.npz", bits=32)
+        self.assertIsNone(load_index(self.path / "absent.npz", self.vectors))
+        with self.assertRaises(ValueError):
+            load_index(codes_file, self.vectors[:, :32])
+
+        deleted = np.zeros(2000, dtype=bool)
+        deleted[:100] = True
+        with self.assertLogs(level="WARNING"):  # 500 lignes ajoutées depuis l'encodage
+            index = load_index(codes_file, self.vectors, deleted=deleted)
+        self.assertEqual(index.ntotal, 1900)
+        _, indices = index.search(self.vectors[[0, 1999]], 5)
+        self.assertTrue(np.all(indices >= 100))
+        self.assertEqual(indices[1, 0], 1999)
+
+        np.save(self.path / "embeddings.npy", self.vectors[::-1])
+        refresh_codes(codes_file, self.path / "embeddings.npy")
+        index = load_index(codes_file, np.load(self.path / "embeddings.npy", mmap_mode="r"))
+        self.assertEqual(index.search(self.vectors[:1], 1)[1][0, 0], 1999)
+
+    def test_update_codes(self):
+        """ Vérifie que seules les lignes modifiées et ajoutées sont encodées, et que les autres codes sont
+        conservés. """
+        np.save(self.path / "embeddings.npy", self.vectors[:1500])
+        codes_file = fit_collection(self.path / "embeddings.npy", self.path / "codes.npz", bits=32)
+        with np.load(codes_file) as stored:
+            before, mean, projection = stored["codes"], stored["mean"], stored["projection"]
+
+        vectors = self.vectors.copy()
+        vectors[[3, 7]] = self.vectors[[1990, 1991]]  # Lignes modifiées
+        np.save(self.path / "embeddings.npy", vectors)  # 500 lignes ajoutées
+        with patch("src.binary_codes.encode_collection", wraps=encode_collection) as encoder:
+            update_codes(codes_file, self.path / "embeddings.npy", {7: None, 3: None})
+        self.assertEqual(sum(len(call.args[0]) for call in encoder.call_args_list), 2 + 500)
+        with np.load(codes_file) as stored:
+            codes = stored["codes"]
+        self.assertEqual(len(codes), 2000)
+        np.testing.assert_array_equal(codes[[3, 7]], encode(self.vectors[[1990, 1991]], mean, projection))
+        np.testing.assert_array_equal(codes[1500:], encode(self.vectors[1500:], mean, projection))
+        np.testing.assert_array_equal(np.delete(codes[:1500], [3, 7], axis=0), np.delete(before, [3, 7], axis=0))
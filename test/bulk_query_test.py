@@ -0,0 +1,105 @@
+""" Module de test unitaire pour la recherche en masse du fichier bulk_query.py. """
+
+import unittest, csv, io, json, tarfile, tempfile, zipfile, numpy as np
+from pathlib import Path
+from PIL import Image
+from src.bulk_query import bulk_query, iter_archive
+from helpers import MeanColorEncoder
+
+
+class FailingSearch:
+    """ Recherche de test, qui échoue au lot donné (simulation d'une interruption). """
+
+    def __init__(self, collection: np.ndarray, fail_at: int = None):
+        self.collection = collection
+        self.fail_at = fail_at
+        self.calls = 0
+
+    def __call__(self, vectors: np.ndarray, k: int) -> list:
+        self.calls += 1
+        if self.calls == self.fail_at:
+            raise KeyboardInterrupt
+        distances = ((vectors[:, None] - self.collection[None]) ** 2).sum(axis=2)
+        order = np.argsort(distances, axis=1)[:, :k]
+        return [[(idx, row[idx]) for idx in indices] for row, indices in zip(distances, order)]
+
+
+def jpeg_bytes(color) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (80, 60), color=color).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+class TestBulkQuery(unittest.TestCase):
+    def setUp(self):
+        """ Crée une archive zip de 10 images unies (dont un fichier invalide) et une collection de 3 couleurs. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.colors = [(i * 25, 0, 0) for i in range(10)]
+        self.archive = self.path / "queries.zip"
+        with zipfile.ZipFile(self.archive, "w") as archive:
+            for i, color in enumerate(self.colors):
+                archive.writestr(f"queries/{i}.jpg", jpeg_bytes(color))
+            archive.writestr("queries/broken.jpg", b"not an image")
+            archive.writestr("queries/notes.txt", b"ignored")
+        self.collection = np.array([[0, 0, 0], [120, 0, 0], [250, 0, 0]], dtype=np.float32)
+        self.get_path = lambda idx: f"collection/{idx}.jpg"
+
+    def tearDown(self):
+        """ Nettoie les fichiers temporaires. """
+        self.tmp_dir.cleanup()
+
+    def read_rows(self, output: Path) -> list:
+        with open(output, newline="") as f:
+            return list(csv.DictReader(f))
+
+    def test_archives(self):
+        """ Vérifie la lecture des images d'une archive zip et d'une archive tar compressée, dans l'ordre. """
+        names = [name for name, _ in iter_archive(self.archive)]
+        self.assertEqual(names, [f"queries/{i}.jpg" for i in range(10)] + ["queries/broken.jpg"])
+
+        tar_path = self.path / "queries.tar.gz"
+        with tarfile.open(tar_path, "w:gz") as archive:
+            for name, data in iter_archive(self.archive):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        self.assertEqual([name for name, _ in iter_archive(tar_path)], names)
+
+        with self.assertRaises(ValueError):
+            list(iter_archive(Path(__file__)))
+
+    def test_bulk_query(self):
+        """ Vérifie les résultats écrits, le traitement par lots et les images en erreur (pool de processus). """
+        encoder = MeanColorEncoder(input_size=(32, 32))
+        output = self.path / "results.csv"
+        counts = bulk_query(self.archive, output, k=2, batch_size=4, workers=2, encoder=encoder,
+                            search=FailingSearch(self.collection), get_path=self.get_path)
+        self.assertEqual(counts, {"queries": 10, "failed": 1, "resumed": 0})
+        self.assertEqual(encoder.batches, [4, 4, 2])
+
+        rows = self.read_rows(output)
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(list(rows[0]), ["query", "rank", "id", "distance", "path"])
+        nearest = {row["query"]: int(row["id"]) for row in rows if row["rank"] == "0"}
+        self.assertEqual(nearest["queries/0.jpg"], 0)
+        self.assertEqual(nearest["queries/5.jpg"], 1)
+        self.assertEqual(nearest["queries/9.jpg"], 2)
+        self.assertEqual(rows[1]["path"], f"collection/{rows[1]['id']}.jpg")
+
+    def test_resume(self):
+        """ Vérifie qu'une exécution interrompue reprend après le dernier lot terminé, sans doublons. """
+        output = self.path / "results.csv"
+        with self.assertRaises(KeyboardInterrupt):
+            bulk_query(self.archive, output, k=1, batch_size=3, workers=0,
+                       encoder=MeanColorEncoder(input_size=(32, 32)), search=FailingSearch(self.collection, fail_at=3),
+                       get_path=self.get_path)
+        with open(self.path / "results.csv.progress.json") as f:
+            self.assertEqual(json.load(f)["done"], 6)
+
+        encoder = MeanColorEncoder(input_size=(32, 32))
+        counts = bulk_query(self.archive, output, k=1, batch_size=3, workers=0, encoder=encoder,
+                            search=FailingSearch(self.collection), get_path=self.get_path)
+        self.assertEqual(counts, {"queries": 10, "failed": 1, "resumed": 6})
+        self.assertEqual(encoder.batches, [3, 1])
+        self.assertEqual([row["query"] for row in self.read_rows(output)], [f"queries/{i}.jpg" for i in range(10)])
@@ -0,0 +1,124 @@
+""" Module de test unitaire pour le bundle de démarrage à froid du fichier bundle.py. """
+
+import unittest, json, os, sys, tempfile, numpy as np, torch
+from pathlib import Path
+from PIL import Image
+from src import bundle
+from src.feature_extractor import FeatureExtractor
+
+# Dimension des vecteurs du petit réseau de test, et taille des collections synthétiques
+DIM = 8
+SIZE = 40
+
+
+def tiny_backbone() -> torch.nn.Module:
+    """ Petit réseau convolutif (image -> vecteur de dimension DIM), à la place de MobileNetV3. """
+
+    torch.manual_seed(0)
+    return torch.nn.Sequential(torch.nn.Conv2d(3, DIM, 3, stride=4), torch.nn.ReLU(),
+                               torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten())
+
+
+def write_ressources(root: Path):
+    """ Écrit des collections synthétiques (MobileNetV3 seulement), au format attendu par similarity_search. """
+
+    rng = np.random.default_rng(0)
+    categories = np.array([f"n{i % 4:08d}" for i in range(SIZE)])
+    (root / "tiny-imagenet" / "tiny-imagenet-200").mkdir(parents=True)
+    np.save(root / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Embeddings.npy", rng.random((SIZE, DIM), np.float32))
+    np.save(root / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Categories.npy", categories)
+    deleted = np.zeros(SIZE, dtype=bool)
+    deleted[:5] = True
+    np.save(root / "tiny-imagenet" / "Tiny_ImageNet_MobilNetV3_Deleted.npy", deleted)
+    (root / "tiny-imagenet" / "tiny-imagenet-200" / "words.txt").write_text("n00000000\tchat\n")
+    (root / "open-images").mkdir()
+    np.save(root / "open-images" / "mobilenet_embeddings.npy", rng.random((SIZE, DIM), np.float32))
+    with open(root / "open-images" / "image_urls.json", "w") as f:
+        json.dump({str(i): f"{i}.jpg" for i in range(SIZE)}, f)
+
+
+class TestBundle(unittest.TestCase):
+    def setUp(self):
+        """ Crée le dossier temporaire, et sauvegarde l'environnement modifié par les bundles. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        self.environ = dict(os.environ)
+
+    def tearDown(self):
+        """ Restaure l'environnement, oublie les modules chargés sur les ressources temporaires et les nettoie. """
+        os.environ.clear()
+        os.environ.update(self.environ)
+        sys.modules.pop("src.similarity_search", None)
+        self.tmp_dir.cleanup()
+
+    def test_export_backbone(self):
+        """ Vérifie que le réseau exporté est chargé par FeatureExtractor, sans torchvision, et produit les mêmes
+        vecteurs que le réseau d'origine. """
+        module = tiny_backbone()
+        bundle.export_backbone(module, self.path / "models" / "backbone.pt", (224, 224), DIM)
+        extractor = FeatureExtractor(device="cpu", backbone=self.path / "models" / "backbone.pt")
+        self.assertIsNone(extractor.model)
+        self.assertEqual(extractor.feature_dim, DIM)
+
+        image = Image.fromarray(np.random.default_rng(0).integers(0, 255, (300, 200, 3), dtype=np.uint8))
+        tensor = extractor.basic_transform(image)
+        with torch.no_grad():
+            expected = module(tensor.unsqueeze(0)).numpy()[0]
+        np.testing.assert_allclose(extractor.extract_features(tensor, from_preprocessed=True), expected, rtol=1e-5,
+                                   atol=1e-6)
+
+    def test_verify(self):
+        """ Vérifie la détection d'un fichier tronqué (taille) ou modifié (empreinte), et la résolution de LATEST. """
+        version = self.path / "v1"
+        (version / "ressources").mkdir(parents=True)
+        (version / "ressources" / "a.npy").write_bytes(b"0123456789")
+        bundle.write_manifest(version, {"format": bundle.BUNDLE_FORMAT, "version": "v1", "models": {}},
+                              ["ressources/a.npy"])
+        (self.path / bundle.LATEST_FILE).write_text("v1\n")
+        self.assertEqual(bundle.resolve_bundle(self.path), version)
+        self.assertEqual(bundle.verify_bundle(version, checksums=True)["version"], "v1")
+
+        (version / "ressources" / "a.npy").write_bytes(b"0123456780")
+        bundle.verify_bundle(version)  # Même taille : seule l'empreinte détecte la modification
+        with self.assertRaises(ValueError):
+            bundle.verify_bundle(version, checksums=True)
+        (version / "ressources" / "a.npy").write_bytes(b"01234")
+        with self.assertRaises(ValueError):
+            bundle.verify_bundle(version)
+        with self.assertRaises(ValueError):
+            bundle.resolve_bundle(self.path / "absent")
+
+    def test_load_bundle(self):
+        """ Vérifie qu'un bundle (réseau exporté, collections copiées, index préconstruits) démarre un backend de
+        recherche d'images préchauffé, qui lit les index du bundle. """
+        source = self.path / "ressources"
+        write_ressources(source)
+        os.environ["PIXMATCHER_RESSOURCES_DIR"] = str(source)
+        sys.modules.pop("src.similarity_search", None)
+        from src import similarity_search
+
+        staging = self.path / "bundles" / "v1"
+        bundle.export_backbone(tiny_backbone(), staging / "models" / "mobilenet.pt", (224, 224), DIM)
+        files = ["models/mobilenet.pt"]
+        files += [f"ressources/{name}" for name in bundle.copy_collection(source, staging / "ressources")]
+        files += [f"ressources/{name}" for name in bundle.export_indexes(similarity_search, staging / "ressources")]
+        bundle.write_manifest(staging, {"format": bundle.BUNDLE_FORMAT, "version": "v1",
+                                        "models": {"mobilenet": "models/mobilenet.pt"}}, files)
+        (self.path / "bundles" / bundle.LATEST_FILE).write_text("v1")
+        self.assertIn("ressources/tiny-imagenet/Tiny_ImageNet_MobilNetV3_Index.faiss", files)
+        embeddings = "tiny-imagenet/Tiny_ImageNet_MobilNetV3_Embeddings.npy"
+        # Copie indépendante : une mise à jour sur place des ressources ne modifie pas le bundle
+        self.assertEqual(os.stat(staging / "ressources" / embeddings).st_nlink, 1)
+
+        with self.assertRaises(ValueError):  # Pas d'encodeur de texte dans ce bundle
+            bundle.load_bundle(self.path / "bundles", device="cpu", search=["text"])
+        backends = bundle.load_bundle(self.path / "bundles", device="cpu", search=["image"])
+        self.assertEqual(list(backends), ["image"])
+        self.assertEqual(similarity_search.RESSOURCES_PATH, staging / "ressources")
+        self.assertTrue(similarity_search.TI_INDEX_FILE.exists())
+        self.assertEqual(similarity_search.ti_index.ntotal, SIZE - 5)
+
+        query = backends["image"].prepare(bundle.warmup_image())
+        results = backends["image"].run_batch([(query, "tiny-imagenet", 3), (query, "open-images", 2)])
+        self.assertEqual([len(result) for result in results], [3, 2])
+        self.assertTrue(all(result["id"] >= 5 for result in results[0]))
@@ -0,0 +1,65 @@
+""" Module de test unitaire pour le cache disque adressé par contenu du fichier cache.py. """
+
+import unittest, os, tempfile, numpy as np
+from src.cache import DiskCache, cache_key, config_fingerprint, read_image_bytes
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        """ Configuration initiale avant chaque test : un cache dans un dossier temporaire. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskCache(self.tmp_dir.name, max_bytes=10_000)
+
+    def tearDown(self):
+        """ Nettoyage après chaque test. """
+        self.tmp_dir.cleanup()
+
+    def test_cache_key(self):
+        """ Vérifie que la clé dépend du contenu et de la configuration, mais pas de l'ordre des clés. """
+        config = {"model": "mobilenet_v3_large", "target_size": [224, 224]}
+        self.assertEqual(config_fingerprint(config), config_fingerprint(dict(reversed(list(config.items())))))
+        self.assertEqual(cache_key(b"image", "features", config), cache_key(b"image", "features", config))
+        self.assertNotEqual(cache_key(b"image", "features", config), cache_key(b"other", "features", config))
+        self.assertNotEqual(cache_key(b"image", "features", config),
+                            cache_key(b"image", "features", {**config, "model": "clip"}))
+
+    def test_put_get(self):
+        """ Teste l'écriture puis la lecture d'une entrée. """
+        key = cache_key(b"image", "features", {})
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, np.arange(10, dtype=np.float32))
+        np.testing.assert_array_equal(self.cache.get(key), np.arange(10, dtype=np.float32))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # Aucun fichier temporaire ne doit subsister après une écriture atomique
+        self.assertEqual([p for p in os.listdir(self.cache.path_for(key).parent) if p.endswith(".tmp")], [])
+
+    def test_lru_eviction(self):
+        """ Vérifie que les entrées les moins récemment utilisées sont évincées au-delà du plafond. """
+        keys = [cache_key(bytes([i]), "features", {}) for i in range(5)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, np.zeros(400, dtype=np.float32))  # ~1,7 Ko par entrée
+            os.utime(self.cache.path_for(key), (i, i))  # Dates d'accès croissantes
+        self.cache.get(keys[0])  # La première entrée redevient la plus récente
+        for i in range(5, 8):
+            self.cache.put(cache_key(bytes([i]), "features", {}), np.zeros(400, dtype=np.float32))
+
+        self.assertLessEqual(self.cache.disk_usage(), self.cache.max_bytes)
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+
+    def test_raw_bytes(self):
+        """ Teste le stockage d'octets bruts avec une autre extension, ignoré par le cache des tableaux. """
+        thumbnails = DiskCache(self.tmp_dir.name, max_bytes=10_000, suffix=".jpeg")
+        thumbnails.put_bytes("oi-1", b"jpeg")
+        self.assertEqual(thumbnails.get_bytes("oi-1"), b"jpeg")
+        self.assertTrue(thumbnails.path_for("oi-1").name.endswith(".jpeg"))
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_read_image_bytes(self):
+        """ Teste la récupération des octets bruts selon le type d'entrée. """
+        path = os.path.join(self.tmp_dir.name, "image.jpg")
+        with open(path, "wb") as f:
+            f.write(b"content")
+        self.assertEqual(read_image_bytes(path), b"content")
+        self.assertEqual(read_image_bytes(b"content"), b"content")
+        self.assertIsNone(read_image_bytes(np.zeros((2, 2, 3), dtype=np.uint8)))
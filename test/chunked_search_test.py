@@ -0,0 +1,51 @@
+""" Module de test unitaire pour la recherche exacte par blocs du fichier chunked_search.py. """
+
+import unittest, tempfile, numpy as np
+from pathlib import Path
+from scipy.spatial.distance import cdist
+from src.chunked_search import ChunkedIndex
+
+
+class TestChunkedSearch(unittest.TestCase):
+    def setUp(self):
+        """ Enregistre une collection de 1000 vecteurs normalisés (dimension 16), relue par projection en mémoire. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        vectors = rng.normal(size=(1000, 16)).astype(np.float32)
+        np.save(Path(self.tmp_dir.name) / "embeddings.npy", vectors / np.linalg.norm(vectors, axis=1, keepdims=True))
+        self.vectors = np.load(Path(self.tmp_dir.name) / "embeddings.npy", mmap_mode="r")
+        self.queries = rng.normal(size=(5, 16)).astype(np.float32)
+        self.queries /= np.linalg.norm(self.queries, axis=1, keepdims=True)
+
+    def tearDown(self):
+        """ Libère la projection en mémoire et nettoie les fichiers temporaires. """
+        del self.vectors
+        self.tmp_dir.cleanup()
+
+    def test_inner_product(self):
+        """ Vérifie que le parcours par blocs (dont un dernier bloc incomplet) renvoie les mêmes résultats que le
+        produit matriciel en mémoire, quel que soit le nombre de threads. """
+        similarities = self.queries @ np.asarray(self.vectors).T
+        expected = np.argsort(-similarities, axis=1)[:, :10]
+        for threads in (1, 3):
+            index = ChunkedIndex(self.vectors, block_rows=64, threads=threads)
+            scores, indices = index.search(self.queries, 10)
+            np.testing.assert_array_equal(indices, expected)
+            np.testing.assert_allclose(scores, np.take_along_axis(similarities, expected, axis=1), rtol=1e-5)
+        with self.assertRaises(ValueError):
+            ChunkedIndex(self.vectors, metric="l2")
+
+    def test_cosine_deleted(self):
+        """ Vérifie la distance cosinus (requêtes non normalisées), l'exclusion des lignes supprimées et le
+        complément par -1 lorsque k dépasse le nombre de lignes restantes. """
+        deleted = np.ones(1000, dtype=bool)
+        deleted[::100] = False
+        index = ChunkedIndex(self.vectors, metric="cosine", deleted=deleted, block_rows=128, threads=2)
+        self.assertEqual((index.d, index.ntotal), (16, 10))
+
+        distances = cdist(3 * self.queries, self.vectors, metric="cosine")
+        distances[:, deleted] = np.inf
+        scores, indices = index.search(3 * self.queries, 12)
+        np.testing.assert_array_equal(indices[:, :10], np.argsort(distances, axis=1)[:, :10])
+        np.testing.assert_allclose(scores[:, :10], np.sort(distances, axis=1)[:, :10], rtol=1e-4, atol=1e-6)
+        self.assertTrue(np.all(indices[:, 10:] == -1))
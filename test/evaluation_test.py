@@ -0,0 +1,46 @@
+""" Module de test unitaire pour l'évaluation des index FAISS du fichier evaluation.py. """
+
+import unittest, numpy as np
+from src.evaluation import evaluate, format_table, parse_config, precision_map_at_k
+
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        """ Crée une collection de 8 catégories bien séparées de 100 vecteurs (dimension 32). """
+        rng = np.random.default_rng(0)
+        centers = rng.normal(scale=10, size=(8, 32))
+        self.categories = np.repeat(np.array([f"n{i:02d}" for i in range(8)]), 100)
+        self.vectors = (centers[np.repeat(np.arange(8), 100)] + rng.normal(size=(800, 32))).astype(np.float32)
+
+    def test_parse_config(self):
+        """ Vérifie la séparation de la chaîne de la fabrique FAISS et des paramètres de recherche. """
+        self.assertEqual(parse_config("IVF64,Flat:nprobe=8"), ("IVF64,Flat", "nprobe=8"))
+        self.assertEqual(parse_config("Flat"), ("Flat", ""))
+
+    def test_precision_map(self):
+        """ Vérifie la précision@k et le mAP@k sur un exemple calculé à la main. """
+        categories = np.array(["a", "a", "a", "b", "b"])
+        neighbours = np.array([[1, 3, 2], [-1, -1, -1]])
+        precision, mean_ap = precision_map_at_k(neighbours, np.array(["a", "b"]), categories, {"a": 3, "b": 2})
+        self.assertAlmostEqual(precision, 2 / 6)
+        self.assertAlmostEqual(mean_ap, ((1 + 2 / 3) / 2 + 0) / 2)
+
+    def test_evaluate(self):
+        """ Vérifie que l'index exact a un rappel de 1, qu'un index IVF parcourant toutes ses listes aussi, et que la
+        précision reflète les catégories bien séparées. """
+        results = evaluate(self.vectors, self.categories, ["Flat", "IVF8,Flat:nprobe=8", "IVF8,Flat:nprobe=1",
+                                                           "PQ4x4"], k=5, num_queries=100, batch_sizes=[1, 32])
+        by_config = {result["config"]: result for result in results}
+        self.assertEqual(by_config["Flat"]["recall"], 1.0)
+        self.assertEqual(by_config["IVF8,Flat:nprobe=8"]["recall"], 1.0)
+        self.assertEqual(by_config["Flat"]["precision"], 1.0)
+        self.assertEqual(by_config["Flat"]["map"], 1.0)
+        self.assertLessEqual(by_config["IVF8,Flat:nprobe=1"]["recall"], 1.0)
+        self.assertLess(by_config["PQ4x4"]["bytes_per_vector"], by_config["Flat"]["bytes_per_vector"])
+        self.assertGreater(by_config["Flat"]["bytes_per_vector"], 32 * 4 - 1)
+        self.assertGreater(by_config["Flat"]["qps@32"], 0)
+
+        table = format_table(results, k=5).splitlines()
+        self.assertEqual(len(table), 5)
+        self.assertIn("recall@5", table[0])
+        self.assertIn("qps@32", table[0])
@@ -1,8 +1,11 @@
 """ Module de test unitaire pour l'extraction du vecteur de caractéristique du fichier feature_extractor.py. """
 
-import unittest, os, torch, numpy as np
+import unittest, os, tempfile, torch, numpy as np
 from PIL import Image
+from unittest.mock import patch
 from src.feature_extractor import FeatureExtractor
+from src.cache import DiskCache
+from src.image_preprocessing import preprocess_image
 
 
 class TestFeatureExtractor(unittest.TestCase):
@@ -42,6 +45,52 @@ class TestFeatureExtractor(unittest.TestCase):
         self.assertIsInstance(features, np.ndarray)
         self.assertEqual(features.ndim, 1)
 
+    def test_extract_features_from_bytes(self):
+        """ Teste l'extraction des caractéristiques à partir d'une image en mémoire (octets). """
+        with open(self.valid_image_path, 'rb') as f:
+            features = self.extractor.extract_features(f.read())
+        self.assertIsInstance(features, np.ndarray)
+        self.assertEqual(features.ndim, 1)
+
+    def test_extract_features_batch(self):
+        """ Teste l'extraction par lots : mêmes vecteurs que l'extraction image par image, dans le même ordre. """
+        images = [Image.new('RGB', (300, 200), color=color) for color in ('red', 'green', 'blue')]
+        features = self.extractor.extract_features_batch(images, batch_size=2)
+        self.assertEqual(features.shape, (3, self.extractor.feature_dim))
+        for image, row in zip(images, features):
+            np.testing.assert_allclose(row, self.extractor.extract_features(image), rtol=1e-4, atol=1e-4)
+
+    def test_extract_features_with_cache(self):
+        """ Vérifie qu'une seconde extraction de la même image est servie par le cache. """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.extractor.cache = DiskCache(cache_dir)
+            first = self.extractor.extract_features(self.valid_image_path)
+            second = self.extractor.extract_features(self.valid_image_path)
+            batch = self.extractor.extract_features_batch([self.valid_image_path])
+            self.assertEqual(self.extractor.cache.hits, 2)
+            self.extractor.cache = None
+        np.testing.assert_array_equal(first, second)
+        np.testing.assert_array_equal(first, batch[0])
+
+    def test_extract_features_with_tensor_cache(self):
+        """ Vérifie qu'après un changement de modèle, les images prétraitées en cache ne sont pas redécodées. """
+        with tempfile.TemporaryDirectory() as cache_dir:
+            extractor = FeatureExtractor(device=self.device, target_size=self.target_size,
+                                         cache=DiskCache(cache_dir), cache_tensors=True)
+            first = extractor.extract_features(self.valid_image_path)
+            batch = extractor.extract_features_batch([self.valid_image_path, Image.new('RGB', (300, 200))])
+
+            with patch("src.feature_extractor.preprocess_image", wraps=preprocess_image) as preprocess:
+                # Chaque changement de poids invalide les vecteurs en cache, pas les images prétraitées
+                extractor.cache_config = {**extractor.cache_config, "weights": "other"}
+                second = extractor.extract_features(self.valid_image_path)
+                extractor.cache_config = {**extractor.cache_config, "weights": "another"}
+                batch_second = extractor.extract_features_batch([self.valid_image_path])
+            preprocess.assert_not_called()
+        np.testing.assert_allclose(second, first, rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(batch_second[0], batch[0], rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(batch[0], first, rtol=1e-4, atol=1e-4)
+
     def test_invalid_image_path(self):
         """ Vérifie qu'une erreur est levée pour un chemin d'image invalide. """
         with self.assertRaises(ValueError):
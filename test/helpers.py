@@ -0,0 +1,36 @@
+""" Outils communs aux modules de test : encodeur de test des pipelines d'indexation, d'ingestion et de recherche en
+masse. """
+
+import numpy as np
+
+
+class MeanColorEncoder:
+    """ Encodeur de test : l'embedding d'une image est sa couleur moyenne, avec un compteur d'images encodées. """
+
+    def __init__(self, batch_size: int = 64, input_size: tuple[int, int] = (64, 64), fail_after: int = None):
+        """ :param batch_size: Taille maximale d'un lot.
+        :param input_size: Taille des images attendue par l'encodeur.
+        :param fail_after: Nombre d'images encodées au-delà duquel encode échoue (simulation d'une interruption). """
+
+        self.batch = np.zeros((batch_size, 3), dtype=np.float32)
+        self.dim = 3
+        self.input_size = input_size
+        self.cache_config = {"model": "mean-color"}
+        self.encoded = 0
+        self.fail_after = fail_after
+        self.images = []
+        self.batches = []
+
+    def put(self, position, image):
+        """ :param image: Image PIL (indexation, ingestion) ou tableau de pixels (recherche en masse). """
+
+        self.images.append(image)
+        pixels = np.asarray(image.convert("RGB") if hasattr(image, "convert") else image, dtype=np.float32)
+        self.batch[position] = pixels.reshape(-1, 3).mean(axis=0)
+
+    def encode(self, count):
+        if self.fail_after is not None and self.encoded + count > self.fail_after:
+            raise RuntimeError("Interruption simulée")
+        self.encoded += count
+        self.batches.append(count)
+        return self.batch[:count].copy()
@@ -0,0 +1,106 @@
+""" Module de test unitaire pour le téléchargement des images de résultats du fichier image_fetcher.py. """
+
+import unittest, io, time, tempfile, threading, functools
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+from PIL import Image
+from src import image_fetcher
+from src.image_fetcher import (fetch_images, fetch_thumbnails, make_thumbnail, most_popular, record_popularity,
+                               thumbnail_key, warm_thumbnails)
+from src.cache import DiskCache
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """ Serveur de test : chaque réponse est retardée, pour simuler la latence du bucket. """
+    delay = 0.3
+    requests = 0
+
+    def do_GET(self):
+        SlowHandler.requests += 1
+        time.sleep(self.delay)
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestImageFetcher(unittest.TestCase):
+    def setUp(self):
+        """ Démarre un serveur HTTP local servant 6 images JPEG de 1000x800. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        for i in range(6):
+            Image.new("RGB", (1000, 800), color=(i * 40, 0, 0)).save(Path(self.tmp_dir.name) / f"{i}.jpg")
+        handler = functools.partial(SlowHandler, directory=self.tmp_dir.name)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/"
+        self.cache = DiskCache(Path(self.tmp_dir.name) / "thumbnails", suffix=".jpeg")
+        SlowHandler.requests = 0
+
+    def tearDown(self):
+        """ Arrête le serveur et nettoie les fichiers. """
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmp_dir.cleanup()
+
+    def test_make_thumbnail(self):
+        """ Vérifie que la vignette respecte la taille maximale et les proportions. """
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 800)).save(buffer, format="JPEG")
+        thumbnail = make_thumbnail(buffer.getvalue(), (400, 400))
+        self.assertEqual(thumbnail.size, (400, 320))
+        self.assertEqual(thumbnail.mode, "RGB")
+
+    def test_fetch_images_parallel(self):
+        """ Vérifie que les images sont téléchargées en parallèle, dans l'ordre, avec les erreurs à leur place. """
+        urls = [f"{self.base_url}{i}.jpg" for i in range(6)] + [f"{self.base_url}missing.jpg", None]
+        start = time.perf_counter()
+        results = fetch_images(urls)
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 8 * SlowHandler.delay / 2)  # En séquentiel : 8 fois le délai
+        self.assertEqual([r.getpixel((0, 0))[0] // 40 for r in results[:6]], list(range(6)))
+        self.assertTrue(all(r.size == (400, 320) for r in results[:6]))
+        self.assertIsInstance(results[6], Exception)
+        self.assertIsInstance(results[7], ValueError)
+
+    def test_fetch_thumbnails_cache(self):
+        """ Vérifie qu'une vignette déjà affichée est servie par le cache disque, sans requête réseau. """
+        urls = [f"{self.base_url}{i}.jpg" for i in range(3)]
+        first = fetch_thumbnails(urls, cache=self.cache)
+        self.assertEqual(SlowHandler.requests, 3)
+        second = fetch_thumbnails(urls[::-1], cache=self.cache)
+        self.assertEqual(SlowHandler.requests, 3)
+        self.assertEqual(second[0].size, first[2].size)
+        self.assertAlmostEqual(second[0].getpixel((0, 0))[0], 80, delta=3)  # Vignette JPEG de l'image 2
+
+        results = fetch_thumbnails([f"{self.base_url}missing.jpg", None], cache=self.cache)
+        self.assertIsInstance(results[0], Exception)
+        self.assertIsInstance(results[1], ValueError)
+        # Les erreurs ne sont pas mises en cache
+        self.assertFalse(self.cache.path_for(thumbnail_key(f"{self.base_url}missing.jpg")).exists())
+        # Vignettes réparties dans les sous-dossiers du cache, selon l'empreinte de leur URL
+        self.assertGreater(len({path.parent for path in self.cache.directory.rglob("*.jpeg")}), 1)
+
+    def test_warm_thumbnails(self):
+        """ Teste le préremplissage du cache avec les images les plus affichées. """
+        url = lambda i: f"{self.base_url}{i}.jpg"
+        for displayed in ([4, 5], [5], [5, 3]):
+            record_popularity([url(i) for i in displayed], self.cache)
+        self.assertEqual(most_popular(2, self.cache), [url(5), url(4)])
+        self.assertEqual(warm_thumbnails(2, cache=self.cache), 2)
+        self.assertEqual(SlowHandler.requests, 2)
+        self.assertEqual(warm_thumbnails(2, cache=self.cache), 0)  # Déjà en cache
+        self.assertEqual(most_popular(3, self.cache), [url(5), url(4), url(3)])  # Préremplissage non journalisé
+
+    def test_popularity_compaction(self):
+        """ Vérifie que le journal de popularité est compacté en un compte par URL au-delà de sa taille maximale. """
+        max_bytes, max_entries = image_fetcher.POPULARITY_LOG_MAX_BYTES, image_fetcher.POPULARITY_MAX_ENTRIES
+        image_fetcher.POPULARITY_LOG_MAX_BYTES, image_fetcher.POPULARITY_MAX_ENTRIES = 2000, 3
+        try:
+            for _ in range(100):
+                record_popularity([f"{self.base_url}{i}.jpg" for i in range(5)] + [f"{self.base_url}0.jpg"], self.cache)
+        finally:
+            image_fetcher.POPULARITY_LOG_MAX_BYTES, image_fetcher.POPULARITY_MAX_ENTRIES = max_bytes, max_entries
+        self.assertLessEqual((self.cache.directory / image_fetcher.POPULARITY_LOG).stat().st_size, 2000 + 250)
+        self.assertEqual(most_popular(1, self.cache), [f"{self.base_url}0.jpg"])
@@ -1,8 +1,9 @@
 """ Module de test unitaire pour le prétraitement de l'image du fichier image_processing.py. """
 
-import unittest, os, torch
+import unittest, os, io, torch, numpy as np
 from PIL import Image
-from src.image_preprocessing import preprocess_image, is_allowed_extension, InvalidImageFormatError
+from src.image_preprocessing import (preprocess_image, is_allowed_extension, InvalidImageFormatError, draft_size,
+                                     sniff_image_format, BatchCollator, collate_uint8)
 from pathlib import Path
 
 
@@ -55,3 +56,78 @@ class TestPreprocessing(unittest.TestCase):
         self.assertIsInstance(processed_tensor, torch.Tensor)
         self.assertEqual(processed_tensor.shape, (3, 224, 224))  # Vérifie la forme du tenseur
 
+
+    def test_preprocess_image_speed_mode_large_jpeg(self):
+        """ Teste le mode rapide (décodage JPEG réduit) sur une grande image. """
+        large_image_path = "large_test_image.jpg"
+        Image.new('RGB', (4000, 3000), color='green').save(large_image_path)
+        try:
+            for mode in ("quality", "speed"):
+                processed_image = preprocess_image(large_image_path, to_tensor=False, mode=mode)
+                self.assertEqual(processed_image.size, (224, 224))
+                self.assertEqual(processed_image.mode, 'RGB')
+        finally:
+            os.remove(large_image_path)
+
+    def test_preprocess_image_invalid_mode(self):
+        """ Vérifie qu'une ValueError est levée pour un mode de prétraitement inconnu. """
+        with self.assertRaises(ValueError):
+            preprocess_image(self.valid_image_path, mode="unknown")
+
+    def test_draft_size(self):
+        """ Vérifie que le décodage réduit ne descend jamais sous la taille cible ni sous la borne max_dim. """
+        self.assertEqual(draft_size((4000, 3000), (224, 224), 1024, "speed"), (224, 224))
+        self.assertEqual(draft_size((4000, 3000), (224, 224), 1024, "quality"), (1024, 768))
+        self.assertEqual(draft_size((300, 200), (224, 224), 1024, "quality"), (300, 224))
+
+    def test_preprocess_image_in_memory_inputs(self):
+        """ Teste le prétraitement depuis des octets, un BytesIO, un tableau NumPy et une PIL.Image. """
+        with open(self.valid_image_path, 'rb') as f:
+            image_bytes = f.read()
+        inputs = [image_bytes, io.BytesIO(image_bytes), np.zeros((300, 200, 3), dtype=np.uint8),
+                  Image.new('RGB', (300, 200), color='blue')]
+        for image_input in inputs:
+            processed_tensor = preprocess_image(image_input, target_size=(224, 224), to_tensor=True)
+            self.assertEqual(processed_tensor.shape, (3, 224, 224))
+
+    def test_preprocess_image_keeps_caller_image(self):
+        """ Vérifie qu'un JPEG non décodé fourni par l'appelant n'est pas réduit en place par le décodage réduit. """
+        buffer = io.BytesIO()
+        Image.new('RGB', (4000, 3000), color='green').save(buffer, format='JPEG')
+        image = Image.open(buffer)
+        self.assertEqual(preprocess_image(image, to_tensor=False, mode="speed").size, (224, 224))
+        self.assertEqual(image.size, (4000, 3000))
+        self.assertEqual(image.convert('RGB').size, (4000, 3000))  # Décodage complet
+
+    def test_preprocess_image_sniffs_content(self):
+        """ Vérifie que le format est déterminé d'après le contenu et non d'après l'extension. """
+        self.assertEqual(sniff_image_format(b'\x89PNG\r\n\x1a\n' + b'\x00' * 8), 'PNG')
+        self.assertEqual(sniff_image_format(b'\xff\xd8\xff\xe0'), 'JPEG')
+        self.assertIsNone(sniff_image_format(b'Invalid content'))
+        with self.assertRaises(InvalidImageFormatError):
+            preprocess_image(b'Invalid content')
+        # Un PNG portant une extension .jpg est accepté
+        misnamed_path = "misnamed_image.jpg"
+        Image.new('RGB', (50, 50)).save(misnamed_path, format='PNG')
+        try:
+            self.assertEqual(preprocess_image(misnamed_path, to_tensor=False).size, (224, 224))
+        finally:
+            os.remove(misnamed_path)
+
+    def test_batch_collator(self):
+        """ Vérifie que la normalisation par lot donne le même résultat que preprocess_image image par image. """
+        images = [Image.new('RGB', (300, 200), color=color) for color in ('red', 'green', 'blue')]
+        expected = torch.stack([preprocess_image(image) for image in images])
+
+        collator = BatchCollator(batch_size=4)
+        batch = collator.collate(images)
+        self.assertEqual(batch.shape, (3, 3, 224, 224))
+        self.assertTrue(torch.allclose(batch, expected, atol=1e-5))
+        self.assertEqual(batch.data_ptr(), collator.collate(images).data_ptr())  # Le tampon est réutilisé
+
+        uint8_batch = collate_uint8(images)
+        self.assertEqual(uint8_batch.dtype, torch.uint8)
+        self.assertTrue(torch.allclose(collator.normalize(3, uint8_batch), expected, atol=1e-5))
+
+        with self.assertRaises(ValueError):
+            collator.collate(images * 2)  # Plus d'images que la taille du tampon
@@ -0,0 +1,289 @@
+""" Module de test unitaire pour l'indexation hors ligne du fichier index.py. """
+
+import unittest, os, tempfile, faiss, numpy as np
+from pathlib import Path
+from unittest.mock import patch
+from PIL import Image
+from src.index import (list_dataset_images, build_index, build_indexes, update_index, update_indexes, collection_paths,
+                       EmbeddingWriter, OUTPUT_PREFIXES)
+from src.binary_codes import load_index
+from src.cache import DiskCache
+from helpers import MeanColorEncoder
+
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        """ Crée un mini dataset au format Tiny ImageNet : 2 classes de 5 images, plus un fichier illisible. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.dataset_path = Path(self.tmp_dir.name) / "tiny-imagenet-200"
+        self.output_path = Path(self.tmp_dir.name) / "output"
+        for c, category in enumerate(["n02", "n01"]):
+            images_path = self.dataset_path / "train" / category / "images"
+            images_path.mkdir(parents=True)
+            for i in range(5):
+                Image.new("RGB", (64, 64), color=(c * 100, i * 10, 0)).save(images_path / f"{category}_{i}.JPEG",
+                                                                             format="PNG")
+        with open(self.dataset_path / "train" / "n02" / "images" / "n02_10.JPEG", "w") as f:
+            f.write("Invalid content")
+
+    def tearDown(self):
+        """ Nettoyage après chaque test. """
+        self.tmp_dir.cleanup()
+
+    def test_list_dataset_images(self):
+        """ Vérifie l'ordre déterministe : classes triées, puis numéro d'image (tri naturel). """
+        items = list_dataset_images(self.dataset_path)
+        self.assertEqual(items[0], ("n01/images/n01_0.JPEG", "n01"))
+        self.assertEqual([p for p, _ in items[5:]], [f"n02/images/n02_{i}.JPEG" for i in (0, 1, 2, 3, 4, 10)])
+
+    def test_build_index(self):
+        """ Teste l'indexation complète : fichiers produits, image illisible ignorée. """
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, batch_size=2, workers=2,
+                            encoder=MeanColorEncoder(2))
+        embeddings, categories = np.load(paths["embeddings"]), np.load(paths["categories"])
+        self.assertEqual(embeddings.shape, (10, 3))
+        self.assertEqual(list(categories), ["n01"] * 5 + ["n02"] * 5)
+        self.assertAlmostEqual(float(embeddings[6][1]), 10.0, places=3)  # n02_1 : vert = 10
+
+    def test_resume_after_interruption(self):
+        """ Vérifie qu'une indexation interrompue reprend sans recalculer les shards terminés. """
+        with self.assertRaises(RuntimeError):
+            build_index(self.dataset_path, self.output_path, shard_size=4, batch_size=2,
+                        encoder=MeanColorEncoder(2, fail_after=5))
+        encoder = MeanColorEncoder(2)
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, batch_size=2, encoder=encoder)
+        self.assertEqual(encoder.encoded, 10 - 4)  # Seul le premier shard (4 images lisibles sur 10) était terminé
+        self.assertEqual(np.load(paths["embeddings"]).shape, (10, 3))
+
+    def test_build_index_with_cache(self):
+        """ Vérifie qu'une ré-indexation complète est servie par le cache. """
+        cache = DiskCache(Path(self.tmp_dir.name) / "cache")
+        build_index(self.dataset_path, self.output_path, shard_size=4, cache=cache, encoder=MeanColorEncoder(32))
+        encoder = MeanColorEncoder(32)
+        build_index(self.dataset_path, self.output_path, shard_size=4, cache=cache, restart=True, encoder=encoder)
+        self.assertEqual(encoder.encoded, 0)  # Tout est en cache ; l'image illisible n'est pas confiée au modèle
+
+    def test_update_index(self):
+        """ Teste la ré-indexation incrémentale : seules les images nouvelles ou modifiées sont encodées. """
+        build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32))
+        images_path = self.dataset_path / "train" / "n01" / "images"
+        Image.new("RGB", (64, 64), color=(0, 200, 0)).save(images_path / "n01_5.JPEG", format="PNG")  # Ajoutée
+        Image.new("RGB", (64, 64), color=(0, 0, 250)).save(images_path / "n01_1.JPEG", format="PNG")  # Modifiée
+        os.remove(images_path / "n01_3.JPEG")  # Supprimée
+        stat = os.stat(images_path / "n01_0.JPEG")
+        os.utime(images_path / "n01_0.JPEG", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))  # Touchée
+
+        embeddings_file = self.output_path / "Tiny_ImageNet_MobilNetV3_Embeddings.npy"
+        inode = os.stat(embeddings_file).st_ino
+        encoder = MeanColorEncoder(32)
+        counts = update_index(self.dataset_path, self.output_path, encoder=encoder)
+        self.assertEqual(counts, {"added": 1, "modified": 1, "removed": 1, "unchanged": 8})
+        self.assertEqual(os.stat(embeddings_file).st_ino, inode)  # Agrandi sur place, sans recopie
+        self.assertEqual(encoder.encoded, 2)  # Ajoutée et modifiée (l'image illisible, réessayée, n'est pas encodée)
+
+        output = {name: np.load(self.output_path / f"Tiny_ImageNet_MobilNetV3_{name}.npy")
+                  for name in ("Embeddings", "Categories", "Paths", "Deleted")}
+        self.assertEqual(output["Embeddings"].shape, (11, 3))
+        self.assertEqual(output["Paths"][10], "n01/images/n01_5.JPEG")
+        self.assertEqual(output["Categories"][10], "n01")
+        self.assertAlmostEqual(float(output["Embeddings"][1][2]), 250.0, places=3)  # n01_1 ré-encodée sur sa ligne
+        self.assertEqual(list(np.flatnonzero(output["Deleted"])), [3])
+
+        encoder = MeanColorEncoder(32)
+        counts = update_index(self.dataset_path, self.output_path, encoder=encoder)
+        self.assertEqual(counts, {"added": 0, "modified": 0, "removed": 0, "unchanged": 10})
+        self.assertEqual(encoder.encoded, 0)
+
+    def test_update_index_rewrite(self):
+        """ Vérifie que la collection est recopiée lorsqu'un chemin ajouté dépasse la largeur de la colonne. """
+        build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32))
+        paths_file = self.output_path / "Tiny_ImageNet_MobilNetV3_Paths.npy"
+        inode = os.stat(paths_file).st_ino
+        Image.new("RGB", (64, 64), color=(0, 200, 0)).save(self.dataset_path / "train" / "n01" / "images" /
+                                                           "n01_12345.JPEG", format="PNG")
+        update_index(self.dataset_path, self.output_path, encoder=MeanColorEncoder(32))
+        self.assertNotEqual(os.stat(paths_file).st_ino, inode)
+        image_paths = np.load(paths_file)
+        self.assertEqual(image_paths.dtype, np.dtype("<U25"))
+        self.assertEqual((len(image_paths), image_paths[10]), (11, "n01/images/n01_12345.JPEG"))
+        self.assertEqual(len(np.load(self.output_path / "Tiny_ImageNet_MobilNetV3_Embeddings.npy")), 11)
+
+    def test_update_index_file_removed_during_scan(self):
+        """ Vérifie qu'une image supprimée entre le listage du dataset et son examen est traitée comme disparue. """
+        build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32))
+
+        def list_then_remove(dataset_path):
+            items = list_dataset_images(dataset_path)
+            os.remove(self.dataset_path / "train" / "n01" / "images" / "n01_2.JPEG")
+            return items
+
+        with patch("src.index.list_dataset_images", list_then_remove):
+            counts = update_index(self.dataset_path, self.output_path, encoder=MeanColorEncoder(32))
+        self.assertEqual(counts, {"added": 0, "modified": 0, "removed": 1, "unchanged": 9})
+        self.assertEqual(list(np.flatnonzero(np.load(self.output_path / "Tiny_ImageNet_MobilNetV3_Deleted.npy"))), [2])
+
+    def test_update_index_replay(self):
+        """ Vérifie qu'une mise à jour interrompue avant l'écriture du manifeste est rejouée sans dupliquer les lignes
+        ajoutées, et que les suppressions non enregistrées sont réévaluées. """
+        build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32))
+        images_path = self.dataset_path / "train" / "n01" / "images"
+        Image.new("RGB", (64, 64), color=(0, 200, 0)).save(images_path / "n01_9.JPEG", format="PNG")
+        os.rename(images_path / "n01_3.JPEG", self.dataset_path / "n01_3.JPEG")
+        with patch("src.index.save_file_manifest", side_effect=OSError("Interruption simulée")):
+            with self.assertRaises(OSError):
+                update_index(self.dataset_path, self.output_path, encoder=MeanColorEncoder(32))
+        self.assertEqual(len(np.load(self.output_path / "Tiny_ImageNet_MobilNetV3_Deleted.npy")), 11)
+
+        os.rename(self.dataset_path / "n01_3.JPEG", images_path / "n01_3.JPEG")  # Revenue avant la reprise
+        counts = update_index(self.dataset_path, self.output_path, encoder=MeanColorEncoder(32))
+        self.assertEqual(counts, {"added": 1, "modified": 0, "removed": 0, "unchanged": 10})
+        image_paths = np.load(self.output_path / "Tiny_ImageNet_MobilNetV3_Paths.npy")
+        deleted = np.load(self.output_path / "Tiny_ImageNet_MobilNetV3_Deleted.npy")
+        self.assertEqual((len(image_paths), len(deleted)), (11, 11))
+        self.assertEqual(list(image_paths).count("n01/images/n01_9.JPEG"), 1)
+        self.assertFalse(deleted.any())
+        self.assertEqual(update_index(self.dataset_path, self.output_path, encoder=MeanColorEncoder(32))["unchanged"],
+                         11)
+
+    def test_build_index_float16(self):
+        """ Vérifie le stockage des embeddings en float16 et les colonnes de chaînes de taille fixe. """
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32),
+                            dtype="float16")
+        embeddings, image_paths = np.load(paths["embeddings"]), np.load(paths["paths"])
+        self.assertEqual(embeddings.dtype, np.float16)
+        self.assertEqual(image_paths.dtype, np.dtype("<U22"))  # Longueur de n02/images/n02_10.JPEG
+        self.assertEqual(image_paths[0], "n01/images/n01_0.JPEG")
+
+    def test_build_index_reduction(self):
+        """ Vérifie que la réduction de dimension est apprise sur la collection à la fin de l'indexation. """
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32),
+                            pca_dim=2, whiten=True)
+        expected = collection_paths(self.output_path, "Tiny_ImageNet_MobilNetV3")["reduction"]
+        self.assertEqual(paths["reduction"], expected)
+        transform = faiss.read_VectorTransform(str(paths["reduction"]))
+        self.assertEqual((transform.d_in, transform.d_out), (3, 2))
+
+        # Une indexation sans réduction ne laisse pas celle, périmée, de l'indexation précédente
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, restart=True,
+                            encoder=MeanColorEncoder(32))
+        self.assertNotIn("reduction", paths)
+        self.assertFalse(expected.exists())
+
+    def test_build_index_codes(self):
+        """ Vérifie que les codes binaires sont appris et enregistrés à la fin de l'indexation. """
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32),
+                            code_bits=16, code_method="sign")
+        self.assertEqual(paths["codes"], collection_paths(self.output_path, "Tiny_ImageNet_MobilNetV3")["codes"])
+        index = load_index(paths["codes"], np.load(paths["embeddings"]))
+        self.assertEqual((index.d, index.code_size), (3, 2))
+
+    def test_embedding_writer(self):
+        """ Teste l'écriture par tranches : fichiers remplacés à la fermeture seulement, collection complète exigée. """
+        paths = collection_paths(self.output_path.parent, "Test")
+        with EmbeddingWriter(paths, 3, 2, category_width=3, path_width=5) as writer:
+            self.assertEqual(writer.write(np.ones((2, 2)), ["a", "b"], ["p1", "p2"]), 0)
+            self.assertFalse(paths["embeddings"].exists())
+            self.assertEqual(writer.write(np.zeros((1, 2)), ["c"], ["p3"], [True]), 2)
+        self.assertEqual(np.load(paths["embeddings"]).tolist(), [[1, 1], [1, 1], [0, 0]])
+        self.assertEqual(np.load(paths["deleted"]).tolist(), [False, False, True])
+
+        writer = EmbeddingWriter(paths, 2, 2)
+        with self.assertRaises(ValueError):
+            writer.write(np.ones((3, 2)), ["a"] * 3, ["p"] * 3)
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertEqual(len(np.load(paths["categories"])), 3)  # Collection précédente intacte
+        with self.assertRaises(ValueError):
+            EmbeddingWriter(paths, 1, 2, dtype="int8")
+
+    def test_build_indexes_single_decode(self):
+        """ Vérifie l'indexation de deux modèles en une passe : images décodées une seule fois, lignes alignées. """
+        encoders = {"mobilenet": MeanColorEncoder(4), "clip": MeanColorEncoder(4)}
+        encoders["clip"].cache_config = {"model": "mean-color-2"}
+        collections = build_indexes(self.dataset_path, self.output_path, models=("mobilenet", "clip"), shard_size=4,
+                                    batch_size=4, encoders=encoders)
+        self.assertEqual(len(encoders["mobilenet"].images), 10)
+        self.assertEqual({id(image) for image in encoders["mobilenet"].images},
+                         {id(image) for image in encoders["clip"].images})  # Mêmes objets image décodés
+        paths = [np.load(collections[model]["paths"]) for model in ("mobilenet", "clip")]
+        self.assertEqual(len(paths[0]), 10)
+        self.assertEqual(paths[0].tolist(), paths[1].tolist())
+        self.assertTrue((self.output_path / ".index" / "clip" / "files.json").exists())  # Mise à jour possible
+
+    def test_build_indexes_partial_cache(self):
+        """ Vérifie que chaque modèle n'encode que ses images absentes du cache, sur des positions contiguës du lot. """
+        cache = DiskCache(Path(self.tmp_dir.name) / "cache")
+        build_index(self.dataset_path, self.output_path, shard_size=4, cache=cache, encoder=MeanColorEncoder(32))
+        encoders = {"mobilenet": MeanColorEncoder(32), "clip": MeanColorEncoder(32)}
+        encoders["clip"].cache_config = {"model": "mean-color-clip"}
+        build_indexes(self.dataset_path, self.output_path, models=("mobilenet", "clip"), shard_size=4, cache=cache,
+                      restart=True, encoders=encoders)
+        self.assertEqual(encoders["mobilenet"].batches, [])  # Tout en cache : aucune passe du modèle
+        self.assertEqual(encoders["clip"].batches, [4, 4, 2])  # Images lisibles seulement
+        embeddings = np.load(collection_paths(self.output_path, OUTPUT_PREFIXES["clip"])["embeddings"])
+        self.assertAlmostEqual(float(embeddings[6][1]), 10.0, places=3)  # n02_1 : vert = 10
+
+    def test_update_indexes_aligned(self):
+        """ Vérifie que des collections construites ensemble sont mises à jour ensemble, et restent alignées. """
+        encoders = {"mobilenet": MeanColorEncoder(32), "clip": MeanColorEncoder(32)}
+        build_indexes(self.dataset_path, self.output_path, models=("mobilenet", "clip"), shard_size=4,
+                      encoders=encoders)
+        images_path = self.dataset_path / "train" / "n01" / "images"
+        Image.new("RGB", (64, 64), color=(0, 200, 0)).save(images_path / "n01_5.JPEG", format="PNG")  # Ajoutée
+        os.remove(images_path / "n01_3.JPEG")  # Supprimée
+        with self.assertRaises(ValueError):  # La collection CLIP ne serait plus alignée
+            update_index(self.dataset_path, self.output_path, model="mobilenet", encoder=MeanColorEncoder(32))
+
+        encoders = {"mobilenet": MeanColorEncoder(32), "clip": MeanColorEncoder(32)}
+        counts = update_indexes(self.dataset_path, self.output_path, encoders=encoders)
+        self.assertEqual(counts, {"added": 1, "modified": 0, "removed": 1, "unchanged": 9})
+        self.assertEqual(len(encoders["mobilenet"].images), 1)  # Seule l'image ajoutée est décodée
+        self.assertEqual({id(image) for image in encoders["mobilenet"].images},
+                         {id(image) for image in encoders["clip"].images})
+        for model in ("mobilenet", "clip"):
+            paths = collection_paths(self.output_path, OUTPUT_PREFIXES[model])
+            self.assertEqual(np.load(paths["paths"])[10], "n01/images/n01_5.JPEG")
+            self.assertEqual(list(np.flatnonzero(np.load(paths["deleted"]))), [3])
+
+    def test_update_indexes_interrupted(self):
+        """ Vérifie qu'une mise à jour interrompue entre deux collections alignées est rejouée, et qu'elles restent
+        alignées. """
+        encoders = {"mobilenet": MeanColorEncoder(32), "clip": MeanColorEncoder(32)}
+        build_indexes(self.dataset_path, self.output_path, models=("mobilenet", "clip"), shard_size=4,
+                      encoders=encoders)
+        Image.new("RGB", (64, 64), color=(0, 200, 0)).save(self.dataset_path / "train" / "n01" / "images" /
+                                                           "n01_5.JPEG", format="PNG")
+        encoders = {"mobilenet": MeanColorEncoder(32), "clip": MeanColorEncoder(32)}
+        # Interruption après l'ajout des lignes de la première collection seulement
+        with patch("src.index.binary_codes.update_codes", side_effect=RuntimeError("Interruption simulée")):
+            with self.assertRaises(RuntimeError):
+                update_indexes(self.dataset_path, self.output_path, encoders=encoders)
+
+        encoders = {"mobilenet": MeanColorEncoder(32), "clip": MeanColorEncoder(32)}
+        counts = update_indexes(self.dataset_path, self.output_path, encoders=encoders)
+        self.assertEqual(counts, {"added": 1, "modified": 0, "removed": 0, "unchanged": 10})
+        for model in ("mobilenet", "clip"):
+            paths = collection_paths(self.output_path, OUTPUT_PREFIXES[model])
+            self.assertEqual(len(np.load(paths["deleted"])), 11)
+            self.assertEqual(list(np.load(paths["paths"])).count("n01/images/n01_5.JPEG"), 1)
+
+    def test_thumbnail_atlas(self):
+        """ Teste l'atlas de vignettes : aligné sur les lignes à la construction comme à la mise à jour. """
+        paths = build_index(self.dataset_path, self.output_path, shard_size=4, encoder=MeanColorEncoder(32),
+                            thumbnail_size=(16, 16))
+        atlas = np.load(paths["thumbnails"], mmap_mode="r")
+        self.assertEqual(atlas.shape, (10, 16, 16, 3))
+        self.assertEqual(atlas.dtype, np.uint8)
+        self.assertEqual(tuple(atlas[6][0, 0]), (0, 10, 0))  # n02_1
+
+        images_path = self.dataset_path / "train" / "n01" / "images"
+        Image.new("RGB", (32, 32), color=(0, 200, 0)).save(images_path / "n01_5.JPEG", format="PNG")  # Ajoutée
+        Image.new("RGB", (64, 64), color=(0, 0, 250)).save(images_path / "n01_1.JPEG", format="PNG")  # Modifiée
+        update_index(self.dataset_path, self.output_path, encoder=MeanColorEncoder(32))
+        atlas = np.load(paths["thumbnails"], mmap_mode="r")
+        self.assertEqual(atlas.shape, (11, 16, 16, 3))
+        self.assertEqual(tuple(atlas[1][0, 0]), (0, 0, 250))
+        self.assertEqual(tuple(atlas[10][0, 0]), (0, 200, 0))
+
+        build_index(self.dataset_path, self.output_path, shard_size=4, restart=True, encoder=MeanColorEncoder(32))
+        self.assertFalse(paths["thumbnails"].exists())  # Un atlas qui ne serait plus aligné est supprimé
@@ -0,0 +1,77 @@
+""" Module de test unitaire pour l'ingestion d'Open Images du fichier ingest.py. """
+
+import unittest, json, tempfile, threading, functools, numpy as np
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+from PIL import Image
+from src.ingest import LocalBlobSource, HttpBlobSource, ingest, load_keys
+from src.cache import DiskCache
+from helpers import MeanColorEncoder
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class TestIngest(unittest.TestCase):
+    def setUp(self):
+        """ Crée un mini bucket local : 5 images, plus un fichier illisible. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.bucket_path = Path(self.tmp_dir.name) / "bucket"
+        self.output_path = Path(self.tmp_dir.name) / "output"
+        (self.bucket_path / "sub").mkdir(parents=True)
+        for i in range(5):
+            Image.new("RGB", (64, 64), color=(i * 10, 0, 0)).save(self.bucket_path / f"img_{i}.jpg", format="PNG")
+        (self.bucket_path / "sub" / "broken.jpg").write_bytes(b"Invalid content")
+
+    def tearDown(self):
+        """ Nettoyage après chaque test. """
+        self.tmp_dir.cleanup()
+
+    def test_ingest_local_source(self):
+        """ Teste l'ingestion d'un dossier : embeddings alignés entre modèles, image illisible ignorée. """
+        source = LocalBlobSource(self.bucket_path)
+        self.assertEqual(source.keys()[0], "img_0.jpg")
+        self.assertEqual(source.keys()[-1], "sub/broken.jpg")
+
+        encoders = {"mobilenet": MeanColorEncoder(2), "clip": MeanColorEncoder(2)}
+        paths = ingest(source, self.output_path, batch_size=2, workers=3, encoders=encoders)
+        embeddings = np.load(paths["mobilenet"])
+        self.assertEqual(embeddings.shape, (5, 3))
+        self.assertEqual(np.load(paths["clip"]).shape, (5, 3))
+        self.assertAlmostEqual(float(embeddings[3][0]), 30.0, places=3)
+        with open(paths["image_urls"]) as f:
+            image_urls = json.load(f)
+        self.assertEqual(image_urls, {str(i): f"img_{i}.jpg" for i in range(5)})
+        self.assertEqual(load_keys(paths["image_urls"]), [f"img_{i}.jpg" for i in range(5)])
+
+    def test_ingest_with_cache(self):
+        """ Vérifie qu'une ingestion répétée est servie par le cache. """
+        cache = DiskCache(Path(self.tmp_dir.name) / "cache")
+        ingest(LocalBlobSource(self.bucket_path), self.output_path, models=("mobilenet",), cache=cache,
+               encoders={"mobilenet": MeanColorEncoder(32)})
+        encoder = MeanColorEncoder(32)
+        ingest(LocalBlobSource(self.bucket_path), self.output_path, models=("mobilenet",), cache=cache,
+               encoders={"mobilenet": encoder})
+        self.assertEqual(encoder.encoded, 0)
+
+    def test_ingest_http_source(self):
+        """ Teste l'ingestion depuis un serveur HTTP local tenant lieu de bucket, clé absente comprise. """
+        handler = functools.partial(QuietHandler, directory=str(self.bucket_path))
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            keys = ["img_4.jpg", "missing.jpg", "img_0.jpg"]
+            source = HttpBlobSource(f"http://127.0.0.1:{server.server_port}", keys, pool_size=4)
+            paths = ingest(source, self.output_path, models=("mobilenet",), batch_size=2, workers=4,
+                           encoders={"mobilenet": MeanColorEncoder(2)})
+        finally:
+            server.shutdown()
+            server.server_close()
+        embeddings = np.load(paths["mobilenet"])
+        self.assertEqual(embeddings.shape, (2, 3))
+        self.assertAlmostEqual(float(embeddings[0][0]), 40.0, places=3)
+        with open(paths["image_urls"]) as f:
+            self.assertEqual(json.load(f), {"0": "img_4.jpg", "1": "img_0.jpg"})
+
@@ -0,0 +1,88 @@
+""" Module de test unitaire pour les mesures des étapes du fichier metrics.py. """
+
+import unittest, json, threading, time, requests
+from http.server import ThreadingHTTPServer
+from src import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        """ Active les mesures, sur des métriques vides. """
+        metrics.enable()
+        metrics.registry.reset()
+
+    def tearDown(self):
+        """ Désactive les mesures. """
+        metrics.disable()
+        metrics.registry.reset()
+
+    def test_disabled(self):
+        """ Vérifie que, désactivées, les mesures ne créent aucun objet et n'enregistrent rien. """
+        metrics.disable()
+        self.assertIs(metrics.span("forward"), metrics.NULL_CONTEXT)
+        with metrics.request("cbir") as trace, metrics.span("forward"):
+            metrics.count("pixmatcher_cache_total", cache="features", result="hit")
+            metrics.observe_size("pixmatcher_batch_size", 4)
+        self.assertIsNone(trace)
+        self.assertEqual(metrics.registry.render(), "\n")
+
+    def test_request_trace(self):
+        """ Vérifie que les étapes d'une requête sont cumulées dans sa trace, journalisée en JSON, et que les erreurs
+        sont comptées par étape. """
+        metrics.enable(requests_log=True)
+        with self.assertLogs(level="INFO") as logs:
+            with metrics.request("cbir") as trace:
+                with metrics.span("preprocess"):
+                    time.sleep(0.01)
+                for _ in range(2):
+                    with metrics.span("faiss_search"):
+                        pass
+                with self.assertRaises(ValueError), metrics.span("path_resolution"):
+                    raise ValueError("index inconnu")
+        self.assertEqual(set(trace["stages_ms"]), {"preprocess", "faiss_search", "path_resolution"})
+        self.assertGreaterEqual(trace["stages_ms"]["preprocess"], 10)
+        self.assertGreaterEqual(trace["total_ms"], trace["stages_ms"]["preprocess"])
+        self.assertEqual(json.loads(logs.records[0].getMessage())["request"], "cbir")
+
+        histograms = metrics.registry.histograms
+        self.assertEqual(histograms[("pixmatcher_stage_seconds", (("stage", "faiss_search"),))].count, 2)
+        self.assertEqual(metrics.registry.counters[("pixmatcher_errors_total", (("stage", "path_resolution"),))], 1)
+        self.assertEqual(metrics.registry.counters[("pixmatcher_requests_total", (("request", "cbir"),))], 1)
+
+    def test_streamlit_rerun(self):
+        """ Vérifie qu'une page interrompue par st.rerun (exception RerunException) n'est pas comptée en erreur. """
+        class RerunException(Exception):
+            pass
+
+        with self.assertRaises(RerunException), metrics.request("cbir") as trace, metrics.span("pagination"):
+            raise RerunException()
+        self.assertNotIn("error", trace)
+        self.assertNotIn("pixmatcher_errors_total", {name for name, _ in metrics.registry.counters})
+        self.assertEqual(metrics.registry.counters[("pixmatcher_requests_total", (("request", "cbir"),))], 1)
+
+    def test_render(self):
+        """ Vérifie l'export au format texte de Prometheus (compteurs, histogrammes cumulatifs) et la route /metrics. """
+        metrics.count("pixmatcher_cache_total", 3, cache="features", result="hit")
+        for size in (1, 8, 300):
+            metrics.observe_size("pixmatcher_batch_size", size, stage="forward")
+
+        lines = metrics.registry.render().splitlines()
+        self.assertIn("# TYPE pixmatcher_cache_total counter", lines)
+        self.assertIn('pixmatcher_cache_total{cache="features",result="hit"} 3', lines)
+        self.assertIn("# TYPE pixmatcher_batch_size histogram", lines)
+        self.assertIn('pixmatcher_batch_size_bucket{stage="forward",le="1"} 1', lines)
+        self.assertIn('pixmatcher_batch_size_bucket{stage="forward",le="8"} 2', lines)
+        self.assertIn('pixmatcher_batch_size_bucket{stage="forward",le="+Inf"} 3', lines)
+        self.assertIn('pixmatcher_batch_size_sum{stage="forward"} 309.0', lines)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), metrics.MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            response = requests.get(f"http://127.0.0.1:{server.server_port}/metrics")
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+            self.assertIn('pixmatcher_cache_total{cache="features",result="hit"} 3', response.text)
+            self.assertEqual(requests.get(f"http://127.0.0.1:{server.server_port}/").status_code, 404)
+        finally:
+            server.shutdown()
+            server.server_close()
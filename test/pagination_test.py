@@ -0,0 +1,95 @@
+""" Module de test unitaire pour la pagination des résultats de recherche du fichier pagination.py. """
+
+import unittest
+from src.pagination import CursorCache, ResultCursor, open_cursor
+
+
+class CountingSearch:
+    """ Recherche de test sur une collection de taille fixe, qui compte ses appels. """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.calls = []
+
+    def __call__(self, k: int) -> list:
+        self.calls.append(k)
+        return [(i, float(i)) for i in range(min(k, self.size))]
+
+
+class FakeClock:
+    """ Horloge de test, avancée manuellement. """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestPagination(unittest.TestCase):
+    def test_pages_from_candidates(self):
+        """ Vérifie que les pages préchargées sont servies sans nouvelle recherche, puis que la recherche est élargie
+        (en doublant) une fois les candidats épuisés. """
+        search = CountingSearch(1000)
+        cursor = ResultCursor(search, page_size=12, prefetch_pages=5)
+        self.assertEqual(search.calls, [60])
+
+        for number in range(5):
+            self.assertEqual([i for i, _ in cursor.page(number)], list(range(number * 12, (number + 1) * 12)))
+        self.assertEqual(search.calls, [60])
+
+        self.assertEqual([i for i, _ in cursor.page(5)], list(range(60, 72)))
+        self.assertEqual(search.calls, [60, 120])
+        self.assertEqual(cursor.searches, 2)
+
+    def test_exhausted(self):
+        """ Vérifie la fin des résultats sur une petite collection : dernière page partielle, pas de recherche
+        supplémentaire. """
+        search = CountingSearch(30)
+        cursor = ResultCursor(search, page_size=12, prefetch_pages=5)
+        self.assertTrue(cursor.exhausted)
+        self.assertEqual(len(cursor.page(2)), 6)
+        self.assertEqual(cursor.page(3), [])
+        self.assertTrue(cursor.has_more(1))
+        self.assertFalse(cursor.has_more(2))
+        self.assertEqual(search.calls, [60])
+
+    def test_cache_ttl(self):
+        """ Vérifie l'expiration glissante des curseurs et le plafond du cache. """
+        clock = FakeClock()
+        cache = CursorCache(ttl=10, max_cursors=2, clock=clock)
+        first = cache.add(ResultCursor(CountingSearch(10), 5))
+        clock.now = 8
+        self.assertIsNotNone(cache.get(first))  # Repousse l'expiration à 18
+        clock.now = 15
+        self.assertIsNotNone(cache.get(first))
+        clock.now = 30
+        self.assertIsNone(cache.get(first))
+        self.assertEqual(len(cache), 0)
+
+        tokens = [cache.add(ResultCursor(CountingSearch(10), 5)) for _ in range(3)]
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(tokens[0]))
+
+    def test_open_cursor(self):
+        """ Vérifie que la requête n'est encodée qu'une fois par session tant qu'elle ne change pas. """
+        cache = CursorCache()
+        state = {}
+        encoded = []
+
+        def make_search(query):
+            def make():
+                encoded.append(query)
+                return CountingSearch(100)
+            return make
+
+        cursor = open_cursor(state, "cursor", "chat", make_search("chat"), 10, cache)
+        state["cursor"]["pages"] += 1
+        self.assertIs(open_cursor(state, "cursor", "chat", make_search("chat"), 10, cache), cursor)
+        self.assertEqual(state["cursor"]["pages"], 2)
+        self.assertEqual(encoded, ["chat"])
+
+        other = open_cursor(state, "cursor", "chien", make_search("chien"), 10, cache)
+        self.assertIsNot(other, cursor)
+        self.assertEqual(state["cursor"]["pages"], 1)
+        self.assertEqual(encoded, ["chat", "chien"])
@@ -0,0 +1,107 @@
+""" Module de test unitaire pour le service de recherche multiprocessus du fichier prefork.py. """
+
+import unittest, os, signal, socket, time, requests, numpy as np
+from unittest.mock import patch
+from src import metrics
+from src.prefork import PreforkServer
+from src.service import SearchClient, memory_usage
+
+
+class SharedIndexBackend:
+    """ Backend de test : une « collection » de 256 Mo chargée par le parent, lue par les processus fils. """
+
+    def __init__(self):
+        self.collection = np.ones((64 * 1024 ** 2,), dtype=np.float32)
+
+    def prepare(self, payload):
+        return payload
+
+    def run_batch(self, queries: list) -> list:
+        total = float(self.collection.sum())  # Lecture de toute la collection : les pages restent partagées
+        return [[{"id": os.getpid(), "distance": total}] for _ in queries]
+
+
+@unittest.skipUnless(hasattr(os, "fork") and memory_usage(), "fork et /proc/<pid>/smaps_rollup requis")
+class TestPrefork(unittest.TestCase):
+    def setUp(self):
+        """ Démarre 2 processus de service partageant la collection du parent. """
+        self.prefork = PreforkServer(("127.0.0.1", 0), {"text": SharedIndexBackend()}, processes=2)
+        self.prefork.start()
+        self.base_url = f"http://127.0.0.1:{self.prefork.server_port}"
+
+    def tearDown(self):
+        """ Arrête les processus fils. """
+        self.prefork.stop()
+
+    def test_shared_memory(self):
+        """ Vérifie que les deux processus servent des requêtes sur le même socket, et que la collection n'est pas
+        copiée dans leur mémoire propre (USS). """
+        served = set()
+        deadline = time.monotonic() + 20
+        while len(served) < 2 and time.monotonic() < deadline:
+            results = SearchClient(self.base_url).search_text("chat", "open-images", k=1)  # Nouvelle connexion
+            self.assertEqual(results[0]["distance"], 64 * 1024 ** 2)
+            served.add(results[0]["id"])
+        self.assertEqual(served, set(self.prefork.pids))
+
+        health = requests.get(f"{self.base_url}/health").json()
+        self.assertIn(health["pid"], self.prefork.pids)
+        for pid, memory in self.prefork.memory_report().items():
+            self.assertGreater(memory["rss"], 256 * 1024 ** 2)  # La collection est bien présente...
+            self.assertLess(memory["uss"], 64 * 1024 ** 2)  # ... mais partagée avec le parent
+
+    def test_child_failure(self):
+        """ Vérifie qu'un fils qui échoue au démarrage s'arrête avec un code non nul, et que son remplacement est
+        différé de plus en plus longtemps. """
+        with patch.object(PreforkServer, "serve_child", side_effect=RuntimeError("échec au démarrage")):
+            pid = self.prefork.fork_child()
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 1)
+        self.assertEqual(self.prefork.restart_delay(pid), 1)
+
+        pid = self.prefork.fork_child()
+        self.assertEqual(self.prefork.restart_delay(pid), 2)
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+
+    def test_cuda_refused(self):
+        """ Vérifie que les fils ne sont pas créés si CUDA est initialisé dans le parent. """
+        prefork = PreforkServer(("127.0.0.1", 0), {"text": SharedIndexBackend()}, processes=2)
+        try:
+            with patch("torch.cuda.is_initialized", return_value=True), self.assertRaises(RuntimeError):
+                prefork.start()
+            self.assertEqual(prefork.pids, [])
+        finally:
+            prefork.stop()
+
+    def test_metrics_per_process(self):
+        """ Vérifie que chaque fils exporte ses propres mesures sur son port, et que le socket partagé ne les sert
+        pas. """
+        with socket.socket() as probe:  # Port libre pour le premier fils (le suivant est supposé libre aussi)
+            probe.bind(("127.0.0.1", 0))
+            metrics_port = probe.getsockname()[1]
+        metrics.enable()
+        prefork = PreforkServer(("127.0.0.1", 0), {"text": SharedIndexBackend()}, processes=2,
+                                metrics_port=metrics_port)
+        try:
+            prefork.start()
+            base_url = f"http://127.0.0.1:{prefork.server_port}"
+            for _ in range(6):
+                SearchClient(base_url).search_text("chat", "open-images", k=1)
+            self.assertEqual(requests.get(f"{base_url}/metrics").status_code, 404)
+            total = 0
+            for slot in range(2):
+                deadline = time.monotonic() + 10
+                while True:  # Le serveur d'export du fils démarre après le fork
+                    try:
+                        text = requests.get(f"http://127.0.0.1:{metrics_port + slot}/metrics").text
+                        break
+                    except requests.ConnectionError:
+                        self.assertLess(time.monotonic(), deadline)
+                        time.sleep(0.1)
+                total += sum(int(line.split()[-1]) for line in text.splitlines()
+                             if line.startswith('pixmatcher_requests_total{request="service-text"}'))
+            self.assertEqual(total, 6)
+        finally:
+            metrics.disable()
+            prefork.stop()
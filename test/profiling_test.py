@@ -0,0 +1,96 @@
+""" Module de test unitaire pour le profilage d'une requête du fichier profiling.py. """
+
+import unittest, json, tempfile, threading, faiss, numpy as np, requests, torch
+from pathlib import Path
+from src import profiling
+from src.service import SearchServer
+
+
+class TinyModelBackend:
+    """ Backend de test : un petit réseau PyTorch et un index FAISS, appelés via les hooks de profilage. """
+
+    def __init__(self):
+        self.model = torch.nn.Sequential(torch.nn.Linear(4, 8), torch.nn.ReLU())
+        self.index = faiss.IndexFlatL2(8)
+        self.index.add(np.random.default_rng(0).random((100, 8), dtype=np.float32))
+
+    def prepare(self, payload):
+        return torch.tensor([float(len(payload))] * 4)
+
+    def run_batch(self, queries: list) -> list:
+        with profiling.model_profile("tiny"), torch.no_grad():
+            vectors = self.model(torch.stack([tensor for tensor, _, _ in queries])).numpy()
+        with profiling.search_profile("tiny_search", self.index):
+            _, indices = self.index.search(vectors, max(k for _, _, k in queries))
+        return [[{"id": int(idx)} for idx in row[:k]] for row, (_, _, k) in zip(indices, queries)]
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        """ Crée le dossier temporaire des profils. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+
+    def tearDown(self):
+        """ Nettoie les fichiers temporaires. """
+        self.tmp_dir.cleanup()
+
+    def test_disabled(self):
+        """ Vérifie que, hors d'une requête profilée, les hooks sont sans effet et qu'aucun fichier n'est écrit. """
+        self.assertIs(profiling.profile("cbir", directory=self.path), profiling.NULL_CONTEXT)
+        TinyModelBackend().run_batch([(torch.zeros(4), "tiny-imagenet", 3)])
+        self.assertEqual(list(self.path.iterdir()), [])
+
+    def test_profile(self):
+        """ Vérifie les fichiers d'un profil (chemin Python, trace du modèle, résumé des recherches), et qu'un seul
+        profil est actif à la fois. """
+        backend = TinyModelBackend()
+        with profiling.profile("Search via Image", enabled=True, directory=self.path) as query_profile:
+            self.assertIs(profiling.profile("autre", enabled=True, directory=self.path), profiling.NULL_CONTEXT)
+            backend.run_batch([(torch.zeros(4), "tiny-imagenet", 3)])
+
+        self.assertTrue(query_profile.path.name.endswith("-search-via-image"))
+        files = {path.name for path in query_profile.path.iterdir()}
+        self.assertTrue({"python.html"} <= files or {"python.prof", "python.txt"} <= files)
+        self.assertTrue({"torch-0-tiny.json", "torch-0-tiny.txt", "summary.json"} <= files)
+        with open(query_profile.path / "torch-0-tiny.json") as f:
+            self.assertIn("traceEvents", json.load(f))
+        with open(query_profile.path / "summary.json") as f:
+            summary = json.load(f)
+        self.assertEqual(summary["models"][0]["name"], "tiny")
+        self.assertEqual(summary["searches"][0]["index"], "IndexFlatL2")
+        self.assertEqual(summary["searches"][0]["ntotal"], 100)
+
+        # Le verrou est libéré : un nouveau profil peut commencer
+        with profiling.profile("suivant", enabled=True, directory=self.path) as next_profile:
+            pass
+        self.assertIsNotNone(next_profile)
+
+    def test_enter_failure(self):
+        """ Vérifie que le verrou est libéré si le profil ne peut pas commencer (dossier impossible à créer). """
+        (self.path / "fichier").write_text("")
+        with self.assertRaises(OSError):
+            with profiling.profile("cbir", enabled=True, directory=self.path / "fichier"):
+                pass
+        self.assertIsInstance(profiling.profile("cbir", enabled=True, directory=self.path), profiling.QueryProfile)
+        profiling.profile_lock.release()
+
+    def test_service_flag(self):
+        """ Vérifie que le paramètre profile=1 du service profile la requête et renvoie le dossier du profil. """
+        server = SearchServer(("127.0.0.1", 0), {"text": TinyModelBackend()})
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        profile_dir = profiling.PROFILE_DIR
+        profiling.PROFILE_DIR = self.path
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/search/text"
+            response = requests.post(url, json={"query": "chat", "k": 2, "profile": True}).json()
+            self.assertEqual(len(response["results"]), 2)
+            files = {path.name for path in Path(response["profile"]).iterdir()}
+            # Requête traitée par le thread du micro-batcher, dans le contexte du profil
+            self.assertTrue({"summary.json", "torch-0-tiny.json"} <= files)
+            self.assertTrue({"python-batcher-text.html"} <= files or {"python-batcher-text.prof"} <= files)
+            self.assertNotIn("profile", requests.post(url, json={"query": "chat", "k": 2}).json())
+        finally:
+            profiling.PROFILE_DIR = profile_dir
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,72 @@
+""" Module de test unitaire pour la projection 2D des collections du fichier projection.py. """
+
+import unittest, tempfile, numpy as np
+from pathlib import Path
+from src.projection import load_projection, project, save_projection, stratified_sample
+
+
+class TestProjection(unittest.TestCase):
+    def setUp(self):
+        """ Crée une collection de 3 groupes bien séparés de 200 points (dimension 32), dont quelques lignes supprimées. """
+        rng = np.random.default_rng(0)
+        centers = rng.normal(scale=20, size=(3, 32))
+        self.categories = np.repeat(np.array(["n01", "n02", "n03"]), 200)
+        self.embeddings = (centers[np.repeat(np.arange(3), 200)] + rng.normal(size=(600, 32))).astype(np.float16)
+        self.deleted = np.zeros(600, dtype=bool)
+        self.deleted[[5, 250, 599]] = True
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """ Nettoie les fichiers temporaires. """
+        self.tmp_dir.cleanup()
+
+    def test_stratified_sample(self):
+        """ Vérifie que l'échantillon respecte les proportions des catégories et contient les petites catégories. """
+        categories = np.array(["a"] * 900 + ["b"] * 95 + ["c"] * 5)
+        sample = stratified_sample(np.arange(1000), categories, 100, np.random.default_rng(0))
+        labels, counts = np.unique(categories[sample], return_counts=True)
+        self.assertEqual(labels.tolist(), ["a", "b", "c"])
+        self.assertEqual(counts.tolist(), [90, 10, 1])
+        self.assertEqual(sample.tolist(), sorted(set(sample.tolist())))
+
+    def test_project(self):
+        """ Vérifie que seules les lignes non supprimées sont projetées et que les points hors échantillon sont placés
+        au milieu de leur groupe. """
+        rows, coordinates = project(self.embeddings, self.categories, self.deleted, sample_size=150)
+        self.assertEqual(rows.tolist(), np.flatnonzero(~self.deleted).tolist())
+        self.assertEqual(coordinates.shape, (597, 2))
+        self.assertEqual(coordinates.dtype, np.float32)
+
+        # Chaque point est plus proche du centre de son groupe que de celui des autres groupes
+        labels = self.categories[rows]
+        centroids = np.stack([coordinates[labels == label].mean(axis=0) for label in ["n01", "n02", "n03"]])
+        nearest = np.linalg.norm(coordinates[:, None] - centroids[None], axis=2).argmin(axis=1)
+        self.assertTrue((nearest == np.searchsorted(["n01", "n02", "n03"], labels)).all())
+
+        # Résultat reproductible
+        self.assertTrue(np.array_equal(project(self.embeddings, self.categories, self.deleted, sample_size=150)[1],
+                                       coordinates))
+
+    def test_save_load(self):
+        """ Vérifie que la projection écrite est mélangée, alignée sur les catégories, et que le niveau de détail
+        retourne un préfixe. """
+        rows, coordinates = project(self.embeddings, self.categories, self.deleted, sample_size=150)
+        path = Path(self.tmp_dir.name) / "projection.npz"
+        save_projection(path, rows, coordinates, self.categories)
+
+        projection = load_projection(path)
+        self.assertEqual(projection["total"], 597)
+        self.assertNotEqual(projection["rows"].tolist(), rows.tolist())
+        self.assertEqual(sorted(projection["rows"].tolist()), rows.tolist())
+        self.assertEqual(projection["categories"].tolist(), self.categories[projection["rows"]].tolist())
+        position = {row: i for i, row in enumerate(rows.tolist())}
+        self.assertTrue(np.array_equal(projection["coordinates"],
+                                       coordinates[[position[row] for row in projection["rows"].tolist()]]))
+
+        preview = load_projection(path, max_points=100)
+        self.assertEqual(preview["total"], 597)
+        self.assertEqual(preview["rows"].tolist(), projection["rows"][:100].tolist())
+
+        # Collection sans catégories (Open Images)
+        save_projection(path, rows, coordinates)
+        self.assertIsNone(load_projection(path)["categories"])
@@ -0,0 +1,70 @@
+""" Module de test unitaire pour la réduction de dimension des embeddings du fichier reduction.py. """
+
+import unittest, tempfile, faiss, numpy as np
+from pathlib import Path
+from src.reduction import add_embeddings, fit_collection, make_index, save_transform, train_transform
+
+
+class TestReduction(unittest.TestCase):
+    def setUp(self):
+        """ Crée une collection de 500 vecteurs de dimension 64, dont la variance tient dans 8 directions. """
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp_dir.name)
+        rng = np.random.default_rng(0)
+        latent = rng.normal(scale=np.arange(8, 0, -1), size=(500, 8))
+        self.vectors = (latent @ rng.normal(size=(8, 64)) + rng.normal(scale=0.01, size=(500, 64))).astype(np.float32)
+
+    def tearDown(self):
+        """ Nettoie les fichiers temporaires. """
+        self.tmp_dir.cleanup()
+
+    def test_train_transform(self):
+        """ Vérifie la dimension produite, le blanchiment (même variance pour toutes les composantes) et les dimensions
+        invalides. """
+        transform = train_transform(self.vectors, dim=8)
+        self.assertEqual((transform.d_in, transform.d_out), (64, 8))
+        reduced = train_transform(self.vectors, dim=8, whiten=True).apply(self.vectors)
+        variances = reduced.var(axis=0)
+        np.testing.assert_allclose(variances / variances.mean(), np.ones(8), rtol=0.05)
+        with self.assertRaises(ValueError):
+            train_transform(self.vectors, dim=65)
+        with self.assertRaises(ValueError):
+            train_transform(self.vectors[:4], dim=8)
+
+    def test_make_index(self):
+        """ Vérifie que l'index réduit stocke des vecteurs de la dimension cible, réduit lui-même les requêtes et
+        retrouve les mêmes voisins que la recherche exacte lorsque la variance est conservée. """
+        self.assertIsInstance(make_index(64, self.path / "absent.faiss"), faiss.IndexFlatL2)
+
+        deleted = np.zeros(500, dtype=bool)
+        deleted[::2] = True
+        np.save(self.path / "embeddings.npy", self.vectors)
+        np.save(self.path / "deleted.npy", deleted)
+        transform_file = fit_collection(self.path / "embeddings.npy", self.path / "pca.faiss", 8,
+                                        deleted_path=self.path / "deleted.npy")
+        index = make_index(64, transform_file)
+        self.assertEqual(index.d, 64)
+        index.add(self.vectors)
+        self.assertEqual(faiss.downcast_index(index.index).code_size, 8 * 4)
+
+        exact = faiss.IndexFlatL2(64)
+        exact.add(self.vectors)
+        _, expected = exact.search(self.vectors[:20], 5)
+        _, indices = index.search(self.vectors[:20], 5)
+        np.testing.assert_array_equal(indices, expected)
+
+        # Ajout par blocs, depuis des embeddings projetés en mémoire et stockés en float16 : même index
+        np.save(self.path / "embeddings16.npy", self.vectors.astype(np.float16))
+        blocks = make_index(64, transform_file)
+        add_embeddings(blocks, np.load(self.path / "embeddings16.npy", mmap_mode="r"), block_rows=64)
+        self.assertEqual(blocks.ntotal, 500)
+        _, indices = blocks.search(self.vectors[:20], 1)
+        np.testing.assert_array_equal(indices[:, 0], expected[:, 0])
+        ids = faiss.IndexIDMap(make_index(64, transform_file))
+        add_embeddings(ids, self.vectors, np.flatnonzero(~deleted), block_rows=64)
+        _, indices = ids.search(self.vectors[1:20:2], 1)
+        np.testing.assert_array_equal(indices[:, 0], np.arange(1, 20, 2))
+
+        save_transform(train_transform(self.vectors[:, :32], dim=8), self.path / "other.faiss")
+        with self.assertRaises(ValueError):
+            make_index(64, self.path / "other.faiss")
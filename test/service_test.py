@@ -0,0 +1,164 @@
+""" Module de test unitaire pour le service HTTP de recherche du fichier service.py. """
+
+import unittest, contextvars, http.client, threading, time, requests, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+from src import metrics
+from src.service import MicroBatcher, SearchClient, SearchServer, search_by_dataset
+
+
+class FakeBackend:
+    """ Backend de test : chaque lot coûte un temps fixe (comme une passe du modèle), quelle que soit sa taille. """
+
+    batch_cost = 0.1
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def prepare(self, payload):
+        if not payload:
+            raise ValueError("Requête vide")
+        return payload.decode() if isinstance(payload, bytes) else payload
+
+    def run_batch(self, queries: list) -> list:
+        time.sleep(self.batch_cost)
+        self.batch_sizes.append(len(queries))
+        vectors = np.array([[len(text)] for text, _, _ in queries], dtype=np.float32)
+        return search_by_dataset(queries, vectors, lambda dataset, group, k: [
+            [{"id": int(vector[0]) + rank, "distance": float(rank), "path": f"{dataset}/{int(vector[0]) + rank}"}
+             for rank in range(k)] for vector in group])
+
+
+class TestService(unittest.TestCase):
+    def setUp(self):
+        """ Démarre le service sur un port libre, avec des backends de test. """
+        self.backends = {"image": FakeBackend(), "text": FakeBackend()}
+        self.server = SearchServer(("127.0.0.1", 0), self.backends, max_batch_size=32, max_wait=0.02)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.client = SearchClient(self.base_url)
+
+    def tearDown(self):
+        """ Arrête le service. """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_micro_batcher(self):
+        """ Vérifie que des requêtes concurrentes sont regroupées en lots et que chacune reçoit son propre résultat. """
+        sizes = []
+
+        def process(items):
+            time.sleep(0.05)
+            sizes.append(len(items))
+            return [item * 2 if item != 3 else ValueError("erreur") for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.02)
+        futures = [batcher.submit(i) for i in range(20)]
+        self.assertEqual([future.result() for i, future in enumerate(futures) if i != 3],
+                         [i * 2 for i in range(20) if i != 3])
+        self.assertIsInstance(futures[3].exception(), ValueError)
+        self.assertLessEqual(max(sizes), 8)
+        self.assertLess(len(sizes), 20)
+        batcher.close()
+
+    def test_micro_batcher_solo(self):
+        """ Vérifie qu'une requête seule forme son propre lot, traité dans le contexte de l'appelant. """
+        sizes, seen = [], []
+        variable = contextvars.ContextVar("variable", default=None)
+
+        def process(items):
+            time.sleep(0.05)
+            sizes.append(len(items))
+            seen.append(variable.get())
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=8, max_wait=0.02)
+        variable.set("profil")
+        futures = [batcher.submit(i, solo=i == 2) for i in range(5)]
+        self.assertEqual([future.result() for future in futures], list(range(5)))
+        self.assertIn("profil", seen)
+        self.assertEqual(sizes[seen.index("profil")], 1)
+        self.assertEqual(sum(sizes), 5)
+        batcher.close()
+
+    def test_micro_batcher_missing_results(self):
+        """ Vérifie qu'un lot qui renvoie moins de résultats que de requêtes fait échouer chacune, sans blocage. """
+        batcher = MicroBatcher(lambda items: items[:1], max_batch_size=8, max_wait=0.05)
+        futures = [batcher.submit(i) for i in range(3)]
+        for future in futures:
+            self.assertIsInstance(future.exception(timeout=5), RuntimeError)
+        batcher.close()
+
+    def test_request_timeout(self):
+        """ Vérifie qu'une recherche sans résultat dans le délai imparti reçoit une erreur 504. """
+        self.backends["text"].batch_cost = 0.5
+        with patch("src.service.REQUEST_TIMEOUT", 0.1):
+            response = requests.post(f"{self.base_url}/search/text", json={"query": "chat"})
+        self.assertEqual(response.status_code, 504)
+
+    def test_search_by_dataset(self):
+        """ Vérifie qu'une recherche est lancée par dataset, au k le plus grand, et que chaque requête est tronquée. """
+        calls = []
+
+        def search(dataset, vectors, k):
+            calls.append((dataset, len(vectors), k))
+            return [list(range(k)) for _ in vectors]
+
+        queries = [("a", "open-images", 2), ("b", "tiny-imagenet", 5), ("c", "open-images", 4)]
+        results = search_by_dataset(queries, np.zeros((3, 1)), search)
+        self.assertEqual(results, [[0, 1], [0, 1, 2, 3, 4], [0, 1, 2, 3]])
+        self.assertEqual(sorted(calls), [("open-images", 2, 4), ("tiny-imagenet", 1, 5)])
+
+    def test_http(self):
+        """ Vérifie les routes de recherche, de santé et les erreurs. """
+        results = self.client.search_image(b"abc", "tiny-imagenet", k=3)
+        self.assertEqual([result["id"] for result in results], [3, 4, 5])
+        self.assertEqual(results[0]["path"], "tiny-imagenet/3")
+        self.assertEqual([result["id"] for result in self.client.search_text("chat", "open-images", k=2)], [4, 5])
+
+        self.assertEqual(requests.post(f"{self.base_url}/search/image", params={"dataset": "inconnu"},
+                                       data=b"abc").status_code, 400)
+        self.assertEqual(requests.post(f"{self.base_url}/search/image", data=b"").status_code, 400)
+        self.assertEqual(requests.post(f"{self.base_url}/search/text", data=b"{").status_code, 400)
+        self.assertEqual(requests.post(f"{self.base_url}/search/text", json=["chat"]).status_code, 400)
+        self.assertEqual(requests.post(f"{self.base_url}/search/text", json={"query": "chat", "k": None}).status_code,
+                         400)
+        self.assertEqual(requests.post(f"{self.base_url}/search/audio", data=b"abc").status_code, 404)
+        for length in ("abc", "-1"):  # Réponse immédiate, sans attendre la fermeture de la connexion
+            connection = http.client.HTTPConnection("127.0.0.1", self.server.server_port, timeout=5)
+            connection.putrequest("POST", "/search/image")
+            connection.putheader("Content-Length", length)
+            connection.endheaders(b"abc")
+            self.assertEqual(connection.getresponse().status, 400)
+            connection.close()
+        health = requests.get(f"{self.base_url}/health").json()
+        self.assertEqual(health["batches"]["image"]["items"], 1)
+
+    def test_metrics(self):
+        """ Vérifie que les requêtes et la taille des lots sont exportées par la route /metrics. """
+        metrics.enable()
+        metrics.registry.reset()
+        try:
+            self.client.search_text("chat", "open-images", k=2)
+            self.assertEqual(requests.post(f"{self.base_url}/search/image", data=b"").status_code, 400)
+            text = requests.get(f"{self.base_url}/metrics").text
+        finally:
+            metrics.disable()
+            metrics.registry.reset()
+        self.assertIn('pixmatcher_requests_total{request="service-text"} 1', text)
+        self.assertIn('pixmatcher_errors_total{stage="prepare"} 1', text)
+        self.assertIn('pixmatcher_batch_size_count{stage="batcher-text"} 1', text)
+        self.assertIn('pixmatcher_stage_seconds_count{stage="batch_wait"} 1', text)
+
+    def test_concurrent_throughput(self):
+        """ Vérifie que 16 requêtes concurrentes partagent quelques lots, et se terminent bien plus vite que 16
+        passes successives. """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(lambda i: self.client.search_text("x" * (i + 1), "open-images", k=1),
+                                    range(16)))
+        elapsed = time.perf_counter() - start
+        self.assertEqual([result[0]["id"] for result in results], list(range(1, 17)))
+        self.assertEqual(sum(self.backends["text"].batch_sizes), 16)
+        self.assertLess(len(self.backends["text"].batch_sizes), 8)
+        self.assertLess(elapsed, 16 * FakeBackend.batch_cost / 2)